@@ -79,10 +79,12 @@ CREATE INDEX IF NOT EXISTS ix_knowledge_base_file_name
     ON public."knowledge_base_file" USING btree
     (name COLLATE pg_catalog."default" ASC NULLS LAST)
     TABLESPACE pg_default;
-CREATE UNIQUE INDEX IF NOT EXISTS ix_knowledge_base_file_file_hash
+-- 只对可用文件(status = 1)去重，已删除的文件可以重新上传
+CREATE UNIQUE INDEX IF NOT EXISTS ix_knowledge_base_file_file_hash_live
     ON public.knowledge_base_file USING btree
     (file_hash COLLATE pg_catalog."default" ASC NULLS LAST)
-    TABLESPACE pg_default;
+    TABLESPACE pg_default
+    WHERE status = 1;
 
 -- Table: public.knowledge_base_permission
 CREATE TABLE IF NOT EXISTS public."knowledge_base_permission"
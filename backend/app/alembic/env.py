@@ -19,6 +19,10 @@ fileConfig(config.config_file_name)
 # target_metadata = None
 
 from app.models.user import SQLModel  # noqa
+from app.models import ingestion_job  # noqa
+from app.models import upload_session  # noqa
+from app.models import knowledge_base_chunk  # noqa
+from app.models import admission_bucket  # noqa
 from app.core.config import settings # noqa
 
 target_metadata = SQLModel.metadata
@@ -0,0 +1,48 @@
+"""Add ingestion_job table
+
+Revision ID: 2b2ff4e996c5
+Revises: 1a31ce608336
+Create Date: 2026-10-17 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '2b2ff4e996c5'
+down_revision = '1a31ce608336'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingestion_job',
+        sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+        sa.Column('stage', sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+        sa.Column('progress', sa.Integer(), nullable=False),
+        sa.Column('total_chunks', sa.Integer(), nullable=True),
+        sa.Column('processed_chunks', sa.Integer(), nullable=False),
+        sa.Column('error', sqlmodel.sql.sqltypes.AutoString(length=1024), nullable=True),
+        sa.Column('knowledge_base_id', sa.Uuid(), nullable=False),
+        sa.Column('doc_id', sa.Uuid(), nullable=False),
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('created_by', sa.Uuid(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=False), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=False), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=False), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=False), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ingestion_job_doc_id'), 'ingestion_job', ['doc_id'], unique=False)
+    op.create_index('ix_ingestion_job_status_created_at', 'ingestion_job', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ingestion_job_status_created_at', table_name='ingestion_job')
+    op.drop_index(op.f('ix_ingestion_job_doc_id'), table_name='ingestion_job')
+    op.drop_table('ingestion_job')
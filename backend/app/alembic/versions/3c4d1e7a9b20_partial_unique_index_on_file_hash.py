@@ -0,0 +1,37 @@
+"""Partial unique index on knowledge_base_file.file_hash
+
+Revision ID: 3c4d1e7a9b20
+Revises: 2b2ff4e996c5
+Create Date: 2026-10-17 14:03:52.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c4d1e7a9b20'
+down_revision = '2b2ff4e996c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # knowledge_base_file 由 db.sql 创建，表不存在时跳过
+    if not sa.inspect(op.get_bind()).has_table('knowledge_base_file'):
+        return
+    op.execute('DROP INDEX IF EXISTS ix_knowledge_base_file_file_hash')
+    op.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_knowledge_base_file_file_hash_live '
+        'ON knowledge_base_file (file_hash) WHERE status = 1'
+    )
+
+
+def downgrade():
+    if not sa.inspect(op.get_bind()).has_table('knowledge_base_file'):
+        return
+    op.execute('DROP INDEX IF EXISTS ix_knowledge_base_file_file_hash_live')
+    op.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_knowledge_base_file_file_hash '
+        'ON knowledge_base_file (file_hash)'
+    )
@@ -0,0 +1,41 @@
+"""Add upload_session table
+
+Revision ID: 4e8b2f6c1d37
+Revises: 3c4d1e7a9b20
+Create Date: 2026-10-17 15:21:07.553104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b2f6c1d37'
+down_revision = '3c4d1e7a9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'upload_session',
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('file_hash', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('knowledge_base_id', sa.Uuid(), nullable=False),
+        sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+        sa.Column('doc_id', sa.Uuid(), nullable=True),
+        sa.Column('created_by', sa.Uuid(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=False), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=False), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_session_knowledge_base_id'), 'upload_session', ['knowledge_base_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_upload_session_knowledge_base_id'), table_name='upload_session')
+    op.drop_table('upload_session')
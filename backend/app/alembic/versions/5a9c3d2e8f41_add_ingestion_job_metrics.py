@@ -0,0 +1,24 @@
+"""Add ingestion_job.metrics
+
+Revision ID: 5a9c3d2e8f41
+Revises: 4e8b2f6c1d37
+Create Date: 2026-10-17 16:40:12.907215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9c3d2e8f41'
+down_revision = '4e8b2f6c1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ingestion_job', sa.Column('metrics', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('ingestion_job', 'metrics')
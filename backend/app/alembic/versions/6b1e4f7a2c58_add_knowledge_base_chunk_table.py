@@ -0,0 +1,41 @@
+"""Add knowledge_base_chunk table
+
+Revision ID: 6b1e4f7a2c58
+Revises: 5a9c3d2e8f41
+Create Date: 2026-10-17 18:05:44.261390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '6b1e4f7a2c58'
+down_revision = '5a9c3d2e8f41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'knowledge_base_chunk',
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('content_hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+        sa.Column('char_length', sa.Integer(), nullable=False),
+        sa.Column('doc_id', sa.Uuid(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('knowledge_base_id', sa.Uuid(), nullable=False),
+        sa.Column('point_id', sa.Uuid(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=False), nullable=True),
+        sa.PrimaryKeyConstraint('doc_id', 'chunk_index')
+    )
+    op.create_index(op.f('ix_knowledge_base_chunk_point_id'), 'knowledge_base_chunk', ['point_id'], unique=False)
+    op.create_index('ix_knowledge_base_chunk_kb_doc_chunk', 'knowledge_base_chunk',
+                    ['knowledge_base_id', 'doc_id', 'chunk_index'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_knowledge_base_chunk_kb_doc_chunk', table_name='knowledge_base_chunk')
+    op.drop_index(op.f('ix_knowledge_base_chunk_point_id'), table_name='knowledge_base_chunk')
+    op.drop_table('knowledge_base_chunk')
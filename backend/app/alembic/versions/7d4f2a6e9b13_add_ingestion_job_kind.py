@@ -0,0 +1,30 @@
+"""Add ingestion_job.kind for purge jobs
+
+Revision ID: 7d4f2a6e9b13
+Revises: 6b1e4f7a2c58
+Create Date: 2026-10-17 21:05:37.214590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '7d4f2a6e9b13'
+down_revision = '6b1e4f7a2c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ingestion_job', sa.Column('kind', sqlmodel.sql.sqltypes.AutoString(length=20),
+                                             nullable=False, server_default='ingest'))
+    # purge_kb 任务没有 doc_id
+    op.alter_column('ingestion_job', 'doc_id', existing_type=sa.Uuid(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM ingestion_job WHERE doc_id IS NULL")
+    op.alter_column('ingestion_job', 'doc_id', existing_type=sa.Uuid(), nullable=False)
+    op.drop_column('ingestion_job', 'kind')
@@ -0,0 +1,31 @@
+"""Add admission_bucket table for cross-process rate limits
+
+Revision ID: 8f3a6c1e5d72
+Revises: 7d4f2a6e9b13
+Create Date: 2026-10-18 10:12:44.381207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a6c1e5d72'
+down_revision = '7d4f2a6e9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'admission_bucket',
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=50), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('refilled_at', sa.DateTime(timezone=False), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('admission_bucket')
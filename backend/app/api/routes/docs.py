@@ -1,20 +1,36 @@
+import math
 import os
+import re
+import time
 import uuid
-import hashlib
-from typing import List
+import tarfile
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import col, delete, func, select
 
-from pydantic import BaseModel
-from app.storage.local_storage import LocalStorage, get_local_storage
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+from pydantic import BaseModel, Field
+from app.core.clients import clients
+from app.core.config import settings
+from app.storage.local_storage import (
+    FileTooLargeError,
+    LocalStorage,
+    UploadInProgressError,
+    UploadOffsetMismatchError,
+    get_local_storage,
+)
 from app.api.deps import (
     CurrentUser,
     SessionDep,
     get_current_active_superuser,
+    get_current_user,
 )
 from app.models.knowledge_base_file import (
     KnowledgeBaseFile,
@@ -24,152 +40,431 @@ from app.models.knowledge_base_file import (
     KnowledgeBaseFilesPublic,
     AskQuestion,
 )
-from app.service.qdrant_util import QdrantVectorStore
+from app.models.ingestion_job import IngestionJob, IngestionJobPublic
+from app.models.knowledge_base_chunk import KnowledgeBaseChunk, KnowledgeBaseChunksPublic
+from app.models.upload_session import UploadSession, UploadSessionCreate, UploadSessionPublic
 from app.models.user import (
     User,
     UserPublic,
     UsersPublic,
 )
-from langchain_community.embeddings import ZhipuAIEmbeddings
+from app.service import ingestion_service, purge_service
+from app.service.admission_util import GovernorBusyError, embedding_governor, llm_governor
+from app.service.metrics_util import summarize_jobs
 from langchain_community.chat_models import ChatZhipuAI
-from qdrant_client import QdrantClient
 
 
 router = APIRouter(tags=["docs"])
 
 
-client = QdrantClient(url="http://qdrant:6333", api_key=os.getenv("QDRANT_API_KEY", "test_env"))
-vector_store = QdrantVectorStore(client, collection_name="knowledge_documents")
-
-
-# ========= 工具函数 =========
-embeddings = ZhipuAIEmbeddings(
-    model="embedding-3",
-    api_key=os.getenv("ZHIPUAI_API_KEY"),
-    dimensions=1024
-)
-
-
-def chunk_text(text: str, max_len: int = 500) -> List[str]:
-    """
-    CharacterTextSplitter
-    基于字符数进行切割。
-    RecursiveCharacterTextSplitter
-    基于文本结构进行切割，尝试保持段落等较大单元的完整性。
-    MarkdownTextSplitter
-    基于 Markdown 标题进行切割。
-    HTMLTextSplitter
-    基于 HTML 标签进行切割。
-    RecursiveJSONTextSplitter
-    基于 JSON 结构进行切割。
-    CodeTextSplitter
-    基于代码结构进行切割。
-    """
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_len, chunk_overlap=100)
-    texts = text_splitter.split_text(text)
-    return texts
-
-
-def extract_text_from_file(file_path: str, filename: str) -> str:
-    """根据文件类型解析文本"""
-
-    """
-    加载器:CSV、文件目录、HTML、JSON、Markdown 及 PDF等。
-    """
-    ext = os.path.splitext(filename)[1].lower()
-    if ext == ".pdf":
-        loader = PyPDFLoader(file_path)
-        docs = loader.load()
-        text = "\n".join([page.page_content or "" for page in docs])
-    elif ext in [".md", ".txt"]:
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
-    else:
-        raise HTTPException(status_code=400, detail="不支持的文件类型")
-    return text
-
-
 # ========= 路由 =========
 class UploadResponse(BaseModel):
     doc_id: uuid.UUID
+    job_id: uuid.UUID
     name: str
     status: str
 
 
-def get_file_path_hash(file_path: str) -> str:
-    """获取文件的hash值"""
-    with open(file_path, "rb") as f:
-        file_hash = hashlib.md5(f.read()).hexdigest()
-    return file_hash
-
-
-def get_file_bytes_hash(file_bytes: bytes) -> str:
-    """获取文件的hash值"""
-    file_hash = hashlib.md5(file_bytes).hexdigest()
-    return file_hash
-
-
-@router.post("/kb/{kb_id}/docs/upload", response_model=UploadResponse)
+@router.post("/kb/{kb_id}/docs/upload", response_model=UploadResponse, status_code=202)
 async def upload_doc(*, session: SessionDep,
                      kb_id: uuid.UUID,
                      file: UploadFile = File(...),
                      current_user: CurrentUser,
                      storage: LocalStorage = Depends(get_local_storage)):
-    # 1. 保存文件
-    # 异步读取全部 bytes
-    contents = await file.read()
-    # 获取文件hash值，判断是否存储过
-    file_hash = get_file_bytes_hash(contents)
-    knowledge_base_file_statement = select(KnowledgeBaseFile)\
-        .where(KnowledgeBaseFile.status == 1, KnowledgeBaseFile.file_hash == file_hash).select_from(KnowledgeBaseFile)
-    knowledge_base_file_results = session.exec(knowledge_base_file_statement).all()
-    if knowledge_base_file_results and len(knowledge_base_file_results) > 0:
+    """上传文件：这里只做保存和去重，解析与向量化由 worker 异步完成"""
+    if not ingestion_service.is_supported_file(file.filename):
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    if file.size is not None and file.size > settings.UPLOAD_MAX_SIZE_BYTES:
+        raise HTTPException(status_code=413, detail="文件大小超过限制")
+    # 1. 流式保存文件：分块写入临时文件，同时增量计算 hash
+    save_started = time.perf_counter()
+    try:
+        tmp_path, size, file_hash = await storage.save_upload_stream(
+            file.filename, file,
+            max_size=settings.UPLOAD_MAX_SIZE_BYTES,
+            chunk_size=settings.UPLOAD_CHUNK_SIZE
+        )
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await _register_upload(
+        session=session, storage=storage, kb_id=kb_id, name=file.filename,
+        tmp_path=tmp_path, size=size, file_hash=file_hash, user_id=current_user.id,
+        save_seconds=time.perf_counter() - save_started
+    )
+
+
+async def _register_upload(*, session: SessionDep, storage: LocalStorage, kb_id: uuid.UUID, name: str,
+                           tmp_path: str, size: int, file_hash: str, user_id: uuid.UUID,
+                           upload_session: Optional[UploadSession] = None,
+                           save_seconds: Optional[float] = None) -> UploadResponse:
+    """
+    文件已完整写入临时文件：去重，存入文件表、创建入库任务，再把临时文件移动到该文档独立的路径
+    先 flush（hash 唯一索引在移动文件前检查），移动完成后才提交，worker 领取任务时文件一定已就位
+    """
+    # 根据文件hash值，判断是否存储过
+    if ingestion_service.find_live_files_by_hash(session=session, hashes=[file_hash]):
+        await storage.discard(tmp_path)
         raise HTTPException(status_code=400, detail="文件已存在")
+    # 同一知识库下的同名文件视为新版本，沿用 doc_id
+    knowledge_base_file = ingestion_service.get_live_file_by_name(session=session, kb_id=kb_id, name=name)
+    if knowledge_base_file and ingestion_service.has_active_job(session=session, doc_id=knowledge_base_file.id):
+        await storage.discard(tmp_path)
+        raise HTTPException(status_code=409, detail="文档正在处理中")
+    previous_storage = knowledge_base_file.storage if knowledge_base_file else None
+    doc_id = knowledge_base_file.id if knowledge_base_file else uuid.uuid4()
+    file_path = storage.doc_path(doc_id, file_hash, name)
+    # 2. 存入文件表，并创建入库任务
+    knowledge_base_file, job = ingestion_service.register_file(
+        session=session, kb_id=kb_id, knowledge_base_file=knowledge_base_file,
+        name=name, file_path=file_path, size=size, file_hash=file_hash, user_id=user_id,
+        save_seconds=save_seconds, doc_id=doc_id
+    )
+    if upload_session is not None:
+        upload_session.status = "completed"
+        upload_session.doc_id = knowledge_base_file.id
+        upload_session.updated_at = datetime.utcnow()
+        session.add(upload_session)
     try:
-        file_path = await storage.save_upload_file(file.filename, contents)
+        session.flush()
+    except IntegrityError:
+        # 并发上传同一文件时由 hash 唯一索引兜底
+        session.rollback()
+        await storage.discard(tmp_path)
+        raise HTTPException(status_code=400, detail="文件已存在")
+    try:
+        storage.commit_upload(tmp_path, file_path)
         print("message: File uploaded successfully, path:" + file_path)
     except Exception as e:
+        session.rollback()
+        await storage.discard(tmp_path)
         raise HTTPException(status_code=500, detail=str(e))
     try:
-        # 2. 提取文本
-        text = extract_text_from_file(file_path, file.filename)
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="文件内容为空")
-        # 3. 切分文本
-        chunks = chunk_text(text, max_len=500)
-        # 4. 存入文件表
-        file_path = "local:" + file_path
-        knowledge_base_file = KnowledgeBaseFile(name=file.filename,
-                                                extension=file.filename.split(".")[-1],
-                                                size=file.size,
-                                                storage=file_path,
-                                                knowledge_base_id=kb_id,
-                                                status=1,
-                                                file_hash=file_hash,
-                                                created_by=current_user.id,
-                                                updated_by=current_user.id
-                                                )
-        session.add(knowledge_base_file)
         session.commit()
-        session.refresh(knowledge_base_file)
-        # 4. 存入向量数据库
-        doc_id = knowledge_base_file.id
-        """向量化文档并存储到 Qdrant"""
-        try:
-            embedding = embeddings.embed_documents(chunks)
-            # 插入文档
-            count = vector_store.insert_document(
-                kb_id=kb_id,
-                doc_id=doc_id,
-                text_chunks=chunks,
-                embeddings=embedding  # 这里替换成你的 embed_documents 结果
+    except Exception as e:
+        session.rollback()
+        storage.remove_path(file_path)
+        if isinstance(e, IntegrityError):
+            raise HTTPException(status_code=400, detail="文件已存在")
+        raise HTTPException(status_code=500, detail=str(e))
+    # 新版本使用新的路径，删除旧版本的文件
+    purge_service.remove_unreferenced_files(session, storage, [previous_storage])
+    session.refresh(job)
+    return UploadResponse(doc_id=knowledge_base_file.id, job_id=job.id, name=name, status=job.status)
+
+
+# ========= 断点续传 =========
+# 1. POST /kb/{kb_id}/uploads 创建上传会话
+# 2. PUT /uploads/{upload_id} 按 Content-Range 追加字节，中断后 GET /uploads/{upload_id} 查询 offset 继续
+# 3. POST /uploads/{upload_id}/complete 校验并进入入库流程
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def _upload_session_public(upload_session: UploadSession, storage: LocalStorage) -> UploadSessionPublic:
+    offset = storage.part_size(str(upload_session.id)) if upload_session.status == "open" else upload_session.size
+    return UploadSessionPublic(**upload_session.model_dump(), offset=offset)
+
+
+def _get_open_upload_session(session: SessionDep, upload_id: uuid.UUID, current_user: CurrentUser) -> UploadSession:
+    upload_session = session.get(UploadSession, upload_id)
+    if not upload_session or upload_session.created_by != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if upload_session.status != "open":
+        raise HTTPException(status_code=409, detail=f"上传会话已{'完成' if upload_session.status == 'completed' else '取消'}")
+    return upload_session
+
+
+@router.post("/kb/{kb_id}/uploads", response_model=UploadSessionPublic, status_code=201)
+async def create_upload_session(*, session: SessionDep,
+                                kb_id: uuid.UUID,
+                                body: UploadSessionCreate,
+                                current_user: CurrentUser,
+                                storage: LocalStorage = Depends(get_local_storage)):
+    """创建断点续传会话"""
+    if not ingestion_service.is_supported_file(body.name):
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    if body.size > settings.RESUMABLE_UPLOAD_MAX_SIZE_BYTES:
+        raise HTTPException(status_code=413, detail="文件大小超过限制")
+    # 客户端提供了 hash 时提前去重，避免白传
+    if body.file_hash and ingestion_service.find_live_files_by_hash(session=session, hashes=[body.file_hash]):
+        raise HTTPException(status_code=400, detail="文件已存在")
+    upload_session = UploadSession.model_validate(
+        body, update={"knowledge_base_id": kb_id, "created_by": current_user.id}
+    )
+    session.add(upload_session)
+    session.commit()
+    session.refresh(upload_session)
+    return _upload_session_public(upload_session, storage)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionPublic)
+async def get_upload_session(*, session: SessionDep,
+                             upload_id: uuid.UUID,
+                             current_user: CurrentUser,
+                             storage: LocalStorage = Depends(get_local_storage)):
+    """查询上传会话，offset 为服务端已接收的字节数"""
+    upload_session = session.get(UploadSession, upload_id)
+    if not upload_session or upload_session.created_by != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return _upload_session_public(upload_session, storage)
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionPublic)
+async def upload_part(*, session: SessionDep,
+                      upload_id: uuid.UUID,
+                      request: Request,
+                      current_user: CurrentUser,
+                      storage: LocalStorage = Depends(get_local_storage)):
+    """
+    上传一段字节：请求头 Content-Range: bytes {start}-{end}/{total}，请求体为原始字节
+     - start 必须等于当前 offset，否则返回 409（响应头 Upload-Offset 为当前 offset）
+     - 请求体直接追加写入磁盘上的分片文件，md5 增量计算
+    """
+    upload_session = _get_open_upload_session(session, upload_id, current_user)
+    match = _CONTENT_RANGE_RE.match(request.headers.get("content-range", ""))
+    if not match:
+        raise HTTPException(status_code=400, detail="缺少或无效的 Content-Range")
+    start, end, total = int(match.group(1)), int(match.group(2)), match.group(3)
+    if end < start or end >= upload_session.size or (total != "*" and int(total) != upload_session.size):
+        raise HTTPException(status_code=416, detail="Content-Range 超出文件大小")
+    if end - start + 1 > settings.RESUMABLE_UPLOAD_MAX_PART_BYTES:
+        raise HTTPException(status_code=413, detail="分片大小超过限制")
+    try:
+        offset = await storage.append_part(
+            str(upload_id), start, request.stream(), max_size=min(end + 1, upload_session.size)
+        )
+    except UploadOffsetMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+    except UploadInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="请求体超出 Content-Range 范围")
+    except ClientDisconnect:
+        # 已写入的字节保留，客户端重连后从 offset 继续
+        offset = storage.part_size(str(upload_id))
+        print(f"message: 上传会话 {upload_id} 连接中断, offset: {offset}")
+        raise
+    upload_session.updated_at = datetime.utcnow()
+    session.add(upload_session)
+    session.commit()
+    return UploadSessionPublic(**upload_session.model_dump(), offset=offset)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadResponse, status_code=202)
+async def complete_upload(*, session: SessionDep,
+                          upload_id: uuid.UUID,
+                          current_user: CurrentUser,
+                          storage: LocalStorage = Depends(get_local_storage)):
+    """所有字节上传完成后调用：校验大小和 hash，之后与普通上传一样进入入库流程"""
+    upload_session = _get_open_upload_session(session, upload_id, current_user)
+    part_path, size, file_hash = storage.finish_part(str(upload_id))
+    if size != upload_session.size:
+        raise HTTPException(status_code=409, detail=f"文件未上传完整，已接收 {size} bytes",
+                            headers={"Upload-Offset": str(size)})
+    if upload_session.file_hash and upload_session.file_hash != file_hash:
+        # 内容与声明不一致，只能重新上传
+        await storage.discard_part(str(upload_id))
+        raise HTTPException(status_code=400, detail="文件 hash 校验失败")
+    return await _register_upload(
+        session=session, storage=storage, kb_id=upload_session.knowledge_base_id, name=upload_session.name,
+        tmp_path=part_path, size=size, file_hash=file_hash, user_id=current_user.id,
+        upload_session=upload_session
+    )
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(*, session: SessionDep,
+                       upload_id: uuid.UUID,
+                       current_user: CurrentUser,
+                       storage: LocalStorage = Depends(get_local_storage)):
+    """取消上传会话并删除已上传的字节"""
+    upload_session = _get_open_upload_session(session, upload_id, current_user)
+    await storage.discard_part(str(upload_id))
+    upload_session.status = "aborted"
+    upload_session.updated_at = datetime.utcnow()
+    session.add(upload_session)
+    session.commit()
+    return {"message": "Upload aborted"}
+
+
+class BulkUploadItem(BaseModel):
+    name: str
+    # queued:已创建入库任务 duplicate:文件已存在 skipped:不支持的文件类型 error:失败
+    status: str
+    doc_id: Optional[uuid.UUID] = None
+    job_id: Optional[uuid.UUID] = None
+    detail: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    data: List[BulkUploadItem]
+    count: int
+    queued: int
+
+
+def _stage_bulk_files(files: List[UploadFile], storage: LocalStorage) -> List[Dict[str, Any]]:
+    """把上传的文件（含压缩包中的文件）逐个流式写入临时文件并计算 hash，在线程池中执行"""
+    staged: List[Dict[str, Any]] = []
+
+    def stage(name: str, fileobj) -> None:
+        if len(staged) >= settings.BULK_UPLOAD_MAX_FILES:
+            staged.append({"name": name, "status": "error", "detail": "超过单次上传文件数上限"})
+        elif not ingestion_service.is_supported_file(name):
+            staged.append({"name": name, "status": "skipped", "detail": "不支持的文件类型"})
+        else:
+            try:
+                save_started = time.perf_counter()
+                tmp_path, size, file_hash = storage.save_fileobj(
+                    name, fileobj,
+                    max_size=settings.UPLOAD_MAX_SIZE_BYTES,
+                    chunk_size=settings.UPLOAD_CHUNK_SIZE
+                )
+                staged.append({"name": name, "tmp_path": tmp_path, "size": size, "file_hash": file_hash,
+                               "save_seconds": time.perf_counter() - save_started})
+            except FileTooLargeError as e:
+                staged.append({"name": name, "status": "error", "detail": str(e)})
+
+    for upload in files:
+        if ingestion_service.is_archive(upload.filename):
+            try:
+                for name, member in ingestion_service.iter_archive_members(upload.file, upload.filename):
+                    stage(name, member)
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                staged.append({"name": upload.filename, "status": "error", "detail": f"压缩包无法解析: {e}"})
+        else:
+            stage(upload.filename, upload.file)
+    return staged
+
+
+@router.post("/kb/{kb_id}/docs/bulk-upload", response_model=BulkUploadResponse, status_code=202)
+async def bulk_upload_docs(*, session: SessionDep,
+                           kb_id: uuid.UUID,
+                           files: List[UploadFile] = File(...),
+                           current_user: CurrentUser,
+                           storage: LocalStorage = Depends(get_local_storage)):
+    """
+    批量上传：支持多个文件或 zip/tar 压缩包
+     - 文件逐个流式写盘并计算 hash，去重合并为一次 IN (...) 查询
+     - 每个文件创建一个入库任务，由 worker 并行处理，返回每个文件的结果
+    """
+    staged = await run_in_threadpool(_stage_bulk_files, files, storage)
+    candidates = [item for item in staged if "tmp_path" in item]
+    try:
+        # 批量查询：已存在的 hash、同名文件（新版本）、处理中的文档
+        existing_hashes = set(ingestion_service.find_live_files_by_hash(
+            session=session, hashes=[item["file_hash"] for item in candidates]
+        ))
+        names = {item["name"] for item in candidates}
+        versions: Dict[str, KnowledgeBaseFile] = {}
+        if names:
+            versions = {f.name: f for f in session.exec(
+                select(KnowledgeBaseFile)
+                .where(KnowledgeBaseFile.status == 1, KnowledgeBaseFile.knowledge_base_id == kb_id,
+                       col(KnowledgeBaseFile.name).in_(names))
+            ).all()}
+        busy_doc_ids = set()
+        if versions:
+            busy_doc_ids = set(session.exec(
+                select(IngestionJob.doc_id)
+                .where(col(IngestionJob.doc_id).in_([f.id for f in versions.values()]),
+                       col(IngestionJob.status).in_(["pending", "running"]))
+            ).all())
+
+        results: List[BulkUploadItem] = []
+        previous_storage: List[str] = []
+        seen_hashes = set()
+        seen_names = set()
+        for item in staged:
+            if "tmp_path" not in item:
+                results.append(BulkUploadItem(**item))
+                continue
+            name = item["name"]
+            version = versions.get(name)
+            rejected = None
+            if item["file_hash"] in existing_hashes or item["file_hash"] in seen_hashes:
+                rejected = BulkUploadItem(name=name, status="duplicate", detail="文件已存在")
+            elif name in seen_names:
+                rejected = BulkUploadItem(name=name, status="error", detail="文件名重复")
+            elif version and version.id in busy_doc_ids:
+                rejected = BulkUploadItem(name=name, status="error", detail="文档正在处理中")
+            if rejected:
+                await storage.discard(item.pop("tmp_path"))
+                results.append(rejected)
+                continue
+            seen_hashes.add(item["file_hash"])
+            seen_names.add(name)
+            doc_id = version.id if version else uuid.uuid4()
+            item["file_path"] = storage.doc_path(doc_id, item["file_hash"], name)
+            if version:
+                previous_storage.append(version.storage)
+            knowledge_base_file, job = ingestion_service.register_file(
+                session=session, kb_id=kb_id, knowledge_base_file=version,
+                name=name, file_path=item["file_path"], size=item["size"], file_hash=item["file_hash"],
+                user_id=current_user.id, save_seconds=item["save_seconds"], doc_id=doc_id
             )
-            print(f"message: 文档 {doc_id} 向量化成功, 共计向量化 {count} 条数据")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"向量化失败: {str(e)}")
-        return UploadResponse(doc_id=doc_id, name=file.filename, status="ready")
+            results.append(BulkUploadItem(name=name, status="queued", doc_id=knowledge_base_file.id, job_id=job.id))
+        # 与单文件上传一样：先 flush 检查唯一索引，文件全部就位后再提交
+        session.flush()
+        for item in candidates:
+            if "file_path" in item:
+                # 移动成功后才去掉 tmp_path，移动失败的临时文件由下面的异常处理删除
+                storage.commit_upload(item["tmp_path"], item["file_path"])
+                del item["tmp_path"]
+        session.commit()
     except Exception as e:
+        session.rollback()
+        for item in candidates:
+            if "tmp_path" in item:
+                await storage.discard(item["tmp_path"])
+            elif "file_path" in item:
+                storage.remove_path(item["file_path"])
+        if isinstance(e, IntegrityError):
+            raise HTTPException(status_code=400, detail="文件已存在")
         raise HTTPException(status_code=500, detail=str(e))
+    purge_service.remove_unreferenced_files(session, storage, previous_storage)
+    queued = sum(1 for result in results if result.status == "queued")
+    print(f"message: 批量上传 {len(results)} 个文件, 创建入库任务 {queued} 个")
+    return BulkUploadResponse(data=results, count=len(results), queued=queued)
+
+
+class HashProbeRequest(BaseModel):
+    hashes: List[str] = Field(min_length=1, max_length=1000)
+
+
+class HashProbeItem(BaseModel):
+    file_hash: str
+    doc_id: uuid.UUID
+    knowledge_base_id: uuid.UUID
+    name: str
+
+
+class HashProbeResponse(BaseModel):
+    # 服务端已有的文件
+    existing: List[HashProbeItem]
+    # 需要上传的 hash
+    missing: List[str]
+
+
+@router.post("/docs/exists", response_model=HashProbeResponse, dependencies=[Depends(get_current_user)])
+async def probe_file_hashes(*, session: SessionDep, body: HashProbeRequest):
+    """上传前预检：客户端提交文件 md5（可批量），返回服务端已存在的文件，已存在的无需再上传"""
+    live_files = ingestion_service.find_live_files_by_hash(session=session, hashes=body.hashes)
+    existing = [
+        HashProbeItem(file_hash=file_hash, doc_id=f.id, knowledge_base_id=f.knowledge_base_id, name=f.name)
+        for file_hash, f in live_files.items()
+    ]
+    missing = list(dict.fromkeys(h for h in body.hashes if h not in live_files))
+    return HashProbeResponse(existing=existing, missing=missing)
+
+
+@router.get("/docs/jobs/{job_id}", response_model=IngestionJobPublic)
+async def get_ingestion_job(*, session: SessionDep, job_id: uuid.UUID, current_user: CurrentUser):
+    """查询入库任务的状态、阶段和进度（只能查询自己创建的任务，超级管理员除外）"""
+    job = session.get(IngestionJob, job_id)
+    if not job or (job.created_by != current_user.id and not current_user.is_superuser):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @router.get("/docs/download/{doc_id}")
@@ -183,10 +478,15 @@ async def download_file(
         .where(KnowledgeBaseFile.status == 1, KnowledgeBaseFile.id == doc_id).select_from(KnowledgeBaseFile)
     knowledge_base_file = session.exec(knowledge_base_file_statement).one_or_none()
     """下载文件"""
-    if not knowledge_base_file or storage.exists(knowledge_base_file.name):
+    if not knowledge_base_file or not knowledge_base_file.storage:
         raise HTTPException(status_code=404, detail="File not found")
-
-    return storage.get_streaming_response(knowledge_base_file.name)
+    # 文件按 doc_id 存放，路径取自文件记录
+    path = os.path.relpath(knowledge_base_file.storage.removeprefix("local:"), storage.folder)
+    if not storage.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    response = storage.get_streaming_response(path)
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(knowledge_base_file.name)}"
+    return response
 
 
 @router.get("/kb/{kb_id}/docs", response_model=KnowledgeBaseFilesPublic)
@@ -222,23 +522,47 @@ async def list_files(
     return KnowledgeBaseFilesPublic(data=knowledge_base_files, count=count)
 
 
-@router.delete("/docs/{doc_id}")
+@router.delete("/docs/{doc_id}", status_code=202)
 async def delete_file(
         *, session: SessionDep,
         doc_id: uuid.UUID,
-        storage: LocalStorage = Depends(get_local_storage)
+        current_user: CurrentUser
 ):
+    """删除文件：立即标记为已删除，向量、块与文件内容由 worker 的清理任务删除，进度见 GET /docs/jobs/{job_id}"""
     knowledge_base_file = session.get(KnowledgeBaseFile, doc_id)
-    filename = knowledge_base_file.name
-    """删除文件"""
-    if await storage.delete(filename):
-        # 修改数据库状态
-        session.query(KnowledgeBaseFile).filter(KnowledgeBaseFile.name == filename).update({"status": 0})
-        session.commit()
-        session.refresh(knowledge_base_file)
-        return {"message": "File deleted successfully"}
-    else:
+    if not knowledge_base_file or knowledge_base_file.status != 1:
         raise HTTPException(status_code=404, detail="File not found")
+    knowledge_base_file.status = 0
+    knowledge_base_file.updated_by = current_user.id
+    knowledge_base_file.updated_at = datetime.utcnow()
+    session.add(knowledge_base_file)
+    job = purge_service.create_purge_job(session=session, kind=purge_service.PURGE_DOC,
+                                         kb_id=knowledge_base_file.knowledge_base_id, doc_id=doc_id,
+                                         user_id=current_user.id)
+    session.commit()
+    return {"message": "File deleted successfully", "job_id": job.id}
+
+
+@router.get("/docs/{doc_id}/chunks", response_model=KnowledgeBaseChunksPublic)
+async def list_chunks(
+        *, session: SessionDep,
+        doc_id: uuid.UUID,
+        skip: int = 0, limit: int = 100
+):
+    """查询文档切分后的块（按 chunk_index 排序）"""
+    count_statement = select(func.count())\
+        .where(KnowledgeBaseChunk.doc_id == doc_id)\
+        .select_from(KnowledgeBaseChunk)
+    count = session.exec(count_statement).one()
+    statement = (
+        select(KnowledgeBaseChunk)
+        .where(KnowledgeBaseChunk.doc_id == doc_id)
+        .order_by(KnowledgeBaseChunk.chunk_index)
+        .offset(skip)
+        .limit(limit)
+    )
+    chunks = session.exec(statement).all()
+    return KnowledgeBaseChunksPublic(data=chunks, count=count)
 
 
 @router.get("/docs/{doc_id}/info")
@@ -258,27 +582,75 @@ async def get_file_info(
     }
 
 
+@router.get("/docs/metrics", dependencies=[Depends(get_current_active_superuser)])
+def get_ingestion_metrics(*, session: SessionDep, limit: int = Query(default=500, ge=1, le=10000)):
+    """
+    入库指标：按文件类型汇总最近 limit 个已结束任务的各阶段耗时直方图、计数与吞吐
+    指标随任务记录保存，API 与 worker 不在同一进程也能汇总
+    """
+    statement = (
+        select(IngestionJob.metrics)
+        .where(col(IngestionJob.status).in_(["succeeded", "failed"]), col(IngestionJob.metrics).is_not(None))
+        .order_by(col(IngestionJob.finished_at).desc())
+        .limit(limit)
+    )
+    metrics = [item for item in session.exec(statement).all() if item]
+    return {"jobs": len(metrics), "by_extension": summarize_jobs(metrics)}
+
+
+@router.get("/governor/stats", dependencies=[Depends(get_current_active_superuser)])
+def get_governor_stats():
+    """模型调用准入控制：当前进程的排队深度、并发数、拒绝次数与等待时间直方图"""
+    return {"embedding": embedding_governor.stats(), "llm": llm_governor.stats()}
+
+
+@router.get("/vector-store/info", dependencies=[Depends(get_current_active_superuser)])
+async def get_vector_store_info():
+    """向量库集合信息"""
+    return await clients.async_vector_store.get_collection_info()
+
+
+@router.get("/embeddings/cache/stats", dependencies=[Depends(get_current_active_superuser)])
+def get_embedding_cache_stats():
+    """向量缓存命中统计"""
+    if clients.embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **clients.embedding_cache.stats()}
+
+
 @router.post("/kb/{kb_id}/ask")
 async def ask_question(*,
+                       session: SessionDep,
                        question: AskQuestion,
                        kb_id: uuid.UUID,
                        ):
     """查询接口: RAG pipeline"""
     try:
-        # 1. 对问题生成 embedding
-        query_vec = embeddings.embed_query(question.question)
+        # 1. 对问题生成 embedding（同步调用放到线程池，排队等待准入时不阻塞事件循环）
+        query_vec = await run_in_threadpool(clients.embeddings.embed_query, question.question)
         # 2. 从 Qdrant 检索
-        results = vector_store.search_similar(query_embedding=query_vec, kb_id=kb_id, limit=5)
+        results = await clients.async_vector_store.search_similar(query_embedding=query_vec, kb_id=kb_id, limit=5)
+        if not settings.QDRANT_STORE_TEXT:
+            # payload 中没有文本，按 point id 从块表批量读取
+            results = await run_in_threadpool(ingestion_service.fill_chunk_texts, session=session, results=results)
         llm = ChatZhipuAI(
             model="glm-4",
             temperature=0.5,
         )
         print(f"result: {results}")
         prompt = f"已知内容:\n{results}\n\n问题: {question}\n请基于已知内容回答。"
-        answer = llm.invoke(prompt).content
+
+        def invoke_llm() -> str:
+            with llm_governor.slot():
+                return llm.invoke(prompt).content
+
+        answer = await run_in_threadpool(invoke_llm)
         return {
             "answer": answer
         }
+    except GovernorBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         print(f"message: {str(e)}")
         raise HTTPException(status_code=500, detail="error")
@@ -21,6 +21,7 @@ from app.models.user import (
     UserPublic,
     UsersPublic,
 )
+from app.service import purge_service
 
 
 router = APIRouter(prefix="/kb", tags=["knowledge_base"])
@@ -154,6 +155,8 @@ def delete_knowledge_base(*, session: SessionDep, current_user: CurrentUser, id:
     knowledge_base.updated_by = current_user.id
     knowledge_base.updated_at = datetime.utcnow()
     session.add(knowledge_base)
+    # 文档、向量与块由 worker 分批清理
+    purge_service.create_purge_job(session=session, kind=purge_service.PURGE_KB, kb_id=id, user_id=current_user.id)
     session.commit()
     session.refresh(knowledge_base)
     resp = KnowledgeBasePublic.model_validate(
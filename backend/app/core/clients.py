@@ -0,0 +1,240 @@
+"""
+进程内的外部客户端（Qdrant、向量模型、向量缓存）：首次使用时创建，导入时不做任何网络 I/O
+
+ - uvicorn 多 worker、ingestion worker 等每个进程各自创建连接池；fork 出的子进程丢弃父进程的客户端，
+   使用时重新创建，不与父进程共用连接
+ - API 进程在 lifespan（app.main）中关闭，其他进程退出时调用 clients.close()
+"""
+import os
+import threading
+from collections.abc import Callable
+from typing import Any
+
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+
+from app.core.config import settings
+
+
+def vector_store_options() -> dict[str, Any]:
+    """同步/异步 vector store 共用的配置：检索方式、分区、存储方式与 HNSW 参数"""
+    hnsw_config = None
+    if settings.QDRANT_HNSW_M is not None or settings.QDRANT_HNSW_EF_CONSTRUCT is not None:
+        hnsw_config = models.HnswConfigDiff(m=settings.QDRANT_HNSW_M, ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT)
+    return {
+        "rescore": settings.QDRANT_SEARCH_RESCORE,
+        "partitioning": settings.QDRANT_PARTITIONING,
+        "storage_profile": settings.QDRANT_STORAGE_PROFILE,
+        "hnsw_config": hnsw_config,
+        "hnsw_ef": settings.QDRANT_SEARCH_HNSW_EF,
+        "upsert_batch_size": settings.QDRANT_UPSERT_BATCH_SIZE,
+        "upsert_parallel": settings.QDRANT_UPSERT_PARALLEL,
+        "upsert_retries": settings.QDRANT_UPSERT_MAX_RETRIES,
+        "store_text": settings.QDRANT_STORE_TEXT,
+    }
+
+
+def qdrant_client_options() -> dict[str, Any]:
+    """QdrantClient / AsyncQdrantClient 共用的连接参数：连接池、keep-alive、超时与 gRPC"""
+    return {
+        "url": settings.QDRANT_URL,
+        "api_key": settings.QDRANT_API_KEY,
+        "timeout": settings.QDRANT_TIMEOUT_SECONDS,
+        "prefer_grpc": settings.QDRANT_PREFER_GRPC,
+        "grpc_port": settings.QDRANT_GRPC_PORT,
+        "grpc_options": {
+            "grpc.keepalive_time_ms": settings.QDRANT_GRPC_KEEPALIVE_MS,
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+        "limits": httpx.Limits(
+            max_connections=settings.QDRANT_POOL_SIZE,
+            max_keepalive_connections=settings.QDRANT_POOL_SIZE,
+            keepalive_expiry=settings.QDRANT_KEEPALIVE_SECONDS,
+        ),
+    }
+
+
+def _create_flat_store():
+    from app.service.flat_util import FlatVectorStore
+
+    return FlatVectorStore(
+        settings.FLAT_STORE_PATH or os.path.join(os.environ.get("STORAGE_LOCAL_PATH", "storage"), "vectors"),
+        dtype=settings.FLAT_STORE_DTYPE,
+    )
+
+
+def _create_vector_store(registry: "ClientRegistry"):
+    from app.service.flat_util import RoutedVectorStore
+    from app.service.qdrant_util import QdrantVectorStore
+
+    store = QdrantVectorStore(registry.qdrant_client, collection_name=settings.QDRANT_COLLECTION,
+                              **vector_store_options())
+    if settings.FLAT_STORE_MAX_CHUNKS > 0:
+        store = RoutedVectorStore(store, registry.flat_store, max_flat_chunks=settings.FLAT_STORE_MAX_CHUNKS)
+    return store
+
+
+def _create_async_vector_store(registry: "ClientRegistry"):
+    from app.service.flat_util import AsyncRoutedVectorStore
+    from app.service.qdrant_util import AsyncQdrantVectorStore
+
+    store = AsyncQdrantVectorStore(registry.async_qdrant_client, collection_name=settings.QDRANT_COLLECTION,
+                                   **vector_store_options())
+    if settings.FLAT_STORE_MAX_CHUNKS > 0:
+        store = AsyncRoutedVectorStore(store, registry.flat_store)
+    return store
+
+
+def _create_embedding_cache():
+    from app.service.embedding_util import EmbeddingCache
+
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return EmbeddingCache(
+        settings.EMBEDDING_CACHE_PATH
+        or os.path.join(os.environ.get("STORAGE_LOCAL_PATH", "storage"), "embedding_cache.sqlite3"),
+        max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+    )
+
+
+def _create_zhipuai_client():
+    from zhipuai import ZhipuAI
+
+    return ZhipuAI(
+        api_key=os.getenv("ZHIPUAI_API_KEY"),
+        timeout=settings.EMBEDDING_TIMEOUT_SECONDS,
+        http_client=httpx.Client(
+            timeout=settings.EMBEDDING_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.EMBEDDING_POOL_SIZE,
+                max_keepalive_connections=settings.EMBEDDING_POOL_SIZE,
+                keepalive_expiry=settings.EMBEDDING_KEEPALIVE_SECONDS,
+            ),
+        ),
+    )
+
+
+def _create_embeddings(registry: "ClientRegistry"):
+    from langchain_community.embeddings import ZhipuAIEmbeddings
+
+    from app.service.admission_util import embedding_governor
+    from app.service.embedding_util import CachedEmbeddings, EmbeddingBatcher
+
+    model = ZhipuAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        api_key=os.getenv("ZHIPUAI_API_KEY"),
+        dimensions=settings.EMBEDDING_DIMENSIONS
+    )
+    # 替换默认 client：使用配置的超时与连接池
+    model.client = registry.zhipuai_client
+    embeddings = EmbeddingBatcher(
+        model,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+        governor=embedding_governor,
+    )
+    if registry.embedding_cache is not None:
+        embeddings = CachedEmbeddings(
+            embeddings,
+            cache=registry.embedding_cache,
+            namespace=f"{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSIONS}",
+        )
+    return embeddings
+
+
+class ClientRegistry:
+    """按名称缓存的客户端，线程安全；属性首次访问时创建"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: dict[str, Any] = {}
+        self._pid = os.getpid()
+
+    def _get(self, name: str, factory: Callable[["ClientRegistry"], Any]) -> Any:
+        if self._pid != os.getpid():
+            # fork 出的子进程
+            self._after_fork()
+        if name in self._clients:
+            return self._clients[name]
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = factory(self)
+            return self._clients[name]
+
+    def _after_fork(self) -> None:
+        # 父进程的连接不能在子进程中使用，也不在子进程中关闭（会影响父进程）
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    @property
+    def qdrant_client(self) -> QdrantClient:
+        return self._get("qdrant_client", lambda _: QdrantClient(**qdrant_client_options()))
+
+    @property
+    def async_qdrant_client(self) -> AsyncQdrantClient:
+        # async 路由使用，避免同步请求阻塞事件循环
+        return self._get("async_qdrant_client", lambda _: AsyncQdrantClient(**qdrant_client_options()))
+
+    @property
+    def flat_store(self):
+        return self._get("flat_store", lambda _: _create_flat_store())
+
+    @property
+    def vector_store(self):
+        return self._get("vector_store", _create_vector_store)
+
+    @property
+    def async_vector_store(self):
+        return self._get("async_vector_store", _create_async_vector_store)
+
+    @property
+    def zhipuai_client(self):
+        return self._get("zhipuai_client", lambda _: _create_zhipuai_client())
+
+    @property
+    def embedding_cache(self):
+        return self._get("embedding_cache", lambda _: _create_embedding_cache())
+
+    @property
+    def embeddings(self):
+        return self._get("embeddings", _create_embeddings)
+
+    def _take(self) -> dict[str, Any]:
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        return clients
+
+    @staticmethod
+    def _close_sync(clients: dict[str, Any]) -> None:
+        if clients.get("embedding_cache") is not None:
+            # 写入内存中累积的缓存命中计数
+            try:
+                clients["embedding_cache"].flush()
+            except Exception as e:
+                print(f"❌ 写入向量缓存统计失败: {e}")
+        for name in ("qdrant_client", "zhipuai_client"):
+            if name in clients:
+                try:
+                    clients[name].close()
+                except Exception as e:
+                    print(f"❌ 关闭 {name} 失败: {e}")
+
+    def close(self) -> None:
+        """关闭同步客户端并清空缓存（非 API 进程退出时调用），之后再访问会重新创建"""
+        self._close_sync(self._take())
+
+    async def aclose(self) -> None:
+        """关闭全部客户端（lifespan 结束时调用）"""
+        clients = self._take()
+        self._close_sync(clients)
+        if "async_qdrant_client" in clients:
+            try:
+                await clients["async_qdrant_client"].close()
+            except Exception as e:
+                print(f"❌ 关闭 async_qdrant_client 失败: {e}")
+
+
+clients = ClientRegistry()
@@ -95,6 +95,114 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
+    # 文档入库任务（python -m app.worker）
+    # 没有待处理任务时的轮询间隔（秒）
+    INGESTION_WORKER_POLL_SECONDS: float = 2.0
+    # running 状态的任务超过该时间没有更新，视为 worker 已退出，任务可被重新领取
+    INGESTION_JOB_LEASE_SECONDS: int = 600
+    INGESTION_JOB_MAX_ATTEMPTS: int = 3
+    # 每个 worker 进程同时处理的任务数
+    INGESTION_WORKER_CONCURRENCY: int = 2
+    # 清理知识库时每批处理的文档数（每批提交一次进度）
+    PURGE_BATCH_SIZE: int = 200
+    # worker 定期清理孤立向量/块/过期上传会话的间隔，0 表示不清理
+    PURGE_SWEEP_INTERVAL_SECONDS: int = 3600
+
+    # 上传文件大小上限（bytes）
+    UPLOAD_MAX_SIZE_BYTES: int = 200 * 1024 * 1024
+    # 流式写盘时每次读取的块大小（bytes）
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    # 批量上传：整个请求的大小上限，以及单次最多文件数（含压缩包内文件）
+    BULK_UPLOAD_MAX_SIZE_BYTES: int = 2 * 1024 * 1024 * 1024
+    BULK_UPLOAD_MAX_FILES: int = 1000
+    # 断点续传：单个文件大小上限（bytes），以及每次 PUT 的分片大小上限
+    RESUMABLE_UPLOAD_MAX_SIZE_BYTES: int = 1024 * 1024 * 1024
+    RESUMABLE_UPLOAD_MAX_PART_BYTES: int = 64 * 1024 * 1024
+    # 超过该时间没有新分片的上传会话由 worker 定期清理
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 3600
+
+    # PDF 解析进程池大小，以及每个子任务解析的页数
+    EXTRACT_POOL_SIZE: int = 2
+    EXTRACT_PAGES_PER_TASK: int = 50
+
+    # 入库流水线：每个窗口的块数，以及阶段之间队列可缓存的窗口数
+    INGESTION_WINDOW_CHUNKS: int = 256
+    INGESTION_QUEUE_SIZE: int = 2
+
+    QDRANT_URL: str = "http://qdrant:6333"
+    QDRANT_API_KEY: str | None = "test_env"
+    # 使用 gRPC 传输（点写入与检索的序列化开销比 JSON 小），REST 仍用于 gRPC 不支持的操作
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    # 每个进程的连接池大小、空闲连接保持时间、请求超时（秒），以及 gRPC keep-alive 间隔
+    QDRANT_POOL_SIZE: int = 32
+    QDRANT_KEEPALIVE_SECONDS: float = 30.0
+    QDRANT_TIMEOUT_SECONDS: int = 30
+    QDRANT_GRPC_KEEPALIVE_MS: int = 30000
+    # 读写使用的名称，重建索引后为指向实际 collection 的 alias
+    QDRANT_COLLECTION: str = "knowledge_documents"
+    # 检索时拉回向量在本地精确重排；只有量化 collection（服务端得分为近似值）需要开启
+    QDRANT_SEARCH_RESCORE: bool = False
+    # False：point payload 只保存 kb_id / doc_id / chunk_index，检索结果的文本从 knowledge_base_chunk 表批量读取
+    # 已有 point 的 payload 不变，通过 app.reindex 重建后生效
+    QDRANT_STORE_TEXT: bool = True
+    # 分区方式：shared 共用 collection 按 kb_id 过滤；tenant 共用 collection，kb_id 为 is_tenant 索引、按知识库建图；
+    # collection_per_kb 每个知识库一个 collection（{QDRANT_COLLECTION}_kb_{kb_id}）
+    QDRANT_PARTITIONING: Literal["shared", "tenant", "collection_per_kb"] = "shared"
+    # 新建 collection 的存储方式（见 qdrant_util.STORAGE_PROFILES）：memory 全部常驻内存；mmap 大 segment 向量 mmap；
+    # on_disk 向量与 payload 放磁盘；int8 / binary 量化向量常驻内存、原始向量放磁盘用于 rescore
+    QDRANT_STORAGE_PROFILE: Literal["memory", "mmap", "on_disk", "int8", "binary"] = "memory"
+    # 新建 collection 的 HNSW 参数，None 使用 Qdrant 默认值（m=16, ef_construct=100）
+    QDRANT_HNSW_M: int | None = None
+    QDRANT_HNSW_EF_CONSTRUCT: int | None = None
+    # 检索时的 hnsw_ef，越大召回越高、越慢；None 使用 collection 配置
+    QDRANT_SEARCH_HNSW_EF: int | None = None
+    # 写入：每批 point 数、同时发送的批次数、每批最多尝试次数
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    QDRANT_UPSERT_PARALLEL: int = 4
+    QDRANT_UPSERT_MAX_RETRIES: int = 3
+    # 块数不超过该值的知识库使用本地 mmap 向量存储（精确检索，不经过 Qdrant），0 表示不启用
+    FLAT_STORE_MAX_CHUNKS: int = 0
+    FLAT_STORE_PATH: str | None = None
+    FLAT_STORE_DTYPE: Literal["float32", "float16"] = "float32"
+    # 重建索引：每批 point 数与并发写入的批次数
+    REINDEX_BATCH_SIZE: int = 512
+    REINDEX_PARALLEL: int = 4
+
+    EMBEDDING_MODEL: str = "embedding-3"
+    EMBEDDING_DIMENSIONS: int = 1024
+    # 向量化：每批文本数（embedding-3 单次最多 64 条）、同时请求的批次数、单批重试次数
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    EMBEDDING_MAX_RETRIES: int = 3
+    # 向量模型 HTTP 连接池大小、空闲连接保持时间与请求超时（秒）
+    EMBEDDING_POOL_SIZE: int = 16
+    EMBEDDING_KEEPALIVE_SECONDS: float = 30.0
+    EMBEDDING_TIMEOUT_SECONDS: float = 60.0
+    # 向量缓存（SQLite），默认放在本地存储目录下，所有 worker 共享
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str | None = None
+    EMBEDDING_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # 模型调用准入控制：同时进行的调用数、每秒调用数与突发量
+    # GOVERNOR_SHARED 时为所有进程（API 各 worker 与 ingestion worker）共用的限制，通过 Postgres 协调；
+    # 否则每个进程各自限制
+    # 连接数：共用限制使用独立的连接池，每个进程最多
+    #   EMBEDDING_MAX_INFLIGHT + LLM_MAX_INFLIGHT + 2 * GOVERNOR_DB_EXTRA_CONNECTIONS 个连接
+    # （调用期间每个名额占用一个连接，另有少量连接用于取令牌），不占用请求与任务的连接池（默认 5 + 10）；
+    # Postgres 的 max_connections 需要覆盖 进程数 × (该数量 + 请求/任务连接池)
+    GOVERNOR_SHARED: bool = True
+    GOVERNOR_DB_EXTRA_CONNECTIONS: int = 2
+    EMBEDDING_MAX_INFLIGHT: int = 8
+    EMBEDDING_RATE_LIMIT_PER_SECOND: float = 10.0
+    EMBEDDING_RATE_BURST: int = 20
+    LLM_MAX_INFLIGHT: int = 4
+    LLM_RATE_LIMIT_PER_SECOND: float = 2.0
+    LLM_RATE_BURST: int = 5
+    # 等待队列长度上限与最长等待时间，超出后 API 返回 429
+    GOVERNOR_MAX_QUEUE: int = 64
+    GOVERNOR_MAX_WAIT_SECONDS: float = 30.0
+
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
             message = (
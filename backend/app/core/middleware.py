@@ -0,0 +1,94 @@
+import json
+from typing import Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# multipart 边界、表单头等额外开销
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class RequestSizeLimitMiddleware:
+    """
+    请求体大小限制：
+     - Content-Length 超限时直接返回 413，不读取请求体
+     - 没有 Content-Length（chunked）时按已接收字节数计数，超限立即中止
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        # 按路径后缀单独设置上限，如批量上传
+        self.path_limits = path_limits or {}
+
+    def _limit_for(self, path: str) -> int:
+        for suffix, limit in self.path_limits.items():
+            if path.endswith(suffix):
+                return limit
+        return self.max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_body_size = self._limit_for(scope.get("path", ""))
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    break
+                if content_length > max_body_size:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def limited_send(message: Message) -> None:
+            nonlocal response_started
+            if exceeded:
+                # 框架可能把读取异常转换成 400 等响应，统一替换为 413
+                if not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except _BodyTooLarge:
+            if response_started:
+                return
+            await self._reject(send)
+
+    async def _reject(self, send: Send) -> None:
+        body = json.dumps({"detail": "请求体过大"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,10 +1,16 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core.clients import clients
 from app.core.config import settings
+from app.core.middleware import MULTIPART_OVERHEAD, RequestSizeLimitMiddleware
+from app.service.qdrant_util import PARTITION_TENANT, check_partitioning_version
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +20,27 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Qdrant / 向量模型客户端在每个 worker 进程首次使用时创建，Qdrant 不可用时服务仍可启动
+    if settings.QDRANT_PARTITIONING == PARTITION_TENANT:
+        try:
+            info = await asyncio.to_thread(clients.qdrant_client.info)
+        except Exception as e:
+            print(f"❌ 无法检查 Qdrant 版本: {e}")
+        else:
+            # 服务端版本不支持 tenant 模式时抛出 ValueError，拒绝启动
+            check_partitioning_version(info.version, settings.QDRANT_PARTITIONING)
+    yield
+    await clients.aclose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -30,4 +53,11 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+# 上传大小限制：超限请求在读取请求体之前/过程中直接返回 413
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_body_size=settings.UPLOAD_MAX_SIZE_BYTES + MULTIPART_OVERHEAD,
+    path_limits={"/docs/bulk-upload": settings.BULK_UPLOAD_MAX_SIZE_BYTES + MULTIPART_OVERHEAD},
+)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime
+
+
+class AdmissionBucket(SQLModel, table=True):
+    """模型调用的令牌桶，所有进程共用（admission_util.SharedLimits）"""
+    __tablename__ = "admission_bucket"
+    # 准入控制名称 embedding / llm
+    name: str = Field(primary_key=True, max_length=50)
+    # 当前令牌数，取令牌时按 refilled_at 之后经过的时间补充
+    tokens: float = 0
+    refilled_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False), nullable=False)
+    )
@@ -0,0 +1,65 @@
+import uuid
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import JSON, Column, DateTime, Index
+
+
+class IngestionJobBase(SQLModel):
+    # 任务类型 ingest:入库 purge_doc:清理已删除文档的向量/块/文件 purge_kb:清理已删除知识库的所有文档
+    kind: str = Field(default="ingest", max_length=20)
+    # 任务状态 pending:排队中 running:处理中 succeeded:成功 failed:失败
+    status: str = Field(default="pending", max_length=20)
+    # 处理阶段 queued:排队中 processing:提取/切分/向量化/写入（流水线并行） done:完成
+    stage: str = Field(default="queued", max_length=20)
+    # 进度 0-100
+    progress: int = 0
+    total_chunks: int | None = None
+    processed_chunks: int = 0
+    error: str | None = Field(default=None, max_length=1024)
+    # knowledge_base / knowledge_base_file 由 db.sql 维护，这里不声明外键
+    knowledge_base_id: uuid.UUID = Field(nullable=False)
+    # purge_kb 任务为空
+    doc_id: uuid.UUID | None = Field(default=None, index=True)
+    # 各阶段耗时（秒）与 bytes/pages/chunks/vectors 计数，见 metrics_util.StageMetrics
+    metrics: dict | None = Field(default=None, sa_column=Column(JSON))
+
+
+class IngestionJob(IngestionJobBase, table=True):
+    __tablename__ = "ingestion_job"
+    # worker 按 (status, created_at) 领取任务
+    __table_args__ = (
+        Index("ix_ingestion_job_status_created_at", "status", "created_at"),
+    )
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # 已领取次数，超过 INGESTION_JOB_MAX_ATTEMPTS 后不再重试
+    attempts: int = 0
+    created_by: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False
+    )
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False))
+    )
+    # worker 每次推进阶段/进度都会刷新，用作租约心跳
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False))
+    )
+    started_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=False))
+    )
+    finished_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=False))
+    )
+
+
+class IngestionJobPublic(IngestionJobBase):
+    id: uuid.UUID
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
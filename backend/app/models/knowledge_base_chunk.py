@@ -0,0 +1,44 @@
+import uuid
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime, Index, Text
+
+
+class KnowledgeBaseChunkBase(SQLModel):
+    # 块在文档中的序号，从 0 开始
+    chunk_index: int
+    # 块文本
+    text: str = Field(sa_column=Column(Text, nullable=False))
+    # 块内容 sha256，与 Qdrant point id 的计算方式一致
+    content_hash: str = Field(max_length=64)
+    # 字符数
+    char_length: int
+
+
+class KnowledgeBaseChunk(KnowledgeBaseChunkBase, table=True):
+    __tablename__ = "knowledge_base_chunk"
+    # 按知识库顺序扫描（重新向量化），按文档查询/删除
+    __table_args__ = (
+        Index("ix_knowledge_base_chunk_kb_doc_chunk", "knowledge_base_id", "doc_id", "chunk_index"),
+    )
+    # knowledge_base / knowledge_base_file 由 db.sql 维护，这里不声明外键
+    doc_id: uuid.UUID = Field(primary_key=True)
+    chunk_index: int = Field(primary_key=True)
+    knowledge_base_id: uuid.UUID = Field(nullable=False)
+    # 对应的 Qdrant point id，同一文档中内容相同的块共用一个 point
+    point_id: uuid.UUID = Field(nullable=False, index=True)
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False))
+    )
+
+
+class KnowledgeBaseChunkPublic(KnowledgeBaseChunkBase):
+    doc_id: uuid.UUID
+    point_id: uuid.UUID
+
+
+class KnowledgeBaseChunksPublic(SQLModel):
+    data: list[KnowledgeBaseChunkPublic]
+    count: int
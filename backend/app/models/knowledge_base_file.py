@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 
 from sqlmodel import Field, Relationship, SQLModel
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, Index, text
 
 
 class KnowledgeBaseFileBase(SQLModel):
@@ -27,6 +27,13 @@ class KnowledgeBaseFileBase(SQLModel):
 
 class KnowledgeBaseFile(KnowledgeBaseFileBase, table=True):
     __tablename__ = "knowledge_base_file"
+    # 按 hash 去重只看可用文件：部分唯一索引，已删除(status=0)的文件不占用 hash
+    __table_args__ = (
+        Index(
+            "ix_knowledge_base_file_file_hash_live", "file_hash",
+            unique=True, postgresql_where=text("status = 1")
+        ),
+    )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     # 文件名称
     name: str = Field(min_length=1, max_length=255)
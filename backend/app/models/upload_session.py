@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime
+
+
+class UploadSessionBase(SQLModel):
+    # 文件名称
+    name: str = Field(min_length=1, max_length=255)
+    # 文件总大小 byte
+    size: int = Field(ge=0)
+    # 客户端声明的文件 md5，可选；完成时校验
+    file_hash: str | None = Field(default=None, max_length=255)
+
+
+class UploadSession(UploadSessionBase, table=True):
+    __tablename__ = "upload_session"
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # knowledge_base 由 db.sql 维护，这里不声明外键
+    knowledge_base_id: uuid.UUID = Field(nullable=False, index=True)
+    # 状态 open:上传中 completed:已完成 aborted:已取消
+    status: str = Field(default="open", max_length=20)
+    # 完成后对应的文档
+    doc_id: uuid.UUID | None = None
+    created_by: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False
+    )
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False))
+    )
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(DateTime(timezone=False))
+    )
+
+
+class UploadSessionCreate(UploadSessionBase):
+    pass
+
+
+class UploadSessionPublic(UploadSessionBase):
+    id: uuid.UUID
+    knowledge_base_id: uuid.UUID
+    status: str
+    # 服务端已写入的字节数，客户端从这里继续上传
+    offset: int
+    doc_id: uuid.UUID | None = None
@@ -0,0 +1,155 @@
+"""
+重建 Qdrant collection 并原子切换 alias，重建期间检索不受影响，入库与清理任务只在最后切换时短暂暂停
+
+用法（在 backend 目录下）:
+    python -m app.reindex [--source chunks|scroll] [--hnsw-m 16] [--hnsw-ef-construct 100]
+                          [--storage-profile memory|mmap|on_disk|int8|binary] [--drop-old]
+
+ - chunks（默认）: 从 knowledge_base_chunk 表读取文本，用当前 EMBEDDING_MODEL / EMBEDDING_DIMENSIONS 重新向量化，
+   用于更换向量模型或维度，不需要重新解析原文件
+ - scroll: 从当前 collection 滚动复制向量与 payload，用于只修改 HNSW 等索引参数
+新 collection 命名为 {QDRANT_COLLECTION}_{时间戳}，写入完成后按任务表追平重建期间入库、删除的文档
+（先删除再从数据源重新复制），最后一次追平与切换 alias 期间暂停 worker 领取任务（ingestion_service.job_barrier），
+之后 QDRANT_COLLECTION alias 原子切换到新 collection。
+新 collection 按当前 QDRANT_PARTITIONING 创建，可用于把 shared 迁移为 tenant（collection_per_kb 不适用），
+或者更换存储方式（例如改为 int8 量化）。
+QDRANT_STORE_TEXT=False 时新 collection 的 payload 不再保存块文本。
+"""
+import argparse
+import logging
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Callable, Iterable, Optional
+
+from qdrant_client.http import models
+from sqlmodel import Session, select
+
+from app.core.clients import clients, vector_store_options
+from app.core.config import settings
+from app.core.db import engine
+from app.models.ingestion_job import IngestionJob
+from app.service import ingestion_service
+from app.service.qdrant_util import (
+    PARTITION_COLLECTION_PER_KB,
+    STORAGE_PROFILES,
+    QdrantVectorStore,
+    check_partitioning_support,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _run_parallel(batches: Iterable, func: Callable[..., int], parallel: int, label: str) -> int:
+    """并发处理批次，同时最多 2 * parallel 个批次在处理或排队，内存不随数据量增长"""
+    total = 0
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(pool.submit(func, batch))
+            if len(in_flight) >= parallel * 2:
+                total += in_flight.popleft().result()
+                logger.info(f"{label}: {total} points")
+        while in_flight:
+            total += in_flight.popleft().result()
+    logger.info(f"{label}: {total} points")
+    return total
+
+
+def _copy_from_chunks(session: Session, target: QdrantVectorStore, parallel: int,
+                      kb_id: Optional[uuid.UUID] = None, doc_id: Optional[uuid.UUID] = None) -> int:
+    batches = ingestion_service.iter_chunk_rows(session=session, kb_id=kb_id, doc_id=doc_id,
+                                                batch_size=settings.REINDEX_BATCH_SIZE)
+    return _run_parallel(batches, lambda rows: ingestion_service.reembed_rows(rows, target), parallel,
+                         f"copy {doc_id or kb_id or 'all'} from chunks")
+
+
+def _copy_from_scroll(source: QdrantVectorStore, target: QdrantVectorStore, parallel: int,
+                      kb_id: Optional[uuid.UUID] = None, doc_id: Optional[uuid.UUID] = None) -> int:
+    scroll_filter = None
+    if doc_id is not None:
+        scroll_filter = source._doc_filter(doc_id)
+    elif kb_id is not None:
+        scroll_filter = source._kb_filter(kb_id)
+    return _run_parallel(source.iter_points(settings.REINDEX_BATCH_SIZE, scroll_filter), target.upsert_records,
+                         parallel, f"copy {doc_id or kb_id or 'all'} from scroll")
+
+
+def _catch_up(session: Session, copy: Callable[..., int], target: QdrantVectorStore, since: datetime) -> int:
+    """
+    追平 since 之后有变化的数据：按任务表找出入库/清理过的文档与知识库，先从新 collection 删除，
+    再从数据源（块表或当前 collection）重新复制；已删除的文档数据源中没有数据，删除即生效
+    """
+    jobs = session.exec(select(IngestionJob).where(IngestionJob.updated_at >= since)).all()
+    kb_ids = {job.knowledge_base_id for job in jobs if job.doc_id is None}
+    docs = {job.doc_id: job.knowledge_base_id for job in jobs
+            if job.doc_id is not None and job.knowledge_base_id not in kb_ids}
+    total = 0
+    for kb_id in kb_ids:
+        target.delete_knowledge_base(kb_id)
+        total += copy(kb_id=kb_id)
+    for doc_id, kb_id in docs.items():
+        target.delete_document(doc_id, kb_id=kb_id)
+        total += copy(kb_id=kb_id, doc_id=doc_id)
+    logger.info(f"catch up: {len(kb_ids)} knowledge bases, {len(docs)} documents, {total} points")
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the Qdrant collection and swap the alias")
+    parser.add_argument("--source", choices=["chunks", "scroll"], default="chunks")
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None)
+    parser.add_argument("--storage-profile", choices=list(STORAGE_PROFILES), default=settings.QDRANT_STORAGE_PROFILE)
+    parser.add_argument("--parallel", type=int, default=settings.REINDEX_PARALLEL)
+    parser.add_argument("--drop-old", action="store_true", help="切换后删除旧 collection")
+    parser.add_argument("--replace-collection", action="store_true",
+                        help=f"{settings.QDRANT_COLLECTION} 还是 collection（未使用 alias）时，删除它并改为 alias")
+    args = parser.parse_args()
+
+    if settings.QDRANT_PARTITIONING == PARTITION_COLLECTION_PER_KB:
+        raise SystemExit("collection_per_kb 模式下每个知识库一个 collection，不支持通过 alias 重建")
+    check_partitioning_support(clients.qdrant_client, settings.QDRANT_PARTITIONING)
+    alias = settings.QDRANT_COLLECTION
+    source = QdrantVectorStore(clients.qdrant_client, collection_name=alias)
+    if args.source == "scroll":
+        vector_size = source.get_vector_size()
+        if vector_size is None:
+            raise SystemExit(f"collection {alias} 不存在，无法从 scroll 重建")
+    else:
+        vector_size = settings.EMBEDDING_DIMENSIONS
+    options = vector_store_options()
+    options["storage_profile"] = args.storage_profile
+    if args.hnsw_m is not None or args.hnsw_ef_construct is not None:
+        options["hnsw_config"] = models.HnswConfigDiff(m=args.hnsw_m, ef_construct=args.hnsw_ef_construct)
+
+    new_name = f"{alias}_{datetime.utcnow():%Y%m%d%H%M%S}"
+    target = QdrantVectorStore(clients.qdrant_client, collection_name=new_name, vector_size=vector_size,
+                               **options)
+    logger.info(f"Rebuilding {alias} ({source.resolve_collection()}) into {new_name} from {args.source}")
+
+    with Session(engine) as session:
+        if args.source == "chunks":
+            copy = partial(_copy_from_chunks, session, target, args.parallel)
+        else:
+            copy = partial(_copy_from_scroll, source, target, args.parallel)
+        started = datetime.utcnow()
+        copy()
+        # 第一次追平不暂停任务；第二次暂停领取任务并等待进行中的任务结束，追平后切换 alias
+        caught_up = datetime.utcnow()
+        _catch_up(session, copy, target, since=started)
+        logger.info("Pausing ingestion and purge jobs for the final catch up")
+        with ingestion_service.job_barrier(engine, exclusive=True):
+            _catch_up(session, copy, target, since=caught_up)
+            previous = target.swap_alias(alias, replace_collection=args.replace_collection)
+    logger.info(f"Alias {alias} now points to {new_name} (was {previous})")
+    if args.drop_old and previous and previous != alias:
+        clients.qdrant_client.delete_collection(previous)
+        logger.info(f"Dropped collection {previous}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.config import settings
+from app.service.metrics_util import build_histogram
+
+# 等待时间直方图桶上限（秒）
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class GovernorBusyError(RuntimeError):
+    """等待队列已满或等待超时，调用方应稍后重试（API 返回 429）"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} 调用繁忙，请 {retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+# 等待其他进程释放并发名额时的轮询间隔（秒），每次翻倍直到上限
+SHARED_SLOT_POLL_SECONDS = 0.05
+SHARED_SLOT_MAX_POLL_SECONDS = 1.0
+# 共用限制的连接池取连接的超时（秒），超时后按没有取到令牌/名额处理，继续等待到 deadline
+SHARED_POOL_TIMEOUT_SECONDS = 1.0
+
+
+class SharedLimits:
+    """
+    多进程共用的限制，通过 Postgres 协调：
+     - 令牌桶保存在 admission_bucket 表，取令牌为一条带行锁的 UPDATE，时间使用数据库时钟
+     - 并发名额为 max_concurrency 个 advisory lock，调用期间占用一个连接持有锁，进程退出时自动释放
+    使用独立的连接池（不占用请求与任务的连接池）：max_concurrency 个连接持有名额（等待名额时也只用这一个连接），
+    另有 GOVERNOR_DB_EXTRA_CONNECTIONS 个连接用于取令牌，见 config 中的连接数说明
+    """
+
+    def __init__(self, name: str, max_concurrency: int, bind=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._bind = bind
+        self._bind_lock = threading.Lock()
+        # advisory lock 的第一个 key 按名称区分，第二个 key 为名额序号
+        self._lock_class = zlib.crc32(name.encode("utf-8")) & 0x7FFFFFFF
+
+    @property
+    def bind(self):
+        if self._bind is None:
+            with self._bind_lock:
+                if self._bind is None:
+                    self._bind = create_engine(
+                        str(settings.SQLALCHEMY_DATABASE_URI),
+                        pool_size=self.max_concurrency + settings.GOVERNOR_DB_EXTRA_CONNECTIONS,
+                        max_overflow=0,
+                        pool_timeout=SHARED_POOL_TIMEOUT_SECONDS,
+                        pool_pre_ping=True,
+                    )
+        return self._bind
+
+    def take_token(self, rate_per_second: float, burst: int) -> float:
+        """取一个令牌，返回还需等待的秒数（0 表示已取到）"""
+        try:
+            level = self._take_token(rate_per_second, burst)
+        except PoolTimeoutError:
+            # 连接池繁忙，稍后重试
+            return SHARED_SLOT_POLL_SECONDS
+        if level >= 1:
+            return 0.0
+        return (1 - level) / rate_per_second
+
+    def _take_token(self, rate_per_second: float, burst: int) -> float:
+        with self.bind.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO admission_bucket (name, tokens, refilled_at) "
+                "VALUES (:name, :burst, clock_timestamp() AT TIME ZONE 'UTC') ON CONFLICT (name) DO NOTHING"
+            ), {"name": self.name, "burst": burst})
+            level = conn.execute(text(
+                "WITH bucket AS ("
+                " SELECT LEAST(:burst, tokens + EXTRACT(EPOCH FROM (clock_timestamp() AT TIME ZONE 'UTC'"
+                " - refilled_at)) * :rate) AS level FROM admission_bucket WHERE name = :name FOR UPDATE) "
+                "UPDATE admission_bucket SET refilled_at = clock_timestamp() AT TIME ZONE 'UTC', "
+                " tokens = CASE WHEN bucket.level >= 1 THEN bucket.level - 1 ELSE bucket.level END "
+                "FROM bucket WHERE admission_bucket.name = :name RETURNING bucket.level"
+            ), {"name": self.name, "burst": burst, "rate": rate_per_second}).scalar_one()
+        return level
+
+    def return_token(self, burst: int) -> None:
+        """放回一个已取到但没有使用的令牌（等待并发名额超时）"""
+        with self.bind.begin() as conn:
+            conn.execute(text("UPDATE admission_bucket SET tokens = LEAST(:burst, tokens + 1) WHERE name = :name"),
+                         {"name": self.name, "burst": burst})
+
+    def acquire_slot(self, deadline: float):
+        """
+        占用一个并发名额，返回持有锁的连接（release_slot 释放）；到 deadline 仍没有空闲名额时返回 None
+        等待期间一直使用同一个连接轮询，轮询间隔逐步加大
+        """
+        conn = None
+        poll = SHARED_SLOT_POLL_SECONDS
+        try:
+            while True:
+                try:
+                    if conn is None:
+                        conn = self.bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+                    for slot in range(self.max_concurrency):
+                        if conn.execute(text("SELECT pg_try_advisory_lock(:lock_class, :slot)"),
+                                        {"lock_class": self._lock_class, "slot": slot}).scalar_one():
+                            conn.info["admission_slot"] = slot
+                            held, conn = conn, None
+                            return held
+                except PoolTimeoutError:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                time.sleep(min(poll, remaining))
+                poll = min(poll * 2, SHARED_SLOT_MAX_POLL_SECONDS)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def release_slot(self, conn) -> None:
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:lock_class, :slot)"),
+                         {"lock_class": self._lock_class, "slot": conn.info.pop("admission_slot")})
+        finally:
+            conn.close()
+
+
+class AdmissionGovernor:
+    """
+    外部模型调用的准入控制：
+     - 信号量限制同时进行的调用数，令牌桶限制每秒调用数（允许 burst 突发）
+     - 等待中的调用数超过 max_queue 时立即拒绝，等待超过 max_wait 秒时放弃，
+       避免请求无限堆积、所有请求一起超时
+     - 指定 shared 时令牌桶与并发数由所有进程共用，否则只作用于当前进程；等待队列总是按进程计算
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float, burst: int,
+                 max_queue: int, max_wait: float, shared: SharedLimits | None = None):
+        if max_concurrency < 1 or rate_per_second <= 0 or burst < 1 or max_queue < 1:
+            raise ValueError("invalid governor limits")
+        self.name = name
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.shared = shared
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._waiting = 0
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        # 最近的等待时间，用于直方图
+        self._waits: deque = deque(maxlen=1000)
+
+    def _take_token(self) -> float:
+        """取一个令牌，返回还需等待的秒数（0 表示已取到）"""
+        if self.shared is not None:
+            return self.shared.take_token(self.rate_per_second, self.burst)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_second
+
+    def _return_token(self) -> None:
+        """放回令牌：已取到令牌但没有等到并发名额"""
+        if self.shared is not None:
+            try:
+                self.shared.return_token(self.burst)
+            except Exception as e:
+                print(f"❌ {self.name} 放回令牌失败: {e}")
+            return
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def _retry_after(self) -> float:
+        # 排在前面的调用按速率全部放行所需的时间
+        return max(1.0, (self._waiting + self._in_flight) / self.rate_per_second)
+
+    def _reject(self) -> GovernorBusyError:
+        with self._lock:
+            self._rejected += 1
+            return GovernorBusyError(self.name, self._retry_after())
+
+    @contextmanager
+    def slot(self, max_wait: float | None = None) -> Iterator[None]:
+        """占用一个调用名额，在 with 块内调用模型"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise GovernorBusyError(self.name, self._retry_after())
+            self._waiting += 1
+        started = time.monotonic()
+        deadline = started + max_wait
+        acquired = False
+        token_taken = False
+        shared_slot = None
+        try:
+            # 先取令牌再占并发名额，等待令牌时不占用名额
+            while (wait := self._take_token()) > 0:
+                if time.monotonic() + wait > deadline:
+                    raise self._reject()
+                time.sleep(wait)
+            token_taken = True
+            if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise self._reject()
+            acquired = True
+            if self.shared is not None:
+                shared_slot = self.shared.acquire_slot(deadline)
+                if shared_slot is None:
+                    raise self._reject()
+        except BaseException:
+            with self._lock:
+                self._waiting -= 1
+            if acquired:
+                self._semaphore.release()
+            if token_taken:
+                self._return_token()
+            raise
+        with self._lock:
+            self._waiting -= 1
+            self._in_flight += 1
+            self._admitted += 1
+            self._waits.append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if shared_slot is not None:
+                self.shared.release_slot(shared_slot)
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waits = list(self._waits)
+            return {
+                "max_concurrency": self._max_concurrency,
+                "rate_per_second": self.rate_per_second,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "wait_seconds": build_histogram(waits, WAIT_BUCKETS),
+            }
+
+
+embedding_governor = AdmissionGovernor(
+    "embedding",
+    max_concurrency=settings.EMBEDDING_MAX_INFLIGHT,
+    rate_per_second=settings.EMBEDDING_RATE_LIMIT_PER_SECOND,
+    burst=settings.EMBEDDING_RATE_BURST,
+    max_queue=settings.GOVERNOR_MAX_QUEUE,
+    max_wait=settings.GOVERNOR_MAX_WAIT_SECONDS,
+    shared=SharedLimits("embedding", settings.EMBEDDING_MAX_INFLIGHT) if settings.GOVERNOR_SHARED else None,
+)
+llm_governor = AdmissionGovernor(
+    "llm",
+    max_concurrency=settings.LLM_MAX_INFLIGHT,
+    rate_per_second=settings.LLM_RATE_LIMIT_PER_SECOND,
+    burst=settings.LLM_RATE_BURST,
+    max_queue=settings.GOVERNOR_MAX_QUEUE,
+    max_wait=settings.GOVERNOR_MAX_WAIT_SECONDS,
+    shared=SharedLimits("llm", settings.LLM_MAX_INFLIGHT) if settings.GOVERNOR_SHARED else None,
+)
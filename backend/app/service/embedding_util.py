@@ -0,0 +1,360 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from tenacity import (
+    Retrying,
+    retry_if_exception_type,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from app.service.admission_util import AdmissionGovernor, GovernorBusyError
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    分批并发向量化：
+     - 按 batch_size 切分，最多 max_concurrency 个批次同时请求
+     - 每个批次单独重试，失败不影响其他批次
+     - 输出顺序与输入顺序一致
+     - 指定 governor 时每次请求（含重试）都先经过准入控制
+    """
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = 64, max_concurrency: int = 4,
+                 max_retries: int = 3, governor: Optional[AdmissionGovernor] = None):
+        if batch_size < 1 or max_concurrency < 1 or max_retries < 1:
+            raise ValueError("batch_size, max_concurrency and max_retries must be positive")
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.governor = governor
+
+    def _slot(self):
+        return self.governor.slot() if self.governor else nullcontext()
+
+    def _retrying(self, retry_busy: bool = True) -> Retrying:
+        return Retrying(
+            stop=stop_after_attempt(self.max_retries),
+            wait=wait_exponential(multiplier=0.5, max=10),
+            # 查询是交互请求，准入被拒时直接返回 429，不在服务端排队重试
+            retry=retry_if_exception_type() if retry_busy else retry_if_not_exception_type(GovernorBusyError),
+            reraise=True,
+        )
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in self._retrying():
+            with attempt, self._slot():
+                vectors = self.embeddings.embed_documents(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"embedding count mismatch: expected {len(texts)}, got {len(vectors)}")
+        return vectors
+
+    def embed_in_batches(self, texts: List[str],
+                         on_progress: Optional[Callable[[int], None]] = None) -> List[List[float]]:
+        """
+        分批向量化
+
+        Args:
+            texts: 待向量化文本
+            on_progress: 每完成一个批次（按顺序）回调一次，参数为已完成的文本数
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[List[float]] = []
+        if len(batches) <= 1 or self.max_concurrency == 1:
+            for batch in batches:
+                results.extend(self._embed_batch(batch))
+                if on_progress:
+                    on_progress(len(results))
+            return results
+
+        pool = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches)))
+        try:
+            # map 按提交顺序返回结果，保证输出与 chunk 顺序一致
+            for vectors in pool.map(self._embed_batch, batches):
+                results.extend(vectors)
+                if on_progress:
+                    on_progress(len(results))
+        finally:
+            # 某个批次重试后仍失败时，取消尚未开始的批次
+            pool.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_in_batches(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        for attempt in self._retrying(retry_busy=False):
+            with attempt, self._slot():
+                return self.embeddings.embed_query(text)
+
+
+# 命中/未命中计数与访问时间在内存中累积，最多间隔这么多秒写入一次
+CACHE_FLUSH_SECONDS = 10.0
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的向量缓存，key 为 (model, dimensions, sha256(text))
+     - WAL 模式，同一台机器上的多个 uvicorn worker / ingestion worker 共享
+     - 超过 max_bytes 后按最近访问时间（LRU）淘汰
+     - 读取只做 WAL 读，不加写锁；命中/未命中计数与访问时间先记在内存中，
+       定期（以及写入、查看统计时）写入 stats 表与 last_access，所有进程累计
+    """
+
+    def __init__(self, path: str, max_bytes: int, flush_seconds: float = CACHE_FLUSH_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_seconds = flush_seconds
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+        self._reset_pending()
+
+    def _reset_pending(self) -> None:
+        self._pending_pid = os.getpid()
+        self._pending_hits = 0
+        self._pending_misses = 0
+        # key -> 最近访问时间
+        self._pending_access: Dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程/跨进程（fork）复用
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, nbytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_last_access ON embedding (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute(
+            "INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0), ('bytes', 0)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return f"{namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量读取，命中的 key 会刷新访问时间（延迟写入）"""
+        if not keys:
+            return {}
+        conn = self._connect()
+        found: Dict[str, List[float]] = {}
+        # 分段查询，避免超过 sqlite 参数个数限制
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            for key, blob in conn.execute(f"SELECT key, vector FROM embedding WHERE key IN ({placeholders})", part):
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        now = time.time()
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                # fork 出的子进程不重复写入父进程的计数
+                self._reset_pending()
+            self._pending_hits += len(found)
+            self._pending_misses += len(keys) - len(found)
+            self._pending_access.update((key, now) for key in found)
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+        if due:
+            self.flush()
+        return found
+
+    def _take_pending(self):
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                self._reset_pending()
+            pending = (self._pending_hits, self._pending_misses, self._pending_access)
+            self._reset_pending()
+        return pending
+
+    def _write_pending(self, conn: sqlite3.Connection, pending) -> None:
+        """在调用方的写事务中写入累积的计数与访问时间"""
+        hits, misses, access = pending
+        if hits:
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'hits'", (hits,))
+        if misses:
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'misses'", (misses,))
+        if access:
+            conn.executemany("UPDATE embedding SET last_access = ? WHERE key = ?",
+                             [(at, key) for key, at in access.items()])
+
+    def _restore_pending(self, pending) -> None:
+        """写入失败时放回，下次再写"""
+        hits, misses, access = pending
+        with self._pending_lock:
+            self._pending_hits += hits
+            self._pending_misses += misses
+            for key, at in access.items():
+                self._pending_access.setdefault(key, at)
+
+    def flush(self) -> None:
+        """写入累积的命中/未命中计数与访问时间"""
+        pending = self._take_pending()
+        if not any(pending):
+            return
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._restore_pending(pending)
+            raise
+        try:
+            self._write_pending(conn, pending)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._restore_pending(pending)
+            raise
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """批量写入，写入后超过容量则按 LRU 淘汰"""
+        if not items:
+            return
+        conn = self._connect()
+        now = time.time()
+        added = 0
+        conn.execute("BEGIN IMMEDIATE")
+        pending = self._take_pending()
+        try:
+            # 已经持有写锁，顺便写入累积的计数与访问时间（淘汰前需要最新的访问时间）
+            self._write_pending(conn, pending)
+            for key, vector in items.items():
+                blob = np.asarray(vector, dtype=np.float32).tobytes()
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO embedding (key, vector, nbytes, last_access) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now)
+                )
+                if cur.rowcount == 1:
+                    added += len(blob)
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'", (added,))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._restore_pending(pending)
+            raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到容量的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = conn.execute(
+                "SELECT key, nbytes FROM embedding ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            freed = 0
+            victims = []
+            for key, nbytes in rows:
+                victims.append(key)
+                freed += nbytes
+                if total - freed <= target:
+                    break
+            conn.execute(
+                f"DELETE FROM embedding WHERE key IN ({','.join('?' * len(victims))})", victims
+            )
+            conn.execute("UPDATE stats SET value = value - ? WHERE name = 'bytes'", (freed,))
+            total -= freed
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush()
+        conn = self._connect()
+        values = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM embedding").fetchone()[0]
+        lookups = values["hits"] + values["misses"]
+        return {
+            "hits": values["hits"],
+            "misses": values["misses"],
+            "hit_rate": values["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": values["bytes"],
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """在 embeddings 前加一层内容寻址缓存，只有未命中的文本才会请求模型"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, namespace: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        # 模型名 + 维度，不同模型/维度的向量互不复用
+        self.namespace = namespace
+
+    def _cache_get(self, keys: List[str]) -> Dict[str, List[float]]:
+        try:
+            return self.cache.get_many(keys)
+        except Exception as e:
+            # 缓存不可用时直接请求模型
+            print(f"❌ 读取向量缓存失败: {e}")
+            return {}
+
+    def _cache_put(self, items: Dict[str, List[float]]) -> None:
+        try:
+            self.cache.put_many(items)
+        except Exception as e:
+            print(f"❌ 写入向量缓存失败: {e}")
+
+    def embed_in_batches(self, texts: List[str],
+                         on_progress: Optional[Callable[[int], None]] = None) -> List[List[float]]:
+        keys = [EmbeddingCache.make_key(self.namespace, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self._cache_get(unique_keys)
+
+        # 未命中的文本（去重后）交给下层分批向量化
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        hit_count = sum(1 for key in keys if key in found)
+        if on_progress and hit_count:
+            on_progress(hit_count)
+
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = list(missing.values())
+            if isinstance(self.embeddings, EmbeddingBatcher):
+                vectors = self.embeddings.embed_in_batches(
+                    missing_texts,
+                    on_progress=(lambda done: on_progress(hit_count + done)) if on_progress else None
+                )
+            else:
+                vectors = self.embeddings.embed_documents(missing_texts)
+            computed = dict(zip(missing_keys, vectors))
+            self._cache_put(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_in_batches(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.make_key(self.namespace, text)
+        found = self._cache_get([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self._cache_put({key: vector})
+        return vector
@@ -0,0 +1,75 @@
+import multiprocessing
+import threading
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+from app.core.config import settings
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    """进程池按需创建，大小由 EXTRACT_POOL_SIZE 控制"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn：调用方进程里可能已有线程（向量化线程池），fork 不安全
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.EXTRACT_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_extract_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _extract_pdf_range(file_path: str, start: int, end: int) -> list[str]:
+    """在子进程中解析 [start, end) 页"""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def count_pdf_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def split_page_ranges(page_count: int, pages_per_task: int) -> list[tuple[int, int]]:
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def iter_pdf_pages(file_path: str, page_count: int | None = None) -> Iterator[str]:
+    """
+    按页码顺序逐页返回 PDF 文本：
+     - 按 EXTRACT_PAGES_PER_TASK 切分页码区间，在进程池中并行解析
+     - 同时最多 2 * EXTRACT_POOL_SIZE 个区间在解析或等待消费，内存不随页数增长
+    """
+    if page_count is None:
+        page_count = count_pdf_pages(file_path)
+    ranges = deque(split_page_ranges(page_count, settings.EXTRACT_PAGES_PER_TASK))
+    max_in_flight = settings.EXTRACT_POOL_SIZE * 2
+    pool = get_extract_pool()
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(_extract_pdf_range, file_path, start, end))
+            yield from in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def extract_pdf_pages(file_path: str) -> list[str]:
+    """解析 PDF 的每一页文本，结果按页码顺序返回"""
+    return list(iter_pdf_pages(file_path))
@@ -0,0 +1,549 @@
+import asyncio
+import copy
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from app.service.qdrant_util import (
+    AsyncQdrantVectorStore,
+    QdrantVectorStore,
+    _VectorStoreBase,
+)
+
+# 每个知识库一个目录 {root}/{kb_id hex}/：
+#  - MANIFEST  当前的段列表 {"version", "dims", "segments": [{"name", "doc_id", "rows"}]}，整体替换
+#  - segments/{name}/  一次写入（一个文档的一个窗口）生成的只读段：
+#      vectors.npy      (N, D) 归一化后的向量，float32 或 float16，检索时 mmap 读取
+#      ids.npy          (N, 16) uint8，point id 的 uuid bytes
+#      chunk_index.npy  (N,) int32
+#      texts.bin + text_offsets.npy  块文本 utf-8 拼接，第 i 块为 texts[offsets[i]:offsets[i + 1]]
+# 写入只追加新段再替换 MANIFEST；删除、修改只重写涉及的段，不重写整个知识库
+# 读取方按 MANIFEST 打开段，不会看到写了一半的数据
+_ARRAYS = ("vectors", "ids", "chunk_index", "text_offsets")
+_MANIFEST = "MANIFEST"
+# 迁移到 Qdrant 后留下的标记，之后该知识库的写入都走 Qdrant
+_MIGRATED = "MIGRATED"
+
+
+def _uuid_rows(values: Iterable[Any]) -> np.ndarray:
+    return np.array([np.frombuffer(uuid.UUID(str(v)).bytes, dtype=np.uint8) for v in values],
+                    dtype=np.uint8).reshape(-1, 16)
+
+
+def _row_uuid(row: np.ndarray) -> str:
+    return str(uuid.UUID(bytes=row.tobytes()))
+
+
+def _row_mask(rows: np.ndarray, wanted: set) -> np.ndarray:
+    """rows（(N, 16) uuid bytes）中属于 wanted（uuid bytes 集合）的行"""
+    if len(rows) == 0 or not wanted:
+        return np.zeros(len(rows), dtype=bool)
+    return np.fromiter((row.tobytes() in wanted for row in rows), dtype=bool, count=len(rows))
+
+
+def _text_offsets(texts: list[bytes]) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum([len(t) for t in texts], dtype=np.int64)]).astype(np.int64)
+
+
+class _Segment:
+    """一个段的数据；mmap 打开，或在写入时作为内存中的数据"""
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray, chunk_index: np.ndarray,
+                 text_offsets: np.ndarray, texts: Any):
+        self.vectors = vectors
+        self.ids = ids
+        self.chunk_index = chunk_index
+        self.text_offsets = text_offsets
+        self.texts = texts
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, i: int) -> str:
+        return bytes(self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]).decode("utf-8")
+
+    def select(self, mask: np.ndarray) -> "_Segment":
+        """保留 mask 为 True 的行"""
+        keep = np.flatnonzero(mask)
+        texts = [bytes(self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]) for i in keep]
+        return _Segment(np.asarray(self.vectors[keep]), np.asarray(self.ids[keep]),
+                        np.asarray(self.chunk_index[keep]), _text_offsets(texts), b"".join(texts))
+
+
+class FlatVectorStore(_VectorStoreBase):
+    """
+    小知识库的进程内向量存储：向量按段保存为本地 mmap 的 .npy 文件，检索为暴力矩阵-向量乘法 + top-k，
+    省去到 Qdrant 的网络往返；接口与 QdrantVectorStore 一致（按 doc_id 的操作需先 for_kb）
+    多个进程通过文件锁串行写入同一知识库，读取不加锁
+    """
+
+    def __init__(self, root: str, dtype: str = "float32", kb_id: str | None = None):
+        super().__init__(client=None, collection_name="flat")
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        self.kb_id = str(kb_id) if kb_id else None
+        # 已打开的段（段写入后不再修改）：知识库目录 -> {段名 -> _Segment}
+        # 读取 MANIFEST 时丢弃已不在其中的段（可能由其他进程替换），释放已删除文件的 mmap
+        self._segments: dict[str, dict[str, _Segment]] = {}
+        os.makedirs(root, exist_ok=True)
+
+    # ========= 文件布局 =========
+    def _kb_dir(self, kb_id: str | None = None) -> str:
+        kb_id = kb_id or self.kb_id
+        if not kb_id:
+            raise ValueError("FlatVectorStore 按文档操作前需要先 for_kb(kb_id)")
+        return os.path.join(self.root, uuid.UUID(str(kb_id)).hex)
+
+    @staticmethod
+    def _manifest(kb_dir: str) -> dict[str, Any]:
+        try:
+            with open(os.path.join(kb_dir, _MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "dims": None, "segments": []}
+
+    @contextmanager
+    def _locked(self, kb_dir: str) -> Iterator[None]:
+        """flock 按打开的文件区分，同一进程内也不能嵌套"""
+        os.makedirs(kb_dir, exist_ok=True)
+        with open(os.path.join(kb_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open_segment(self, kb_dir: str, name: str) -> _Segment:
+        cached = self._segments.setdefault(kb_dir, {})
+        segment = cached.get(name)
+        if segment is None:
+            path = os.path.join(kb_dir, "segments", name)
+            arrays = {array: np.load(os.path.join(path, f"{array}.npy"), mmap_mode="r") for array in _ARRAYS}
+            texts_path = os.path.join(path, "texts.bin")
+            texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+            segment = cached[name] = _Segment(texts=texts, **arrays)
+        return segment
+
+    def _current_manifest(self, kb_dir: str) -> dict[str, Any]:
+        """读取 MANIFEST，并丢弃缓存中已不在其中的段"""
+        manifest = self._manifest(kb_dir)
+        cached = self._segments.get(kb_dir)
+        if cached:
+            names = {entry["name"] for entry in manifest["segments"]}
+            if not names:
+                self._segments.pop(kb_dir, None)
+            elif not names.issuperset(cached):
+                # 整体替换，不在其他线程遍历时修改字典
+                self._segments[kb_dir] = {name: segment for name, segment in cached.items() if name in names}
+        return manifest
+
+    def _load(self, kb_dir: str) -> list[tuple[dict[str, Any], _Segment]]:
+        """当前 MANIFEST 中的段：[(段信息, _Segment)]"""
+        return [(entry, self._open_segment(kb_dir, entry["name"]))
+                for entry in self._current_manifest(kb_dir)["segments"]]
+
+    def _write_segment(self, kb_dir: str, segment: _Segment) -> str:
+        name = uuid.uuid4().hex
+        path = os.path.join(kb_dir, "segments", name)
+        os.makedirs(path)
+        for array in _ARRAYS:
+            np.save(os.path.join(path, f"{array}.npy"), np.ascontiguousarray(getattr(segment, array)))
+        with open(os.path.join(path, "texts.bin"), "wb") as f:
+            f.write(bytes(segment.texts))
+        return name
+
+    def _publish(self, kb_dir: str, manifest: dict[str, Any], segments: list[dict[str, Any]]) -> None:
+        """替换 MANIFEST 并删除不再引用的段（调用方持有锁）；已 mmap 旧段的读取方不受影响"""
+        removed = {entry["name"] for entry in manifest["segments"]} - {entry["name"] for entry in segments}
+        tmp = os.path.join(kb_dir, f"{_MANIFEST}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": manifest["version"] + 1, "dims": manifest["dims"] if segments else None,
+                       "segments": segments}, f)
+        os.replace(tmp, os.path.join(kb_dir, _MANIFEST))
+        cached = self._segments.get(kb_dir, {})
+        for name in removed:
+            cached.pop(name, None)
+            shutil.rmtree(os.path.join(kb_dir, "segments", name), ignore_errors=True)
+
+    def _rewrite_segments(self, kb_dir: str, manifest: dict[str, Any],
+                          update: Callable[[dict[str, Any], _Segment], _Segment | None]) -> list[dict[str, Any]]:
+        """
+        update(段信息, _Segment) 返回 None 表示该段不变，否则为新的数据（为空时删除该段）
+        返回新的段列表（新段已写入，由调用方 _publish）
+        """
+        segments = []
+        for entry in manifest["segments"]:
+            changed = update(entry, self._open_segment(kb_dir, entry["name"]))
+            if changed is None:
+                segments.append(entry)
+            elif len(changed):
+                segments.append({"name": self._write_segment(kb_dir, changed), "doc_id": entry["doc_id"],
+                                 "rows": len(changed)})
+        return segments
+
+    def _update(self, kb_id: str | None,
+                update: Callable[[dict[str, Any], _Segment], _Segment | None]) -> None:
+        kb_dir = self._kb_dir(kb_id)
+        with self._locked(kb_dir):
+            manifest = self._manifest(kb_dir)
+            segments = self._rewrite_segments(kb_dir, manifest, update)
+            if segments != manifest["segments"]:
+                self._publish(kb_dir, manifest, segments)
+
+    # ========= 路由 =========
+    def for_kb(self, kb_id: str | None) -> "FlatVectorStore":
+        if not kb_id:
+            return self
+        store = copy.copy(self)
+        store.kb_id = str(kb_id)
+        return store
+
+    def count(self, kb_id: str | None = None) -> int:
+        return sum(entry["rows"] for entry in self._current_manifest(self._kb_dir(kb_id))["segments"])
+
+    def is_migrated(self, kb_id: str | None = None) -> bool:
+        return os.path.exists(os.path.join(self._kb_dir(kb_id), _MIGRATED))
+
+    def knowledge_base_ids(self) -> list[str]:
+        """有数据的知识库"""
+        return [str(uuid.UUID(name)) for name in os.listdir(self.root)
+                if self._manifest(os.path.join(self.root, name))["segments"]]
+
+    # ========= 写入 =========
+    def insert_document(self, kb_id: str, doc_id: str, text_chunks: list[str], embeddings: list[list[float] | None],
+                        start_index: int = 0) -> int:
+        """同 QdrantVectorStore.insert_document：按确定性 id 覆盖写入，embeddings 为 None 的块跳过"""
+        kb_dir = self._kb_dir(kb_id)
+        with self._locked(kb_dir):
+            return self._insert_locked(kb_id, doc_id, text_chunks, embeddings, start_index)
+
+    def _insert_locked(self, kb_id: str, doc_id: str, text_chunks: list[str],
+                       embeddings: list[list[float] | None], start_index: int) -> int:
+        """追加一个新段（调用方持有锁）；同 id 的旧数据只可能在同一文档的段中，只重写这些段"""
+        points = self._build_points(kb_id, doc_id, text_chunks, embeddings, start_index)
+        if not points:
+            return 0
+        kb_dir = self._kb_dir(kb_id)
+        vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0).astype(self.dtype)
+        texts = [chunk.encode("utf-8") for chunk, emb in zip(text_chunks, embeddings, strict=True)
+                 if emb is not None]
+        new = _Segment(vectors, _uuid_rows(p.id for p in points),
+                       np.asarray([p.payload["chunk_index"] for p in points], dtype=np.int32),
+                       _text_offsets(texts), b"".join(texts))
+        manifest = self._manifest(kb_dir)
+        if manifest["segments"] and manifest["dims"] != vectors.shape[1]:
+            raise ValueError(f"vector size mismatch: index expects {manifest['dims']}, got {vectors.shape[1]}")
+        manifest["dims"] = vectors.shape[1]
+        new_ids = {row.tobytes() for row in new.ids}
+
+        def overwrite(entry: dict[str, Any], segment: _Segment) -> _Segment | None:
+            if entry["doc_id"] != str(doc_id):
+                return None
+            mask = _row_mask(segment.ids, new_ids)
+            return segment.select(~mask) if mask.any() else None
+
+        segments = self._rewrite_segments(kb_dir, manifest, overwrite)
+        segments.append({"name": self._write_segment(kb_dir, new), "doc_id": str(doc_id), "rows": len(new)})
+        self._publish(kb_dir, manifest, segments)
+        return len(points)
+
+    def delete_documents(self, doc_ids: Iterable[str], kb_id: str | None = None) -> int:
+        doc_ids = {str(doc_id) for doc_id in doc_ids}
+        if doc_ids:
+            # 整段删除
+            self._update(kb_id, lambda entry, segment: segment.select(np.zeros(0, dtype=bool))
+                         if entry["doc_id"] in doc_ids else None)
+        return len(doc_ids)
+
+    def delete_document(self, doc_id: str, kb_id: str | None = None) -> bool:
+        self.delete_documents([doc_id], kb_id=kb_id)
+        return True
+
+    def delete_points(self, point_ids: Iterable[str], batch_size: int = 1000) -> int:
+        ids = list(point_ids)
+        wanted = {row.tobytes() for row in _uuid_rows(ids)}
+
+        def update(_entry: dict[str, Any], segment: _Segment) -> _Segment | None:
+            mask = _row_mask(segment.ids, wanted)
+            return segment.select(~mask) if mask.any() else None
+
+        if ids:
+            self._update(None, update)
+        return len(ids)
+
+    def set_chunk_indexes(self, chunk_indexes: dict[str, int], batch_size: int = 500) -> None:
+        def update(_entry: dict[str, Any], segment: _Segment) -> _Segment | None:
+            chunk_index = np.array(segment.chunk_index)
+            changed = False
+            for i, row in enumerate(segment.ids):
+                value = chunk_indexes.get(_row_uuid(row))
+                if value is not None and value != chunk_index[i]:
+                    chunk_index[i] = value
+                    changed = True
+            if not changed:
+                return None
+            return _Segment(np.asarray(segment.vectors), np.asarray(segment.ids), chunk_index,
+                            np.asarray(segment.text_offsets), bytes(segment.texts))
+
+        if chunk_indexes:
+            self._update(None, update)
+
+    def delete_knowledge_base(self, kb_id: str) -> None:
+        kb_dir = self._kb_dir(kb_id)
+        if os.path.isdir(kb_dir):
+            with self._locked(kb_dir):
+                self._publish(kb_dir, self._manifest(kb_dir), [])
+
+    def mark_migrated(self, kb_id: str) -> None:
+        """数据已迁移到 Qdrant：写入标记后删除本地数据（调用方持有锁）"""
+        kb_dir = self._kb_dir(kb_id)
+        open(os.path.join(kb_dir, _MIGRATED), "w").close()
+        self._publish(kb_dir, self._manifest(kb_dir), [])
+
+    # ========= 读取 =========
+    def get_document_points(self, doc_id: str, batch_size: int = 1000) -> dict[str, int]:
+        points = {}
+        for entry, segment in self._load(self._kb_dir()):
+            if entry["doc_id"] == str(doc_id):
+                points.update({_row_uuid(row): int(index) for row, index in
+                               zip(segment.ids, segment.chunk_index, strict=True)})
+        return points
+
+    def iter_doc_ids(self, batch_size: int = 1000) -> Iterable[set]:
+        doc_ids = {entry["doc_id"] for entry in self._manifest(self._kb_dir())["segments"]}
+        if doc_ids:
+            yield doc_ids
+
+    def iter_points(self, batch_size: int = 512) -> Iterable[list[PointStruct]]:
+        """按 Qdrant point 格式分批读取（迁移到 Qdrant 时使用）"""
+        created_at = datetime.utcnow().isoformat()
+        for entry, segment in self._load(self._kb_dir()):
+            for start in range(0, len(segment), batch_size):
+                points = []
+                for i in range(start, min(start + batch_size, len(segment))):
+                    text = segment.text(i)
+                    points.append(PointStruct(
+                        id=_row_uuid(segment.ids[i]), vector=segment.vectors[i].astype(np.float32).tolist(),
+                        payload={"kb_id": self.kb_id, "doc_id": entry["doc_id"], "text": text,
+                                 "chunk_index": int(segment.chunk_index[i]), "created_at": created_at,
+                                 "text_length": len(text)}))
+                yield points
+
+    def search_similar(self, query_embedding: list[float], kb_id: str | None = None, limit: int = 5,
+                       score_threshold: float = 0.6, candidate_multiplier: int = 4, rescore: bool | None = None,
+                       hnsw_ef: int | None = None, quantization: Any = None,
+                       with_payload: list[str] | None = None) -> list[dict[str, Any]]:
+        """
+        精确检索：向量已归一化，cosine 即矩阵-向量乘法；每个段 argpartition 取 top-k，合并后按阈值过滤
+        candidate_multiplier / rescore / hnsw_ef / quantization / with_payload 只为与 QdrantVectorStore 接口一致，不起作用
+        """
+        if limit <= 0:
+            return []
+        q_vec = np.asarray(query_embedding, dtype=np.float32)
+        q_norm = np.linalg.norm(q_vec)
+        if q_norm == 0:
+            return []
+        q_vec = q_vec / q_norm
+        candidates = []
+        for entry, segment in self._load(self._kb_dir(kb_id)):
+            # float16 存储时转换为 float32 计算（numpy 的 float16 矩阵乘法没有 BLAS 加速）
+            scores = np.asarray(segment.vectors, dtype=np.float32) @ q_vec
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            candidates.extend((float(scores[i]), entry["doc_id"], segment, i) for i in top
+                              if scores[i] >= score_threshold)
+        candidates.sort(key=lambda c: -c[0])
+        kb = str(kb_id or self.kb_id)
+        return [{
+            "id": _row_uuid(segment.ids[i]),
+            "score": score,
+            "text": segment.text(i),
+            "doc_id": doc_id,
+            "kb_id": kb,
+            "chunk_index": int(segment.chunk_index[i]),
+        } for score, doc_id, segment, i in candidates[:limit]]
+
+    def get_collection_info(self) -> dict[str, Any]:
+        kb_ids = self.knowledge_base_ids()
+        return {
+            "name": self.root,
+            "knowledge_bases": len(kb_ids),
+            "points_count": sum(self.count(kb_id) for kb_id in kb_ids),
+        }
+
+    def check_connection(self) -> bool:
+        return os.path.isdir(self.root)
+
+
+class RoutedVectorStore:
+    """
+    按知识库大小路由：块数不超过 max_flat_chunks 的知识库使用 FlatVectorStore，更大的使用 Qdrant
+     - 新知识库（Qdrant 中没有数据）先写入本地
+     - 每次写入前检查：本地块数加上本次写入的块数超过上限时先迁移到 Qdrant
+       （先写入 Qdrant，再留下标记并删除本地数据），之后不再回到本地；入库任务中途也可能迁移
+     - 检索时本地有数据即查本地，否则查 Qdrant；删除两边都执行
+    """
+
+    def __init__(self, qdrant: QdrantVectorStore, flat: FlatVectorStore, max_flat_chunks: int):
+        self.qdrant = qdrant
+        self.flat = flat
+        self.max_flat_chunks = max_flat_chunks
+        self.content_hash = qdrant.content_hash
+        self.make_point_id = qdrant.make_point_id
+
+    def _qdrant_has_kb(self, kb_id: str) -> bool:
+        store = self.qdrant.for_kb(kb_id)
+        if not store._exists():
+            return False
+        return store.client.count(store.collection_name, count_filter=store._kb_filter(kb_id), exact=False).count > 0
+
+    def _route(self, flat: FlatVectorStore, kb_id: str, incoming: int):
+        """写入 incoming 块应使用的 store，需要时先迁移到 Qdrant（调用方持有 flat 的锁）"""
+        if flat.is_migrated():
+            return self.qdrant.for_kb(kb_id)
+        count = flat.count()
+        if count == 0 and self._qdrant_has_kb(kb_id):
+            return self.qdrant.for_kb(kb_id)
+        if count + incoming <= self.max_flat_chunks:
+            return flat
+        # 超过上限：迁移到 Qdrant
+        target = self.qdrant.for_kb(kb_id)
+        for points in flat.iter_points():
+            if target.vector_size is None:
+                target.vector_size = len(points[0].vector)
+                target._ensure_collection(target.vector_size)
+            target.upsert_records(points)
+        flat.mark_migrated(kb_id)
+        print(f"message: 知识库 {kb_id} 共 {count} 块, 再写入 {incoming} 块将超过 {self.max_flat_chunks}, "
+              f"已从本地向量存储迁移到 Qdrant")
+        return target
+
+    def _current(self, kb_id: str):
+        """知识库当前所在的 store"""
+        flat = self.flat.for_kb(kb_id)
+        with flat._locked(flat._kb_dir()):
+            return self._route(flat, kb_id, 0)
+
+    def for_kb(self, kb_id: str | None):
+        """绑定知识库的 store，用于写入与按 doc_id 的操作；每次操作时按当前大小路由"""
+        if not kb_id:
+            return self.qdrant
+        return _RoutedKbStore(self, str(kb_id))
+
+    def insert_document(self, kb_id: str, doc_id: str, text_chunks: list[str], embeddings: list[list[float] | None],
+                        start_index: int = 0) -> int:
+        flat = self.flat.for_kb(kb_id)
+        incoming = sum(1 for emb in embeddings if emb is not None)
+        with flat._locked(flat._kb_dir()):
+            store = self._route(flat, str(kb_id), incoming)
+            if store is flat:
+                # 路由判断与写入在同一把锁内，其他进程不会在中间写入
+                return flat._insert_locked(kb_id, doc_id, text_chunks, embeddings, start_index)
+        return store.insert_document(kb_id, doc_id, text_chunks, embeddings, start_index)
+
+    def search_similar(self, query_embedding: list[float], kb_id: str | None = None, **kwargs) -> list[dict[str, Any]]:
+        if kb_id and self.flat.count(kb_id):
+            return self.flat.search_similar(query_embedding, kb_id, **kwargs)
+        return self.qdrant.search_similar(query_embedding, kb_id, **kwargs)
+
+    def delete_document(self, doc_id: str, kb_id: str | None = None) -> bool:
+        if kb_id:
+            self.flat.delete_document(doc_id, kb_id=kb_id)
+        return self.qdrant.delete_document(doc_id, kb_id=kb_id)
+
+    def delete_documents(self, doc_ids: Iterable[str], kb_id: str | None = None) -> int:
+        doc_ids = list(doc_ids)
+        if kb_id:
+            self.flat.delete_documents(doc_ids, kb_id=kb_id)
+        return self.qdrant.delete_documents(doc_ids, kb_id=kb_id)
+
+    def delete_knowledge_base(self, kb_id: str) -> None:
+        self.flat.delete_knowledge_base(kb_id)
+        self.qdrant.delete_knowledge_base(kb_id)
+
+    def partition_stores(self) -> list[Any]:
+        return self.qdrant.partition_stores() + [self.flat.for_kb(kb_id) for kb_id in self.flat.knowledge_base_ids()]
+
+    def ensure_payload_indexes(self) -> list[str]:
+        return self.qdrant.ensure_payload_indexes()
+
+    def get_collection_info(self) -> dict[str, Any]:
+        return {**self.qdrant.get_collection_info(), "flat": self.flat.get_collection_info()}
+
+    def check_connection(self) -> bool:
+        return self.qdrant.check_connection()
+
+
+class _RoutedKbStore:
+    """RoutedVectorStore.for_kb 的返回值：每个操作都在知识库当前所在的 store 上执行"""
+
+    def __init__(self, router: RoutedVectorStore, kb_id: str):
+        self.router = router
+        self.kb_id = kb_id
+
+    def insert_document(self, kb_id: str, doc_id: str, text_chunks: list[str], embeddings: list[list[float] | None],
+                        start_index: int = 0) -> int:
+        return self.router.insert_document(kb_id, doc_id, text_chunks, embeddings, start_index)
+
+    def get_document_points(self, doc_id: str, batch_size: int = 1000) -> dict[str, int]:
+        return self.router._current(self.kb_id).get_document_points(doc_id, batch_size)
+
+    def set_chunk_indexes(self, chunk_indexes: dict[str, int], batch_size: int = 500) -> None:
+        self.router._current(self.kb_id).set_chunk_indexes(chunk_indexes, batch_size)
+
+    def delete_points(self, point_ids: Iterable[str], batch_size: int = 1000) -> int:
+        return self.router._current(self.kb_id).delete_points(point_ids, batch_size)
+
+    def delete_documents(self, doc_ids: Iterable[str], kb_id: str | None = None) -> int:
+        return self.router.delete_documents(doc_ids, kb_id=self.kb_id)
+
+    def delete_document(self, doc_id: str, kb_id: str | None = None) -> bool:
+        return self.router.delete_document(doc_id, kb_id=self.kb_id)
+
+    def search_similar(self, query_embedding: list[float], kb_id: str | None = None, **kwargs) -> list[dict[str, Any]]:
+        return self.router.search_similar(query_embedding, self.kb_id, **kwargs)
+
+
+class AsyncRoutedVectorStore:
+    """RoutedVectorStore 的 async 版本（供 async 路由使用），本地存储的文件读取与检索都在线程池中执行"""
+
+    def __init__(self, qdrant: AsyncQdrantVectorStore, flat: FlatVectorStore):
+        self.qdrant = qdrant
+        self.flat = flat
+
+    def _search_flat(self, query_embedding: list[float], kb_id: str, **kwargs) -> list[dict[str, Any]] | None:
+        """本地有数据时检索本地，否则返回 None"""
+        if not self.flat.count(kb_id):
+            return None
+        return self.flat.search_similar(query_embedding, kb_id, **kwargs)
+
+    async def search_similar(self, query_embedding: list[float], kb_id: str | None = None,
+                             **kwargs) -> list[dict[str, Any]]:
+        if kb_id:
+            results = await asyncio.to_thread(self._search_flat, query_embedding, kb_id, **kwargs)
+            if results is not None:
+                return results
+        return await self.qdrant.search_similar(query_embedding, kb_id, **kwargs)
+
+    async def delete_document(self, doc_id: str, kb_id: str | None = None) -> bool:
+        if kb_id:
+            await asyncio.to_thread(self.flat.delete_document, doc_id, kb_id)
+        return await self.qdrant.delete_document(doc_id, kb_id=kb_id)
+
+    async def get_collection_info(self) -> dict[str, Any]:
+        flat_info = await asyncio.to_thread(self.flat.get_collection_info)
+        return {**await self.qdrant.get_collection_info(), "flat": flat_info}
+
+    async def check_connection(self) -> bool:
+        return await self.qdrant.check_connection()
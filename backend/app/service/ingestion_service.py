@@ -0,0 +1,627 @@
+import os
+import queue
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Engine, insert, text, tuple_
+from sqlmodel import Session, and_, col, delete, or_, select, update
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.core.clients import clients
+from app.core.config import settings
+from app.models.ingestion_job import IngestionJob
+from app.models.knowledge_base_chunk import KnowledgeBaseChunk
+from app.models.knowledge_base_file import KnowledgeBaseFile
+from app.service.extract_util import count_pdf_pages, iter_pdf_pages
+from app.service.metrics_util import StageMetrics
+from app.service.qdrant_util import QdrantVectorStore
+
+
+# 支持解析的文件类型
+SUPPORTED_EXTENSIONS = {".pdf", ".md", ".txt"}
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+# 批量上传支持的压缩包
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+# 纯文本按块读取的大小（字符）
+TEXT_READ_SIZE = 64 * 1024
+
+
+def chunk_text(text: str, max_len: int = 500) -> List[str]:
+    """
+    CharacterTextSplitter
+    基于字符数进行切割。
+    RecursiveCharacterTextSplitter
+    基于文本结构进行切割，尝试保持段落等较大单元的完整性。
+    MarkdownTextSplitter
+    基于 Markdown 标题进行切割。
+    HTMLTextSplitter
+    基于 HTML 标签进行切割。
+    RecursiveJSONTextSplitter
+    基于 JSON 结构进行切割。
+    CodeTextSplitter
+    基于代码结构进行切割。
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_len, chunk_overlap=CHUNK_OVERLAP)
+    texts = text_splitter.split_text(text)
+    return texts
+
+
+def _split_with_offsets(text: str, max_len: int) -> List[Tuple[str, int]]:
+    """切分文本，同时返回每块在原文中的起始位置"""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_len, chunk_overlap=CHUNK_OVERLAP,
+                                                   add_start_index=True)
+    return [(doc.page_content, doc.metadata["start_index"]) for doc in text_splitter.create_documents([text])]
+
+
+def is_supported_file(filename: str) -> bool:
+    """是否为支持解析的文件类型"""
+    return os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def is_archive(filename: str) -> bool:
+    """是否为批量上传支持的压缩包"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive_members(fileobj, filename: str) -> Iterator[Tuple[str, Any]]:
+    """
+    遍历压缩包中的文件，返回 (文件名, 可读文件对象)
+    文件对象只在迭代到下一个成员前有效；目录与隐藏文件（如 __MACOSX）跳过
+    """
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+                    continue
+                with archive.open(info) as member:
+                    yield name, member
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for info in archive:
+                name = os.path.basename(info.name)
+                if not info.isfile() or not name or name.startswith("."):
+                    continue
+                member = archive.extractfile(info)
+                if member is None:
+                    continue
+                with member:
+                    yield name, member
+
+
+def iter_document(file_path: str, filename: str) -> Iterator[Tuple[str, float]]:
+    """
+    流式读取文档文本，返回 (文本片段, 已读取比例)
+    片段直接拼接即为全文：PDF 按页返回（页之间以换行分隔），md/txt 按块返回
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".pdf":
+        page_count = count_pdf_pages(file_path)
+        for i, page in enumerate(iter_pdf_pages(file_path, page_count)):
+            yield ("\n" if i else "") + page, (i + 1) / page_count
+    elif ext in [".md", ".txt"]:
+        total = os.path.getsize(file_path) or 1
+        done = 0
+        with open(file_path, "r", encoding="utf-8") as f:
+            while block := f.read(TEXT_READ_SIZE):
+                done += len(block.encode("utf-8"))
+                yield block, min(done / total, 1.0)
+    else:
+        raise ValueError("不支持的文件类型")
+
+
+def extract_text_from_file(file_path: str, filename: str) -> str:
+    """根据文件类型解析文本"""
+
+    """
+    加载器:CSV、文件目录、HTML、JSON、Markdown 及 PDF等。
+    """
+    return "".join(text for text, _ in iter_document(file_path, filename))
+
+
+def iter_chunk_windows(pieces: Iterable[Tuple[str, float]], max_len: int = CHUNK_SIZE,
+                       window_size: int = 256) -> Iterator[Tuple[List[str], float]]:
+    """
+    流式切分：累积文本片段，缓冲区足够长时切分
+     - 最后一块连同其后的原文留在缓冲区，与后续文本一起再切分，保证跨页的块不被截断
+     - 每凑满 window_size 块返回一次 (chunks, 已读取比例)
+    """
+    buffer = ""
+    window: List[str] = []
+    progress = 0.0
+    for piece, progress in pieces:
+        buffer += piece
+        if len(buffer) < max_len * 8:
+            continue
+        parts = _split_with_offsets(buffer, max_len)
+        if len(parts) > 1:
+            window.extend(chunk for chunk, _ in parts[:-1])
+            buffer = buffer[parts[-1][1]:]
+        while len(window) >= window_size:
+            yield window[:window_size], progress
+            window = window[window_size:]
+    if buffer.strip():
+        window.extend(chunk_text(buffer, max_len))
+    while window:
+        yield window[:window_size], 1.0
+        window = window[window_size:]
+
+
+# ========= 流水线 =========
+_DONE = object()
+
+
+class _StageFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(items: Iterable[Any], q: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for item in items:
+            if not _put(q, item, stop):
+                return
+    except BaseException as e:
+        _put(q, _StageFailed(e), stop)
+    else:
+        _put(q, _DONE, stop)
+
+
+def _start_stage(items: Iterable[Any], maxsize: int, stop: threading.Event) -> queue.Queue:
+    """在线程中消费 items，结果写入有界队列；下游消费慢时上游阻塞（背压）"""
+    q: queue.Queue = queue.Queue(maxsize=maxsize)
+    threading.Thread(target=_produce, args=(items, q, stop), daemon=True).start()
+    return q
+
+
+def _iter_queue(q: queue.Queue, stop: Optional[threading.Event] = None) -> Iterator[Any]:
+    """读取上游阶段的结果；stop 置位后不再等待（上游可能已退出，不会再写入结束标记）"""
+    while True:
+        try:
+            item = q.get(timeout=0.5)
+        except queue.Empty:
+            if stop is not None and stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageFailed):
+            raise item.error
+        yield item
+
+
+def _embed_window(chunks: List[str], needs_embedding: Optional[Callable[[str], bool]]) -> List[Optional[List[float]]]:
+    """向量化一个窗口，needs_embedding 返回 False 的块不请求模型，对应位置为 None"""
+    if needs_embedding is None:
+        return clients.embeddings.embed_documents(chunks)
+    vectors: List[Optional[List[float]]] = [None] * len(chunks)
+    todo = [i for i, chunk in enumerate(chunks) if needs_embedding(chunk)]
+    if todo:
+        for i, vector in zip(todo, clients.embeddings.embed_documents([chunks[i] for i in todo])):
+            vectors[i] = vector
+    return vectors
+
+
+def run_pipeline(file_path: str, filename: str,
+                 upsert: Callable[[List[str], List[Optional[List[float]]], int], int],
+                 on_progress: Optional[Callable[[int, float], None]] = None,
+                 needs_embedding: Optional[Callable[[str], bool]] = None,
+                 metrics: Optional[StageMetrics] = None) -> int:
+    """
+    提取 -> 切分 -> 向量化 -> 写入 流水线：
+     - 提取/切分、向量化各自在线程中运行，写入在调用线程中执行
+     - 阶段之间以有界队列连接，各阶段并行推进，内存占用与文档大小无关
+
+    Args:
+        upsert: 写入一个窗口，参数为 (chunks, 向量, 窗口首块的 chunk_index)，返回写入条数
+        on_progress: 每写入一个窗口回调一次，参数为 (累计块数, 已读取比例)
+        needs_embedding: 判断块是否需要向量化（在向量化线程中调用），不需要的块向量为 None
+        metrics: 记录 extract/chunk/embed/upsert/db 各阶段耗时，以及 pages/chunks/vectors 计数
+
+    Returns:
+        总块数
+    """
+    metrics = metrics or StageMetrics()
+    stop = threading.Event()
+    maxsize = settings.INGESTION_QUEUE_SIZE
+
+    def embed(chunks: List[str]) -> List[Optional[List[float]]]:
+        with metrics.timer("embed"):
+            vectors = _embed_window(chunks, needs_embedding)
+        metrics.add("vectors", sum(1 for vector in vectors if vector is not None))
+        return vectors
+
+    try:
+        pieces = metrics.timed_iter(iter_document(file_path, filename), "extract",
+                                    "pages" if filename.lower().endswith(".pdf") else None)
+        # 切分在提取线程中拉取文本片段，chunk 的计时包含 extract，结束时扣除
+        windows = _start_stage(
+            metrics.timed_iter(iter_chunk_windows(pieces, CHUNK_SIZE, settings.INGESTION_WINDOW_CHUNKS), "chunk"),
+            maxsize, stop
+        )
+        embedded = _start_stage(
+            ((chunks, embed(chunks), progress) for chunks, progress in _iter_queue(windows, stop)),
+            maxsize, stop
+        )
+        total = 0
+        for chunks, vectors, progress in _iter_queue(embedded):
+            with metrics.timer("upsert"):
+                upsert(chunks, vectors, total)
+            total += len(chunks)
+            if on_progress:
+                with metrics.timer("db"):
+                    on_progress(total, progress)
+        metrics.add_seconds("chunk", -metrics.seconds.get("extract", 0.0))
+        metrics.add("chunks", total)
+        return total
+    finally:
+        # 出错时通知上游线程退出
+        stop.set()
+
+
+# ========= 块表 =========
+def delete_chunks(*, session: Session, doc_id: uuid.UUID) -> None:
+    """删除文档的全部块（不提交）"""
+    session.execute(delete(KnowledgeBaseChunk).where(KnowledgeBaseChunk.doc_id == doc_id))
+
+
+def save_chunks(*, session: Session, kb_id: uuid.UUID, doc_id: uuid.UUID, chunks: List[str],
+                start_index: int = 0) -> int:
+    """一次 executemany 写入一个窗口的块（不提交）"""
+    if not chunks:
+        return 0
+    now = datetime.utcnow()
+    rows = []
+    for i, chunk in enumerate(chunks):
+        content_hash = QdrantVectorStore.content_hash(chunk)
+        rows.append({
+            "doc_id": doc_id,
+            "chunk_index": start_index + i,
+            "knowledge_base_id": kb_id,
+            "point_id": uuid.UUID(QdrantVectorStore.make_point_id(doc_id, chunk, content_hash)),
+            "text": chunk,
+            "content_hash": content_hash,
+            "char_length": len(chunk),
+            "created_at": now,
+        })
+    session.execute(insert(KnowledgeBaseChunk), rows)
+    return len(rows)
+
+
+def fill_chunk_texts(*, session: Session, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """为没有文本的检索结果（payload 不保存文本时）按 point id 一次查询块表补全 text，原地修改并返回"""
+    missing = [r for r in results if not r.get("text")]
+    if not missing:
+        return results
+    point_ids = {uuid.UUID(r["id"]) for r in missing}
+    # 同一文档中内容相同的块共用 point，文本相同，取任意一行即可
+    texts = {str(point_id): text for point_id, text in session.exec(
+        select(KnowledgeBaseChunk.point_id, KnowledgeBaseChunk.text).where(col(KnowledgeBaseChunk.point_id).in_(point_ids))
+    ).all()}
+    for r in missing:
+        r["text"] = texts.get(r["id"], "")
+    return results
+
+
+def iter_chunk_rows(*, session: Session, kb_id: Optional[uuid.UUID] = None, doc_id: Optional[uuid.UUID] = None,
+                    since: Optional[datetime] = None, batch_size: int = 1000) -> Iterator[List[KnowledgeBaseChunk]]:
+    """
+    按 (doc_id, chunk_index) 顺序分批读取块，keyset 分页
+    指定 kb_id 时走 (knowledge_base_id, doc_id, chunk_index) 索引，否则走主键；doc_id 只读取该文档的块，
+    since 只读取该时间之后写入的块
+    """
+    last = None
+    while True:
+        statement = select(KnowledgeBaseChunk)
+        if kb_id is not None:
+            statement = statement.where(KnowledgeBaseChunk.knowledge_base_id == kb_id)
+        if doc_id is not None:
+            statement = statement.where(KnowledgeBaseChunk.doc_id == doc_id)
+        if since is not None:
+            statement = statement.where(KnowledgeBaseChunk.created_at >= since)
+        if last is not None:
+            statement = statement.where(tuple_(KnowledgeBaseChunk.doc_id, KnowledgeBaseChunk.chunk_index) > last)
+        statement = statement.order_by(KnowledgeBaseChunk.doc_id, KnowledgeBaseChunk.chunk_index).limit(batch_size)
+        rows = session.exec(statement).all()
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1].doc_id, rows[-1].chunk_index)
+
+
+def reembed_knowledge_base(*, session: Session, kb_id: uuid.UUID, store: Optional[QdrantVectorStore] = None,
+                           batch_size: int = 1000,
+                           on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    从块表重新向量化整个知识库并写入 store（默认当前 collection），不需要重新解析原文件
+    用于更换向量模型或重建 collection
+
+    Returns:
+        处理的块数
+    """
+    store = store or clients.vector_store
+    total = 0
+    for rows in iter_chunk_rows(session=session, kb_id=kb_id, batch_size=batch_size):
+        total += reembed_rows(rows, store)
+        if on_progress:
+            on_progress(total)
+    return total
+
+
+def reembed_rows(rows: List[KnowledgeBaseChunk], store: QdrantVectorStore) -> int:
+    """向量化一批块并写入 store；同一批中按文档分组写入（块在文档内是连续的）"""
+    vectors = clients.embeddings.embed_documents([row.text for row in rows])
+    start = 0
+    while start < len(rows):
+        end = start
+        while end < len(rows) and rows[end].doc_id == rows[start].doc_id:
+            end += 1
+        store.insert_document(
+            kb_id=rows[start].knowledge_base_id,
+            doc_id=rows[start].doc_id,
+            text_chunks=[row.text for row in rows[start:end]],
+            embeddings=vectors[start:end],
+            start_index=rows[start].chunk_index
+        )
+        start = end
+    return len(rows)
+
+
+# ========= 任务 =========
+def get_live_file_by_name(*, session: Session, kb_id: uuid.UUID, name: str) -> Optional[KnowledgeBaseFile]:
+    """同一知识库下的同名有效文件（重新上传时视为该文档的新版本）"""
+    statement = select(KnowledgeBaseFile).where(
+        KnowledgeBaseFile.status == 1,
+        KnowledgeBaseFile.knowledge_base_id == kb_id,
+        KnowledgeBaseFile.name == name
+    )
+    return session.exec(statement).first()
+
+
+def find_live_files_by_hash(*, session: Session, hashes: Iterable[str]) -> Dict[str, KnowledgeBaseFile]:
+    """按 hash 批量查询可用文件，走 (file_hash) WHERE status = 1 的部分唯一索引"""
+    hashes = set(hashes)
+    if not hashes:
+        return {}
+    statement = select(KnowledgeBaseFile).where(
+        KnowledgeBaseFile.status == 1,
+        col(KnowledgeBaseFile.file_hash).in_(hashes)
+    )
+    return {f.file_hash: f for f in session.exec(statement).all()}
+
+
+def has_active_job(*, session: Session, doc_id: uuid.UUID) -> bool:
+    statement = select(IngestionJob.id).where(
+        IngestionJob.doc_id == doc_id,
+        col(IngestionJob.status).in_(["pending", "running"])
+    )
+    return session.exec(statement).first() is not None
+
+
+def register_file(*, session: Session, kb_id: uuid.UUID, knowledge_base_file: Optional[KnowledgeBaseFile],
+                  name: str, file_path: str, size: int, file_hash: str,
+                  user_id: uuid.UUID, save_seconds: Optional[float] = None,
+                  doc_id: Optional[uuid.UUID] = None) -> Tuple[KnowledgeBaseFile, IngestionJob]:
+    """
+    写入文件记录并创建入库任务（不提交）
+    knowledge_base_file 不为空时更新为新版本，沿用原 doc_id，worker 只重新处理变化的块；
+    为空时新建文件记录，doc_id 为预先分配的 id（文件路径按 doc_id 生成）
+    save_seconds 为保存上传文件的耗时，记入任务指标
+    """
+    if knowledge_base_file is None:
+        knowledge_base_file = KnowledgeBaseFile(id=doc_id or uuid.uuid4(),
+                                                name=name,
+                                                extension=name.split(".")[-1],
+                                                size=size,
+                                                storage="local:" + file_path,
+                                                knowledge_base_id=kb_id,
+                                                status=1,
+                                                file_hash=file_hash,
+                                                created_by=user_id,
+                                                updated_by=user_id
+                                                )
+    else:
+        knowledge_base_file.size = size
+        knowledge_base_file.storage = "local:" + file_path
+        knowledge_base_file.file_hash = file_hash
+        knowledge_base_file.updated_by = user_id
+        knowledge_base_file.updated_at = datetime.utcnow()
+    session.add(knowledge_base_file)
+    metrics = StageMetrics()
+    metrics.extension = os.path.splitext(name)[1].lower()
+    if save_seconds is not None:
+        metrics.add_seconds("save", save_seconds)
+    job = create_job(session=session, kb_id=kb_id, doc_id=knowledge_base_file.id, user_id=user_id,
+                     metrics=metrics.to_dict())
+    return knowledge_base_file, job
+
+
+def create_job(*, session: Session, kb_id: uuid.UUID, doc_id: Optional[uuid.UUID], user_id: uuid.UUID,
+               metrics: Optional[Dict[str, Any]] = None, kind: str = "ingest") -> IngestionJob:
+    """创建任务（不提交，由调用方与文件记录一起提交），清理任务见 purge_service"""
+    job = IngestionJob(kind=kind, knowledge_base_id=kb_id, doc_id=doc_id, created_by=user_id, metrics=metrics)
+    session.add(job)
+    return job
+
+
+# 任务与重建索引之间的 Postgres advisory lock
+JOB_BARRIER_LOCK_KEY = 0x6A6F6273
+
+
+@contextmanager
+def job_barrier(bind: Engine, exclusive: bool = False) -> Iterator[None]:
+    """
+    worker 领取并执行任务时持有共享锁；重建索引（app.reindex）最后追平并切换 alias 时持有排他锁，
+    等待进行中的任务结束并暂停领取新任务，切换前写入旧 collection 的数据不会丢失
+    使用单独的连接（会话级锁），非 Postgres 数据库时不加锁
+    """
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    mode = "" if exclusive else "_shared"
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"SELECT pg_advisory_lock{mode}(:key)"), {"key": JOB_BARRIER_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text(f"SELECT pg_advisory_unlock{mode}(:key)"), {"key": JOB_BARRIER_LOCK_KEY})
+
+
+def claim_job(*, session: Session) -> Optional[IngestionJob]:
+    """
+    领取一个待处理任务：
+     - SELECT ... FOR UPDATE SKIP LOCKED，多个 worker 之间互不阻塞
+     - running 但租约过期的任务（worker 中途退出）会被重新领取
+    """
+    now = datetime.utcnow()
+    lease_expired_at = now - timedelta(seconds=settings.INGESTION_JOB_LEASE_SECONDS)
+    # 重试次数用完且租约过期的任务直接置为失败
+    session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.status == "running",
+               IngestionJob.updated_at < lease_expired_at,
+               IngestionJob.attempts >= settings.INGESTION_JOB_MAX_ATTEMPTS)
+        .values(status="failed", error="超过最大重试次数", finished_at=now, updated_at=now)
+    )
+    statement = (
+        select(IngestionJob)
+        .where(or_(IngestionJob.status == "pending",
+                   and_(IngestionJob.status == "running", IngestionJob.updated_at < lease_expired_at)))
+        .order_by(IngestionJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = session.exec(statement).first()
+    if job is None:
+        session.commit()
+        return None
+    job.status = "running"
+    job.attempts += 1
+    job.started_at = now
+    job.updated_at = now
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def update_job(session: Session, job: IngestionJob, **fields) -> None:
+    """推进任务阶段/进度，同时刷新租约"""
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.updated_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+
+
+def run_job(*, session: Session, job: IngestionJob) -> None:
+    """执行入库任务：提取、切分、向量化、写入 Qdrant 以流水线方式并行推进"""
+    knowledge_base_file = session.get(KnowledgeBaseFile, job.doc_id)
+    # 重试时只保留上传阶段的指标
+    previous = StageMetrics(job.metrics)
+    metrics = StageMetrics()
+    if "save" in previous.seconds:
+        metrics.add_seconds("save", previous.seconds["save"])
+    started = time.perf_counter()
+    try:
+        if not knowledge_base_file or knowledge_base_file.status != 1:
+            raise ValueError("文件不存在")
+        file_path = knowledge_base_file.storage.removeprefix("local:")
+        metrics.extension = os.path.splitext(knowledge_base_file.name)[1].lower()
+        metrics.add("bytes", os.path.getsize(file_path))
+        with metrics.timer("db"):
+            # 块表按本次解析结果重写，随进度一起提交
+            delete_chunks(session=session, doc_id=job.doc_id)
+            update_job(session, job, stage="processing", progress=0, processed_chunks=0, error=None)
+        # 重新入库（文档更新或任务重试）：内容未变的块复用已有向量，只向量化新增/变化的块
+        # collection_per_kb 模式下按 doc_id 的操作都在知识库所在的 collection 上进行
+        store = clients.vector_store.for_kb(job.knowledge_base_id)
+        with metrics.timer("upsert"):
+            existing = store.get_document_points(job.doc_id)
+        embedded_ids = set()
+        seen_ids = set()
+
+        def needs_embedding(chunk: str) -> bool:
+            point_id = QdrantVectorStore.make_point_id(job.doc_id, chunk)
+            if point_id in existing or point_id in embedded_ids:
+                return False
+            embedded_ids.add(point_id)
+            return True
+
+        def upsert(chunks: List[str], vectors: List[Optional[List[float]]], start_index: int) -> int:
+            moved = {}
+            for i, chunk in enumerate(chunks):
+                point_id = QdrantVectorStore.make_point_id(job.doc_id, chunk)
+                seen_ids.add(point_id)
+                if vectors[i] is None and point_id in existing and existing[point_id] != start_index + i:
+                    moved[point_id] = start_index + i
+            if moved:
+                store.set_chunk_indexes(moved)
+            save_chunks(session=session, kb_id=job.knowledge_base_id, doc_id=job.doc_id,
+                        chunks=chunks, start_index=start_index)
+            return store.insert_document(
+                kb_id=job.knowledge_base_id,
+                doc_id=job.doc_id,
+                text_chunks=chunks,
+                embeddings=vectors,
+                start_index=start_index
+            )
+
+        count = run_pipeline(
+            file_path, knowledge_base_file.name, upsert,
+            on_progress=lambda done, ratio: update_job(session, job, processed_chunks=done,
+                                                       progress=min(int(ratio * 100), 99)),
+            needs_embedding=needs_embedding,
+            metrics=metrics
+        )
+        # 删除新版本中已不存在的块
+        stale_ids = set(existing) - seen_ids
+        if stale_ids:
+            with metrics.timer("upsert"):
+                store.delete_points(stale_ids)
+        metrics.add("reused", len(seen_ids & set(existing)))
+        print(f"message: 文档 {job.doc_id} 新增 {len(embedded_ids)} 块, 复用 {len(seen_ids & set(existing))} 块, "
+              f"删除 {len(stale_ids)} 块")
+        if count == 0:
+            raise ValueError("文件内容为空")
+        metrics.add_seconds("total", time.perf_counter() - started)
+        update_job(session, job, status="succeeded", stage="done", progress=100,
+                   total_chunks=count, processed_chunks=count, finished_at=datetime.utcnow(),
+                   metrics=metrics.to_dict())
+        print(f"message: 文档 {job.doc_id} 向量化成功, 共计向量化 {count} 条数据, 指标: {job.metrics}")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ 入库任务 {job.id} 失败: {e}")
+        metrics.add_seconds("total", time.perf_counter() - started)
+        if job.attempts < settings.INGESTION_JOB_MAX_ATTEMPTS:
+            # 放回队列重试
+            update_job(session, job, status="pending", error=str(e)[:1024], metrics=metrics.to_dict())
+            return
+        if knowledge_base_file and knowledge_base_file.status == 1:
+            # purge_service 依赖本模块，在这里导入
+            from app.service import purge_service
+            # 释放文件 hash，允许重新上传；已写入的向量与块由清理任务删除，不再出现在检索结果中
+            knowledge_base_file.status = 0
+            session.add(knowledge_base_file)
+            purge_service.create_purge_job(session=session, kind=purge_service.PURGE_DOC,
+                                           kb_id=job.knowledge_base_id, user_id=job.created_by, doc_id=job.doc_id)
+        update_job(session, job, status="failed", error=str(e)[:1024], finished_at=datetime.utcnow(),
+                   metrics=metrics.to_dict())
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+# 入库阶段：save 保存上传文件 extract 解析文本 chunk 切分 embed 向量化 upsert 写入 Qdrant db 任务/进度提交
+STAGES = ("save", "extract", "chunk", "embed", "upsert", "db")
+# 直方图桶上限（秒），与 Prometheus 默认桶相近
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class StageMetrics:
+    """
+    单个入库任务的阶段耗时与计数，线程安全（流水线各阶段在不同线程中累加）
+    注意各阶段并行执行，耗时之和会大于总耗时 total
+    """
+
+    def __init__(self, data: dict[str, Any] | None = None):
+        data = data or {}
+        self.seconds: dict[str, float] = dict(data.get("seconds") or {})
+        self.counts: dict[str, int] = dict(data.get("counts") or {})
+        self.extension: str | None = data.get("extension")
+        self._lock = threading.Lock()
+
+    def add_seconds(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def add(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[counter] = self.counts.get(counter, 0) + n
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(stage, time.perf_counter() - start)
+
+    def timed_iter(self, items: Iterable[Any], stage: str, counter: str | None = None) -> Iterator[Any]:
+        """迭代 items，把每次取下一项的耗时计入 stage，取到的项数计入 counter"""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_seconds(stage, time.perf_counter() - start)
+                return
+            self.add_seconds(stage, time.perf_counter() - start)
+            if counter:
+                self.add(counter)
+            yield item
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "extension": self.extension,
+                "seconds": {stage: round(value, 4) for stage, value in self.seconds.items()},
+                "counts": dict(self.counts),
+            }
+
+
+def build_histogram(values: list[float], buckets: Iterable[float] = SECONDS_BUCKETS) -> dict[str, Any]:
+    """累计直方图（le 桶）以及 p50/p95"""
+    values = sorted(values)
+    histogram = {
+        "count": len(values),
+        "sum": round(sum(values), 4),
+        "buckets": {str(le): sum(1 for v in values if v <= le) for le in buckets},
+    }
+    histogram["buckets"]["+Inf"] = len(values)
+    if values:
+        histogram["p50"] = round(values[int(0.5 * (len(values) - 1))], 4)
+        histogram["p95"] = round(values[int(0.95 * (len(values) - 1))], 4)
+    return histogram
+
+
+def summarize_jobs(metrics: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """按文件类型汇总多个任务的指标：各阶段耗时直方图、计数合计与吞吐"""
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for item in metrics:
+        grouped.setdefault(item.get("extension") or "unknown", []).append(item)
+    summary = {}
+    for extension, items in grouped.items():
+        stages = sorted({stage for item in items for stage in item.get("seconds", {})},
+                        key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+        counts: dict[str, int] = {}
+        for item in items:
+            for counter, value in item.get("counts", {}).items():
+                counts[counter] = counts.get(counter, 0) + value
+        total_seconds = sum(item.get("seconds", {}).get("total", 0.0) for item in items)
+        summary[extension] = {
+            "jobs": len(items),
+            "seconds": {
+                stage: build_histogram([item["seconds"][stage] for item in items if stage in item.get("seconds", {})])
+                for stage in stages
+            },
+            "counts": counts,
+            # 按处理总耗时（不含 save）计算
+            "throughput": {
+                f"{counter}_per_second": round(value / total_seconds, 2) if total_seconds else None
+                for counter, value in counts.items()
+            },
+        }
+    return summary
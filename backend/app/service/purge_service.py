@@ -0,0 +1,144 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlmodel import Session, col, delete, select
+
+from app.core.clients import clients
+from app.core.config import settings
+from app.models.ingestion_job import IngestionJob
+from app.models.knowledge_base_chunk import KnowledgeBaseChunk
+from app.models.knowledge_base_file import KnowledgeBaseFile
+from app.models.upload_session import UploadSession
+from app.service import ingestion_service
+from app.storage.local_storage import LocalStorage
+
+# 清理任务类型，与入库任务共用 ingestion_job 表和 worker
+PURGE_DOC = "purge_doc"
+PURGE_KB = "purge_kb"
+
+
+def create_purge_job(*, session: Session, kind: str, kb_id: uuid.UUID, user_id: uuid.UUID,
+                     doc_id: Optional[uuid.UUID] = None) -> IngestionJob:
+    """创建清理任务（不提交，由调用方与删除标记一起提交）"""
+    if kind not in (PURGE_DOC, PURGE_KB):
+        raise ValueError(f"unknown purge kind: {kind}")
+    return ingestion_service.create_job(session=session, kb_id=kb_id, doc_id=doc_id, user_id=user_id, kind=kind)
+
+
+def remove_unreferenced_files(session: Session, storage: LocalStorage, paths: Iterable[Optional[str]]) -> None:
+    """删除文件内容（storage 字段的值）；路径为 docs/{doc_id}/{hash}{扩展名}，同一文档重新上传相同内容时新旧版本路径相同，仍被有效文件引用的路径保留"""
+    paths = {path for path in paths if path}
+    if not paths:
+        return
+    live = set(session.exec(
+        select(KnowledgeBaseFile.storage).where(KnowledgeBaseFile.status == 1, col(KnowledgeBaseFile.storage).in_(paths))
+    ).all())
+    for path in paths - live:
+        storage.remove_path(path.removeprefix("local:"))
+
+
+def purge_documents(*, session: Session, kb_id: uuid.UUID, files: List[KnowledgeBaseFile],
+                    storage: LocalStorage) -> None:
+    """删除一批文档的向量、块与文件内容，并标记为已删除（不提交）"""
+    doc_ids = [f.id for f in files]
+    clients.vector_store.delete_documents(doc_ids, kb_id=kb_id)
+    session.execute(delete(KnowledgeBaseChunk).where(col(KnowledgeBaseChunk.doc_id).in_(doc_ids)))
+    for knowledge_base_file in files:
+        if knowledge_base_file.status != 0:
+            knowledge_base_file.status = 0
+            knowledge_base_file.updated_at = datetime.utcnow()
+            session.add(knowledge_base_file)
+    remove_unreferenced_files(session, storage, [f.storage for f in files])
+
+
+def _purge_doc(session: Session, job: IngestionJob, storage: LocalStorage) -> None:
+    knowledge_base_file = session.get(KnowledgeBaseFile, job.doc_id)
+    if knowledge_base_file is None or knowledge_base_file.status == 1:
+        # 只清理已删除的文档
+        raise ValueError("文档不存在或未删除")
+    purge_documents(session=session, kb_id=job.knowledge_base_id, files=[knowledge_base_file], storage=storage)
+    ingestion_service.update_job(session, job, status="succeeded", stage="done", progress=100,
+                                 total_chunks=1, processed_chunks=1, finished_at=datetime.utcnow())
+
+
+def _purge_kb(session: Session, job: IngestionJob, storage: LocalStorage) -> None:
+    """按批删除知识库下的文档，每批提交一次进度（processed_chunks / total_chunks 为文档数），最后按 kb_id 兜底"""
+    kb_id = job.knowledge_base_id
+    statement = select(KnowledgeBaseFile).where(KnowledgeBaseFile.knowledge_base_id == kb_id,
+                                                KnowledgeBaseFile.status == 1)
+    total = len(session.exec(select(KnowledgeBaseFile.id).where(KnowledgeBaseFile.knowledge_base_id == kb_id,
+                                                               KnowledgeBaseFile.status == 1)).all())
+    # 重试时从上次的进度继续计数
+    done = job.processed_chunks if job.total_chunks else 0
+    ingestion_service.update_job(session, job, stage="processing", total_chunks=done + total, processed_chunks=done)
+    while files := session.exec(statement.limit(settings.PURGE_BATCH_SIZE)).all():
+        purge_documents(session=session, kb_id=kb_id, files=files, storage=storage)
+        done += len(files)
+        ingestion_service.update_job(session, job, processed_chunks=done,
+                                     progress=min(int(done * 100 / max(job.total_chunks, 1)), 99))
+    # 已删除文档残留的向量与块
+    clients.vector_store.delete_knowledge_base(kb_id)
+    session.execute(delete(KnowledgeBaseChunk).where(KnowledgeBaseChunk.knowledge_base_id == kb_id))
+    ingestion_service.update_job(session, job, status="succeeded", stage="done", progress=100,
+                                 finished_at=datetime.utcnow())
+
+
+def run_purge_job(*, session: Session, job: IngestionJob, storage: Optional[LocalStorage] = None) -> None:
+    """执行清理任务，失败时与入库任务一样放回队列重试"""
+    storage = storage or LocalStorage()
+    try:
+        if job.kind == PURGE_DOC:
+            _purge_doc(session, job, storage)
+        else:
+            _purge_kb(session, job, storage)
+        print(f"message: 清理任务 {job.id} ({job.kind}) 完成, 共 {job.processed_chunks} 个文档")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ 清理任务 {job.id} 失败: {e}")
+        if job.attempts < settings.INGESTION_JOB_MAX_ATTEMPTS:
+            ingestion_service.update_job(session, job, status="pending", error=str(e)[:1024])
+            return
+        ingestion_service.update_job(session, job, status="failed", error=str(e)[:1024],
+                                     finished_at=datetime.utcnow())
+
+
+def _live_doc_ids(session: Session, doc_ids: Iterable[str]) -> set:
+    ids = [uuid.UUID(str(doc_id)) for doc_id in doc_ids]
+    statement = select(KnowledgeBaseFile.id).where(KnowledgeBaseFile.status == 1, col(KnowledgeBaseFile.id).in_(ids))
+    return {str(doc_id) for doc_id in session.exec(statement).all()}
+
+
+def sweep_orphans(*, session: Session, storage: Optional[LocalStorage] = None) -> Dict[str, int]:
+    """
+    定期清理：
+     - 没有对应有效文件（status = 1）的向量，例如入库任务在文档删除后仍写入的向量
+     - 没有对应有效文件的块记录（入库失败、旧版本清理遗漏等）
+     - 超过 UPLOAD_SESSION_TTL_SECONDS 没有新分片的上传会话及其分片文件
+    入库前会先提交文件记录，因此正在入库的文档不会被误删
+    """
+    storage = storage or LocalStorage()
+    result = {"points_docs": 0, "chunks": 0, "upload_sessions": 0}
+    for store in clients.vector_store.partition_stores():
+        for doc_ids in store.iter_doc_ids():
+            orphans = doc_ids - _live_doc_ids(session, doc_ids)
+            if orphans:
+                result["points_docs"] += store.delete_documents(orphans)
+    live_files = select(KnowledgeBaseFile.id).where(KnowledgeBaseFile.status == 1)
+    result["chunks"] = session.execute(
+        delete(KnowledgeBaseChunk).where(col(KnowledgeBaseChunk.doc_id).not_in(live_files))
+    ).rowcount
+    session.commit()
+
+    expired_at = datetime.utcnow() - timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    stale_sessions = session.exec(
+        select(UploadSession).where(UploadSession.status == "open", UploadSession.updated_at < expired_at)
+    ).all()
+    for upload_session in stale_sessions:
+        storage.remove_part(str(upload_session.id))
+        upload_session.status = "aborted"
+        upload_session.updated_at = datetime.utcnow()
+        session.add(upload_session)
+    session.commit()
+    result["upload_sessions"] = len(stale_sessions)
+    return result
@@ -1,39 +1,167 @@
+import asyncio
+import copy
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
 import numpy as np
 import uuid
 from datetime import datetime
 from qdrant_client.http import models
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue, VectorParams, Distance
+from tenacity import AsyncRetrying, Retrying, stop_after_attempt, wait_exponential
 
 
-class QdrantVectorStore:
-    def __init__(self, client, collection_name: str, vector_size: Optional[int] = None, distance: Distance = Distance.COSINE):
+# point id 命名空间：id = uuid5(doc_id + chunk 内容 hash)
+POINT_ID_NAMESPACE = uuid.UUID("6f1f7d3e-2b8a-4c53-9d0e-5a4b7c2e9f10")
+# 过滤条件用到的 payload 字段：检索按 kb_id，删除/增量入库按 doc_id，按 chunk_index 范围读取
+PAYLOAD_INDEXES = {
+    "kb_id": models.PayloadSchemaType.KEYWORD,
+    "doc_id": models.PayloadSchemaType.KEYWORD,
+    "chunk_index": models.PayloadSchemaType.INTEGER,
+}
+# 检索结果用到的 payload 字段（created_at / text_length 等不返回）
+SEARCH_PAYLOAD_FIELDS = ("kb_id", "doc_id", "chunk_index", "text")
+
+# 分区方式：
+#  - shared：所有知识库共用一个 collection，按 kb_id 过滤
+#  - tenant：共用一个 collection，kb_id 建 is_tenant 索引，Qdrant 按知识库组织存储并只为每个知识库建图
+#  - collection_per_kb：每个知识库一个 collection，小知识库只需检索自己的小索引
+PARTITION_SHARED = "shared"
+PARTITION_TENANT = "tenant"
+PARTITION_COLLECTION_PER_KB = "collection_per_kb"
+PARTITIONINGS = (PARTITION_SHARED, PARTITION_TENANT, PARTITION_COLLECTION_PER_KB)
+# tenant 模式依赖 is_tenant payload 索引，Qdrant 1.11 起支持
+TENANT_MIN_QDRANT_VERSION = (1, 11)
+# collection_per_kb 模式下缓存的知识库 store 数（LRU），超出后按需重新创建
+KB_STORE_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """collection 的存储方式：向量/payload 是否放磁盘（mmap）、量化方式，以及量化检索时的过采样与重排"""
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    # segment 超过该大小（KB）时向量改为 mmap 存储
+    memmap_threshold: Optional[int] = None
+    quantization: Optional[models.QuantizationConfig] = None
+    # 量化检索：先按量化向量取 limit * oversampling 条，再用原始向量重新打分（rescore）
+    oversampling: Optional[float] = None
+    quantization_rescore: bool = True
+
+
+# 1024 维下原始向量每块 4KB：int8 量化后常驻内存的部分约 1KB，binary 约 128B，原始向量放磁盘只用于 rescore
+STORAGE_PROFILES: Dict[str, StorageProfile] = {
+    # 全部常驻内存（默认，与之前一致）
+    "memory": StorageProfile(),
+    # 大 segment 的向量 mmap，payload 放磁盘
+    "mmap": StorageProfile(memmap_threshold=20000, on_disk_payload=True),
+    # 向量与 payload 都放磁盘，依赖 page cache
+    "on_disk": StorageProfile(on_disk_vectors=True, on_disk_payload=True),
+    "int8": StorageProfile(
+        on_disk_vectors=True,
+        on_disk_payload=True,
+        quantization=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        oversampling=2.0,
+    ),
+    "binary": StorageProfile(
+        on_disk_vectors=True,
+        on_disk_payload=True,
+        quantization=models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True)),
+        oversampling=3.0,
+    ),
+}
+
+
+def check_partitioning_support(client, partitioning: str) -> None:
+    """启动时检查 Qdrant 服务端是否支持配置的分区方式，不支持时抛出 ValueError"""
+    if partitioning != PARTITION_TENANT:
+        return
+    check_partitioning_version(client.info().version, partitioning)
+
+
+def check_partitioning_version(version: str, partitioning: str) -> None:
+    """服务端版本 version 是否支持配置的分区方式，不支持时抛出 ValueError"""
+    if partitioning != PARTITION_TENANT:
+        return
+    if tuple(int(part) for part in re.findall(r"\d+", version)[:2]) < TENANT_MIN_QDRANT_VERSION:
+        raise ValueError(
+            f"QDRANT_PARTITIONING=tenant 需要 Qdrant >= {'.'.join(map(str, TENANT_MIN_QDRANT_VERSION))}"
+            f"（is_tenant payload 索引），当前服务端版本为 {version}；请升级 Qdrant 或改用 shared / collection_per_kb"
+        )
+
+
+class _VectorStoreBase:
+    """同步/异步 vector store 共用的部分：point 构造、过滤条件、重排，不涉及网络 I/O"""
+
+    def __init__(self, client, collection_name: str, vector_size: Optional[int] = None,
+                 distance: Distance = Distance.COSINE, rescore: bool = False,
+                 partitioning: str = PARTITION_SHARED, storage_profile: str = "memory",
+                 hnsw_config: Optional[models.HnswConfigDiff] = None, hnsw_ef: Optional[int] = None,
+                 upsert_batch_size: int = 256, upsert_parallel: int = 4, upsert_retries: int = 3,
+                 store_text: bool = True):
+        if upsert_batch_size < 1 or upsert_parallel < 1 or upsert_retries < 1:
+            raise ValueError("upsert_batch_size, upsert_parallel and upsert_retries must be positive")
+        if partitioning not in PARTITIONINGS:
+            raise ValueError(f"unknown partitioning: {partitioning}")
+        if storage_profile not in STORAGE_PROFILES:
+            raise ValueError(f"unknown storage profile: {storage_profile}")
         self.client = client
         self.collection_name = collection_name
         self.vector_size = vector_size
         self.distance = distance
-        # 确保 collection 已创建（如果 vector_size 可知）
-        if vector_size is not None:
-            self._ensure_collection(vector_size)
+        # True：拉回原始向量在本地精确重排（仅量化 collection 需要）；False：直接使用服务端得分
+        self.rescore = rescore
+        self.partitioning = partitioning
+        # 创建 collection 时使用的存储方式与 HNSW 参数，已存在的 collection 不受影响（通过 app.reindex 重建生效）
+        self.storage_profile = STORAGE_PROFILES[storage_profile]
+        self.hnsw_config = hnsw_config
+        # 检索时默认的 hnsw_ef，None 使用 collection 配置
+        self.hnsw_ef = hnsw_ef
+        # 写入：每批 point 数、同时发送的批次数、每批最多尝试次数
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_parallel = upsert_parallel
+        self.upsert_retries = upsert_retries
+        # False：payload 只保存 id 与过滤字段（PAYLOAD_INDEXES），块文本从 knowledge_base_chunk 表读取
+        self.store_text = store_text
+        # collection_per_kb 模式下各知识库的 store，最多缓存 KB_STORE_CACHE_SIZE 个
+        self._kb_stores: "OrderedDict[str, _VectorStoreBase]" = OrderedDict()
+        self._kb_stores_lock = threading.Lock()
 
-    def _ensure_collection(self, vector_size: int):
-        # 如果 collection 不存在则创建（兼容 qdrant-client）
-        try:
-            if not self.client.get_collection(self.collection_name, ignore_missing=False):
-                # 如果 get_collection 抛异常说明不存在 —— 使用 create_collection
-                pass
-        except Exception:
-            try:
-                self.client.recreate_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=vector_size, distance=self.distance)
-                )
-            except Exception:
-                # fallback: try create_collection
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=vector_size, distance=self.distance)
-                )
+    def kb_collection_name(self, kb_id: str) -> str:
+        """collection_per_kb 模式下知识库对应的 collection 名"""
+        return f"{self.collection_name}_kb_{uuid.UUID(str(kb_id)).hex}"
+
+    def for_kb(self, kb_id: Optional[str]):
+        """
+        知识库所在分区的 store：collection_per_kb 模式下为绑定到该知识库 collection 的 store（共用 client），
+        其他模式返回自身。按 doc_id 操作的方法（get_document_points 等）应在返回的 store 上调用
+        """
+        if self.partitioning != PARTITION_COLLECTION_PER_KB or not kb_id:
+            return self
+        name = self.kb_collection_name(kb_id)
+        with self._kb_stores_lock:
+            store = self._kb_stores.get(name)
+            if store is not None:
+                self._kb_stores.move_to_end(name)
+                return store
+            store = copy.copy(self)
+            store.collection_name = name
+            store.partitioning = PARTITION_SHARED
+            # 首次写入时创建该知识库的 collection（已存在时按 collection 读取维度）
+            store.vector_size = None
+            store._kb_stores = OrderedDict()
+            store._kb_stores_lock = threading.Lock()
+            self._kb_stores[name] = store
+            while len(self._kb_stores) > KB_STORE_CACHE_SIZE:
+                self._kb_stores.popitem(last=False)
+            return store
 
     @staticmethod
     def _cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
@@ -46,41 +174,356 @@ class QdrantVectorStore:
             return 0.0
         return float(np.dot(a, b) / (na * nb))
 
-    def insert_document(self, kb_id: str, doc_id: str, text_chunks: List[str], embeddings: List[List[float]]) -> int:
-        """
-        向量插入：会校验维度、用确定性 id（便于更新），并批量 upsert
-        """
+    @staticmethod
+    def content_hash(chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_point_id(doc_id: str, chunk: str, content_hash: Optional[str] = None) -> str:
+        """确定性 point id：同一文档中内容相同的块 id 相同，重新入库时可以复用"""
+        content_hash = content_hash or _VectorStoreBase.content_hash(chunk)
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{doc_id}:{content_hash}"))
+
+    def _build_points(self, kb_id: str, doc_id: str, text_chunks: List[str],
+                      embeddings: List[Optional[List[float]]], start_index: int) -> List[PointStruct]:
+        """校验维度并构造 points；embeddings 中为 None 的块跳过"""
         if not embeddings or len(embeddings) != len(text_chunks):
             raise ValueError("embeddings length must match text_chunks length")
+        points = []
+        created_at = datetime.utcnow().isoformat()
+        for i, (chunk, emb) in enumerate(zip(text_chunks, embeddings)):
+            if emb is None:
+                continue
+            if self.vector_size is not None and len(emb) != self.vector_size:
+                raise ValueError(f"vector size mismatch: collection expects {self.vector_size}, got {len(emb)}")
+            payload = {
+                "kb_id": str(kb_id),
+                "doc_id": str(doc_id),
+                "chunk_index": start_index + i,
+            }
+            if self.store_text:
+                payload.update(text=chunk, created_at=created_at, text_length=len(chunk))
+            points.append(PointStruct(id=self.make_point_id(doc_id, chunk), vector=emb, payload=payload))
+        return points
 
-        vector_size = len(embeddings[0])
-        # 如果尚未创建 collection，则基于第一个向量维度创建
-        if self.vector_size is None:
-            self.vector_size = vector_size
+    def _stored_payload(self, payload: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """按 store_text 裁剪已有 payload（重建索引、迁移时使用）"""
+        if self.store_text or payload is None:
+            return payload
+        return {key: value for key, value in payload.items() if key in PAYLOAD_INDEXES}
+
+    def _payload_selector(self, with_payload: Optional[List[str]]) -> List[str]:
+        """检索时返回的 payload 字段，默认 SEARCH_PAYLOAD_FIELDS（不保存文本时去掉 text）"""
+        if with_payload is not None:
+            return list(with_payload)
+        return [field for field in SEARCH_PAYLOAD_FIELDS if self.store_text or field != "text"]
+
+    def _upsert_batches(self, points: List[PointStruct]) -> List[List[PointStruct]]:
+        return [points[i:i + self.upsert_batch_size] for i in range(0, len(points), self.upsert_batch_size)]
+
+    def _retry_options(self) -> Dict[str, Any]:
+        """单个写入批次的重试策略，失败的批次单独重试，不影响其他批次"""
+        return {
+            "stop": stop_after_attempt(self.upsert_retries),
+            "wait": wait_exponential(multiplier=0.5, max=10),
+            "reraise": True,
+        }
+
+    @staticmethod
+    def _doc_filter(doc_id: str) -> Filter:
+        return Filter(must=[FieldCondition(key="doc_id", match=MatchValue(value=str(doc_id)))])
+
+    @staticmethod
+    def _docs_filter(doc_ids: Iterable[str]) -> Filter:
+        return Filter(must=[FieldCondition(key="doc_id", match=models.MatchAny(any=[str(d) for d in doc_ids]))])
+
+    @staticmethod
+    def _kb_filter(kb_id: Optional[str]) -> Optional[Filter]:
+        if not kb_id:
+            return None
+        return Filter(must=[FieldCondition(key="kb_id", match=MatchValue(value=str(kb_id)))])
+
+    @staticmethod
+    def _cosine_scores(query_embedding: List[float], vectors: np.ndarray) -> np.ndarray:
+        """query 与每一行向量的 cosine：一次 float32 矩阵-向量乘法，query 范数只算一次；零向量得分为 0"""
+        q_vec = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(q_vec)
+        dots = vectors @ q_vec
+        return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+    @staticmethod
+    def _to_result(r: Any, score: float) -> Dict[str, Any]:
+        payload = r.payload or {}
+        return {
+            "id": str(r.id),
+            "score": score,
+            "text": payload.get("text", ""),
+            "doc_id": payload.get("doc_id", ""),
+            "kb_id": payload.get("kb_id", ""),
+            "chunk_index": payload.get("chunk_index", 0)
+        }
+
+    def _rerank(self, query_embedding: List[float], search_results: List[Any], limit: int,
+                score_threshold: float) -> List[Dict[str, Any]]:
+        """
+        用本地 cosine 对候选重新打分，返回达到 score_threshold 的得分最高的 limit 条（与服务端过滤的结果一致）
+        """
+        # 没有返回 vector 的候选跳过（不信任 score）
+        results = [r for r in search_results if getattr(r, "vector", None) is not None]
+        if not results or limit <= 0:
+            return []
+        # 直接从 list 展开成连续的 float32 矩阵，不为每个候选单独构造数组
+        dims = len(results[0].vector)
+        matrix = np.fromiter(chain.from_iterable(r.vector for r in results), dtype=np.float32,
+                             count=len(results) * dims).reshape(len(results), dims)
+        scores = self._cosine_scores(query_embedding, matrix)
+        passed = np.flatnonzero(scores >= score_threshold)
+        if len(passed) == 0:
+            return []
+        k = min(limit, len(passed))
+        # argpartition 取 top-k（O(n)），只对这 k 条排序
+        top = passed[np.argpartition(-scores[passed], k - 1)[:k]] if k < len(passed) else passed
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self._to_result(results[i], float(scores[i])) for i in top]
+
+    def _search_params(self, hnsw_ef: Optional[int],
+                       quantization: Optional[models.QuantizationSearchParams]) -> Optional[models.SearchParams]:
+        """检索参数：未指定时 hnsw_ef 取 self.hnsw_ef，量化参数取存储方式的默认值"""
+        hnsw_ef = self.hnsw_ef if hnsw_ef is None else hnsw_ef
+        profile = self.storage_profile
+        if quantization is None and profile.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=profile.quantization_rescore,
+                                                           oversampling=profile.oversampling)
+        if hnsw_ef is None and quantization is None:
+            return None
+        return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+    def _search_request(self, query_embedding: List[float], kb_id: Optional[str], limit: int,
+                        score_threshold: float, candidate_multiplier: int, rescore: bool,
+                        hnsw_ef: Optional[int] = None,
+                        quantization: Optional[models.QuantizationSearchParams] = None,
+                        with_payload: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        query_points 参数：
+         - 默认信任服务端得分（cosine collection 下与本地计算结果相同），score_threshold 交给 Qdrant 过滤，
+           只返回 limit 条且不传输向量
+         - rescore 时拉回 limit * candidate_multiplier 条候选及其向量，由 _rerank 本地打分
+         - payload 只返回 with_payload 中的字段
+        """
+        request = {
+            "collection_name": self.collection_name,
+            "query": query_embedding,
+            "query_filter": self._kb_filter(kb_id),
+            "search_params": self._search_params(hnsw_ef, quantization),
+            "with_payload": self._payload_selector(with_payload),
+        }
+        if rescore:
+            request.update(limit=max(limit * candidate_multiplier, limit), with_vectors=True)
+        else:
+            request.update(limit=limit, score_threshold=score_threshold, with_vectors=False)
+        return request
+
+    def _search_results(self, query_embedding: List[float], points: List[Any], limit: int,
+                        score_threshold: float, rescore: bool) -> List[Dict[str, Any]]:
+        if rescore:
+            return self._rerank(query_embedding, points, limit, score_threshold)
+        return [self._to_result(r, r.score) for r in points]
+
+    def _missing_payload_indexes(self, collection_info) -> Dict[str, Any]:
+        existing = collection_info.payload_schema or {}
+        indexes: Dict[str, Any] = dict(PAYLOAD_INDEXES)
+        if self.partitioning == PARTITION_TENANT:
+            indexes["kb_id"] = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+        return {field: schema for field, schema in indexes.items() if field not in existing}
+
+    def _collection_config(self, vector_size: int) -> Dict[str, Any]:
+        """create_collection 参数：向量维度、距离，以及存储方式与 HNSW 参数"""
+        profile = self.storage_profile
+        hnsw_config = self.hnsw_config
+        if self.partitioning == PARTITION_TENANT:
+            # tenant 模式不建全局图（m=0），只按 kb_id 建子图，m 用作 payload_m
+            hnsw_config = models.HnswConfigDiff(m=0, payload_m=(hnsw_config and hnsw_config.m) or 16,
+                                                ef_construct=hnsw_config and hnsw_config.ef_construct)
+        config = {
+            "collection_name": self.collection_name,
+            "vectors_config": VectorParams(size=vector_size, distance=self.distance,
+                                           on_disk=profile.on_disk_vectors or None),
+            "hnsw_config": hnsw_config,
+            "quantization_config": profile.quantization,
+            "on_disk_payload": profile.on_disk_payload or None,
+        }
+        if profile.memmap_threshold is not None:
+            config["optimizers_config"] = models.OptimizersConfigDiff(memmap_threshold=profile.memmap_threshold)
+        return config
+
+    @staticmethod
+    def _applies_in_order(collection_info) -> bool:
+        """
+        单 shard、单副本时 Qdrant 按 WAL 顺序应用更新，最后一批 wait=True 完成即表示之前的批次已生效；
+        多 shard（各 shard 各自的 WAL）或多副本时没有这个保证
+        """
+        params = collection_info.config.params
+        return (params.shard_number or 1) == 1 and (params.replication_factor or 1) == 1
+
+    def _collection_info(self, collection_info) -> Dict[str, Any]:
+        return {
+            "name": self.collection_name,
+            "indexed_vectors_count": collection_info.indexed_vectors_count,
+            "points_count": collection_info.points_count,
+            "status": collection_info.status,
+            "payload_indexes": sorted((collection_info.payload_schema or {}).keys())
+        }
+
+
+class QdrantVectorStore(_VectorStoreBase):
+    def __init__(self, client, collection_name: str, vector_size: Optional[int] = None, distance: Distance = Distance.COSINE,
+                 hnsw_config: Optional[models.HnswConfigDiff] = None, **options: Any):
+        """其余参数（rescore、partitioning、storage_profile、upsert_* 等）见 _VectorStoreBase"""
+        super().__init__(client, collection_name, vector_size, distance, hnsw_config=hnsw_config, **options)
+        # 确保 collection 已创建（如果 vector_size 可知）
+        if vector_size is not None:
             self._ensure_collection(vector_size)
-        elif self.vector_size != vector_size:
-            raise ValueError(f"vector size mismatch: collection expects {self.vector_size}, got {vector_size}")
 
-        points = []
-        for i, (chunk, emb) in enumerate(zip(text_chunks, embeddings)):
-            # 限制 payload 中 text 的长度，避免过大
-            pts = PointStruct(
-                id=str(uuid.uuid4()),
-                vector=emb,
-                payload={
-                    "kb_id": str(kb_id),
-                    "doc_id": str(doc_id),
-                    "text": chunk,
-                    "chunk_index": i,
-                    "created_at": datetime.utcnow().isoformat(),
-                    "text_length": len(chunk)
-                }
+    def _exists(self) -> bool:
+        """collection_name 可以是 collection 或 alias"""
+        if self.client.collection_exists(self.collection_name):
+            return True
+        return any(alias.alias_name == self.collection_name for alias in self.client.get_aliases().aliases)
+
+    def _ensure_collection(self, vector_size: int):
+        # 只在不存在时创建，绝不重建（recreate 会清空数据）
+        if not self._exists():
+            try:
+                self.client.create_collection(**self._collection_config(vector_size))
+            except Exception:
+                # 并发创建：另一个进程已经创建成功
+                if not self._exists():
+                    raise
+        self.ensure_payload_indexes()
+
+    def ensure_payload_indexes(self) -> List[str]:
+        """
+        为 PAYLOAD_INDEXES 中缺少索引的字段创建 payload 索引，返回新建的字段；已有索引的字段不动，可重复调用
+        对已有数据的 collection，索引在 Qdrant 后台构建（wait=False），不阻塞调用方
+        """
+        if not self._exists():
+            return []
+        missing = self._missing_payload_indexes(self.client.get_collection(self.collection_name))
+        for field, schema in missing.items():
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=schema,
+                wait=False
             )
-            points.append(pts)
+        return list(missing)
+
+    def resolve_collection(self) -> Optional[str]:
+        """alias 指向的实际 collection；collection_name 本身是 collection 时返回自身，不存在返回 None"""
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == self.collection_name:
+                return alias.collection_name
+        return self.collection_name if self.client.collection_exists(self.collection_name) else None
+
+    def get_vector_size(self) -> Optional[int]:
+        if not self._exists():
+            return None
+        vectors = self.client.get_collection(self.collection_name).config.params.vectors
+        return vectors.size
+
+    def swap_alias(self, alias: str, replace_collection: bool = False) -> Optional[str]:
+        """
+        把 alias 原子地切换到当前 collection，返回切换前指向的 collection
+        alias 同名的是一个真实 collection（尚未使用 alias 的旧部署）时，需要 replace_collection=True：
+        先删除该 collection 再创建 alias，切换期间有短暂不可用
+        """
+        previous = None
+        for item in self.client.get_aliases().aliases:
+            if item.alias_name == alias:
+                previous = item.collection_name
+        operations = []
+        if previous is not None:
+            operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+        elif self.client.collection_exists(alias):
+            if not replace_collection:
+                raise ValueError(f"{alias} 是一个 collection 而不是 alias，需要 replace_collection=True")
+            self.client.delete_collection(alias)
+            previous = alias
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=self.collection_name, alias_name=alias)
+        ))
+        # 删除旧 alias 与创建新 alias 在同一个请求中，原子生效
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        return previous
+
+    def iter_points(self, batch_size: int = 512, scroll_filter: Optional[Filter] = None) -> Iterable[List[Any]]:
+        """分批滚动读取全部 point（含向量与 payload）"""
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if records:
+                yield records
+            if offset is None:
+                return
+
+    def upsert_records(self, records: List[Any]) -> int:
+        """写入 scroll 读出的记录（保留 id 与向量，payload 按 store_text 裁剪）"""
+        if not records:
+            return 0
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[PointStruct(id=r.id, vector=r.vector, payload=self._stored_payload(r.payload)) for r in records],
+            wait=True
+        )
+        return len(records)
 
-        # 批量 upsert（等待完成）
+    def _upsert_batch(self, points: List[PointStruct], wait: bool) -> None:
+        for attempt in Retrying(**self._retry_options()):
+            with attempt:
+                self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+
+    def _upsert_points(self, points: List[PointStruct]) -> None:
+        """
+        分批写入：除最后一批外并发发送且不等待索引（wait=False，写入 WAL 即返回），
+        全部被接受后再以 wait=True 发送最后一批作为屏障：Qdrant 按 WAL 顺序应用更新，
+        最后一批应用完成时之前的批次也已生效；这只在单 shard、单副本时成立（_applies_in_order），
+        否则每一批都 wait=True（仍并发发送）
+        """
+        batches = self._upsert_batches(points)
+        if len(batches) > 1:
+            wait = not self._applies_in_order(self.client.get_collection(self.collection_name))
+            with ThreadPoolExecutor(max_workers=min(self.upsert_parallel, len(batches) - 1)) as pool:
+                list(pool.map(lambda batch: self._upsert_batch(batch, wait=wait), batches[:-1]))
+        self._upsert_batch(batches[-1], wait=True)
+
+    def insert_document(self, kb_id: str, doc_id: str, text_chunks: List[str], embeddings: List[Optional[List[float]]],
+                        start_index: int = 0) -> int:
+        """
+        向量插入：会校验维度、用确定性 id（便于更新），并分批并发 upsert（见 _upsert_points）
+        分窗口写入同一文档时，start_index 为本窗口第一块的 chunk_index
+        embeddings 中为 None 的块表示向量已存在（内容未变），不重新写入
+        """
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return store.insert_document(kb_id, doc_id, text_chunks, embeddings, start_index)
+        points = self._build_points(kb_id, doc_id, text_chunks, embeddings, start_index)
+        if not points:
+            return 0
+        # 如果尚未创建 collection，则基于第一个向量维度创建
+        if self.vector_size is None:
+            self.vector_size = len(points[0].vector)
+            self._ensure_collection(self.vector_size)
+
+        # 分批 upsert，返回时全部批次已生效
         try:
-            op = self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+            self._upsert_points(points)
             return len(points)
         except Exception as e:
             print(f"❌ 插入文档失败: {e}")
@@ -92,91 +535,54 @@ class QdrantVectorStore:
             kb_id: Optional[str] = None,
             limit: int = 5,
             score_threshold: float = 0.6,
-            candidate_multiplier: int = 4
+            candidate_multiplier: int = 4,
+            rescore: Optional[bool] = None,
+            hnsw_ef: Optional[int] = None,
+            quantization: Optional[models.QuantizationSearchParams] = None,
+            with_payload: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """
-        检索并用本地 cosine 重新排序：
-         - 先从 qdrant 拉回较多候选（limit * candidate_multiplier）
-         - 使用 with_vectors=True 获取真正向量，在本地用 cosine 进行精确重排和阈值过滤
+        检索：
+         - 默认使用 Qdrant 返回的得分，阈值过滤在服务端完成，不传输向量
+         - rescore=True（默认取 self.rescore）时先拉回 limit * candidate_multiplier 条候选及向量，
+           在本地用 cosine 精确重排，用于量化 collection（服务端得分为近似值）
+         - hnsw_ef / quantization 覆盖本次检索的 HNSW 搜索宽度与量化参数（过采样、是否用原始向量 rescore）
+         - with_payload 为需要返回的 payload 字段，默认 SEARCH_PAYLOAD_FIELDS；
+           不保存文本（store_text=False）时结果的 text 为空，由调用方按 id 从块表读取（ingestion_service.fill_chunk_texts）
         """
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return store.search_similar(query_embedding, kb_id, limit, score_threshold, candidate_multiplier, rescore,
+                                        hnsw_ef, quantization, with_payload)
+        rescore = self.rescore if rescore is None else rescore
         try:
-            # 构建 filter
-            q_filter = None
-            must_conditions = []
-            if kb_id:
-                must_conditions.append(FieldCondition(key="kb_id", match=MatchValue(value=str(kb_id))))
-            if must_conditions:
-                q_filter = Filter(must=must_conditions)
-
-            # 拉回更多候选以便本地重排
-            fetch_n = max(limit * candidate_multiplier, limit)
-
-            # 注意 with_vectors=True，用以本地重新计算相似度
-            search_results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                query_filter=q_filter,
-                limit=fetch_n,
-                with_payload=True,
-                with_vectors=True
+            response = self.client.query_points(
+                **self._search_request(query_embedding, kb_id, limit, score_threshold, candidate_multiplier, rescore,
+                                       hnsw_ef, quantization, with_payload)
             )
-
-            # 计算本地 cosine，并重排
-            candidates = []
-            q_vec = np.array(query_embedding, dtype=float)
-            for r in search_results:
-                if hasattr(r, "vector") and r.vector is not None:
-                    vec = np.array(r.vector, dtype=float)
-                else:
-                    # 如果没有返回 vector，跳过（不做信任score）
-                    continue
-                sim = self._cosine_sim(q_vec, vec)
-                payload = r.payload or {}
-                candidates.append({
-                    "id": str(r.id),
-                    "score": sim,
-                    "text": payload.get("text", ""),
-                    "doc_id": payload.get("doc_id", ""),
-                    "kb_id": payload.get("kb_id", ""),
-                    "chunk_index": payload.get("chunk_index", 0)
-                })
-
-            # 按 score 降序并过滤阈值
-            candidates = sorted(candidates, key=lambda x: x["score"], reverse=True)
-            filtered = [c for c in candidates if c["score"] >= score_threshold]
-
-            # 如果过滤后太少，可以回退到 top-N 无阈值（可选）
-            if len(filtered) < limit:
-                topk = candidates[:limit]
-                return topk
-            else:
-                return filtered[:limit]
-
+            return self._search_results(query_embedding, response.points, limit, score_threshold, rescore)
         except Exception as e:
             print(f"❌ 搜索失败: {e}")
             return []
 
-    def delete_document(self, doc_id: str) -> bool:
+    def delete_document(self, doc_id: str, kb_id: Optional[str] = None) -> bool:
         """
         删除文档的所有文本块
 
         Args:
             doc_id: 文档ID
+            kb_id: 文档所属知识库（collection_per_kb 模式下必须提供）
 
         Returns:
             是否成功删除
         """
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return store.delete_document(doc_id)
         try:
             self.client.delete(
                 collection_name=self.collection_name,
-                points_selector=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="doc_id",
-                            match=models.MatchValue(value=str(doc_id))
-                        )
-                    ]
-                )
+                points_selector=self._doc_filter(doc_id)
             )
             print(f"✅ 已删除文档 {doc_id} 的所有文本块")
             return True
@@ -185,16 +591,108 @@ class QdrantVectorStore:
             print(f"❌ 删除文档失败: {e}")
             return False
 
+    def delete_documents(self, doc_ids: Iterable[str], kb_id: Optional[str] = None) -> int:
+        """按 doc_id 批量删除（一次请求），返回文档数；kb_id 为文档所属知识库（collection_per_kb 模式下必须提供）"""
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return store.delete_documents(doc_ids)
+        doc_ids = list(doc_ids)
+        if doc_ids and self._exists():
+            self.client.delete(collection_name=self.collection_name, points_selector=self._docs_filter(doc_ids),
+                               wait=True)
+        return len(doc_ids)
+
+    def delete_knowledge_base(self, kb_id: str) -> None:
+        """删除知识库的所有 point：collection_per_kb 模式下删除其 collection，否则按 kb_id 过滤删除"""
+        store = self.for_kb(kb_id)
+        if store is not self:
+            if store._exists():
+                self.client.delete_collection(store.collection_name)
+            with self._kb_stores_lock:
+                self._kb_stores.pop(store.collection_name, None)
+            return
+        if self._exists():
+            self.client.delete(collection_name=self.collection_name, points_selector=self._kb_filter(kb_id),
+                               wait=True)
+
+    def partition_stores(self) -> List["QdrantVectorStore"]:
+        """所有已存在的分区：共用 collection，以及 collection_per_kb 模式下各知识库的 collection"""
+        stores = [self] if self._exists() else []
+        if self.partitioning == PARTITION_COLLECTION_PER_KB:
+            prefix = f"{self.collection_name}_kb_"
+            for collection in self.client.get_collections().collections:
+                if collection.name.startswith(prefix):
+                    stores.append(self.for_kb(collection.name[len(prefix):]))
+        return stores
+
+    def iter_doc_ids(self, batch_size: int = 1000) -> Iterable[set]:
+        """分批滚动读取 point 的 doc_id（不拉取向量），每批返回去重后的 doc_id 集合"""
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["doc_id"],
+                with_vectors=False
+            )
+            doc_ids = {(record.payload or {}).get("doc_id") for record in records} - {None}
+            if doc_ids:
+                yield doc_ids
+            if offset is None:
+                return
+
+    def get_document_points(self, doc_id: str, batch_size: int = 1000) -> Dict[str, int]:
+        """获取文档已有的 point id 及其 chunk_index（不拉取向量）"""
+        points: Dict[str, int] = {}
+        if not self._exists():
+            return points
+        doc_filter = self._doc_filter(doc_id)
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=doc_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["chunk_index"],
+                with_vectors=False
+            )
+            for record in records:
+                points[str(record.id)] = (record.payload or {}).get("chunk_index", 0)
+            if offset is None:
+                return points
+
+    def set_chunk_indexes(self, chunk_indexes: Dict[str, int], batch_size: int = 500) -> None:
+        """只更新已有 point 的 chunk_index（文档中位置变化但内容未变的块）"""
+        items = list(chunk_indexes.items())
+        for i in range(0, len(items), batch_size):
+            self.client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=[
+                    models.SetPayloadOperation(
+                        set_payload=models.SetPayload(payload={"chunk_index": index}, points=[point_id])
+                    )
+                    for point_id, index in items[i:i + batch_size]
+                ],
+                wait=True
+            )
+
+    def delete_points(self, point_ids: Iterable[str], batch_size: int = 1000) -> int:
+        """按 id 批量删除"""
+        ids = list(point_ids)
+        for i in range(0, len(ids), batch_size):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=ids[i:i + batch_size]),
+                wait=True
+            )
+        return len(ids)
+
     def get_collection_info(self) -> Dict[str, Any]:
         """获取集合信息"""
         try:
-            collection_info = self.client.get_collection(self.collection_name)
-            return {
-                "name": collection_info.name,
-                "vectors_count": collection_info.vectors_count,
-                "points_count": collection_info.points_count,
-                "status": collection_info.status
-            }
+            return self._collection_info(self.client.get_collection(self.collection_name))
         except Exception as e:
             print(f"❌ 获取集合信息失败: {e}")
             return {}
@@ -208,3 +706,149 @@ class QdrantVectorStore:
             print(f"❌ Qdrant 连接失败: {e}")
             return False
 
+
+class AsyncQdrantVectorStore(_VectorStoreBase):
+    """
+    基于 AsyncQdrantClient 的 QdrantVectorStore，接口一致（方法为协程），供 async 路由使用，
+    请求之间的 Qdrant I/O 可以在同一个事件循环中重叠
+    """
+
+    async def _exists(self) -> bool:
+        if await self.client.collection_exists(self.collection_name):
+            return True
+        aliases = await self.client.get_aliases()
+        return any(alias.alias_name == self.collection_name for alias in aliases.aliases)
+
+    async def _ensure_collection(self, vector_size: int) -> None:
+        # 只在不存在时创建，绝不重建
+        if not await self._exists():
+            try:
+                await self.client.create_collection(**self._collection_config(vector_size))
+            except Exception:
+                if not await self._exists():
+                    raise
+        await self.ensure_payload_indexes()
+
+    async def ensure_payload_indexes(self) -> List[str]:
+        """同 QdrantVectorStore.ensure_payload_indexes"""
+        if not await self._exists():
+            return []
+        missing = self._missing_payload_indexes(await self.client.get_collection(self.collection_name))
+        for field, schema in missing.items():
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=schema,
+                wait=False
+            )
+        return list(missing)
+
+    async def _upsert_batch(self, points: List[PointStruct], wait: bool) -> None:
+        async for attempt in AsyncRetrying(**self._retry_options()):
+            with attempt:
+                await self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+
+    async def _upsert_points(self, points: List[PointStruct]) -> None:
+        """同 QdrantVectorStore._upsert_points"""
+        batches = self._upsert_batches(points)
+        if len(batches) > 1:
+            wait = not self._applies_in_order(await self.client.get_collection(self.collection_name))
+            semaphore = asyncio.Semaphore(self.upsert_parallel)
+
+            async def send(batch: List[PointStruct]) -> None:
+                async with semaphore:
+                    await self._upsert_batch(batch, wait=wait)
+
+            await asyncio.gather(*(send(batch) for batch in batches[:-1]))
+        await self._upsert_batch(batches[-1], wait=True)
+
+    async def insert_document(self, kb_id: str, doc_id: str, text_chunks: List[str],
+                              embeddings: List[Optional[List[float]]], start_index: int = 0) -> int:
+        """同 QdrantVectorStore.insert_document"""
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return await store.insert_document(kb_id, doc_id, text_chunks, embeddings, start_index)
+        points = self._build_points(kb_id, doc_id, text_chunks, embeddings, start_index)
+        if not points:
+            return 0
+        if self.vector_size is None:
+            self.vector_size = len(points[0].vector)
+            await self._ensure_collection(self.vector_size)
+        try:
+            await self._upsert_points(points)
+            return len(points)
+        except Exception as e:
+            print(f"❌ 插入文档失败: {e}")
+            raise
+
+    async def search_similar(
+            self,
+            query_embedding: List[float],
+            kb_id: Optional[str] = None,
+            limit: int = 5,
+            score_threshold: float = 0.6,
+            candidate_multiplier: int = 4,
+            rescore: Optional[bool] = None,
+            hnsw_ef: Optional[int] = None,
+            quantization: Optional[models.QuantizationSearchParams] = None,
+            with_payload: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """同 QdrantVectorStore.search_similar"""
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return await store.search_similar(query_embedding, kb_id, limit, score_threshold, candidate_multiplier,
+                                              rescore, hnsw_ef, quantization, with_payload)
+        rescore = self.rescore if rescore is None else rescore
+        try:
+            response = await self.client.query_points(
+                **self._search_request(query_embedding, kb_id, limit, score_threshold, candidate_multiplier, rescore,
+                                       hnsw_ef, quantization, with_payload)
+            )
+            return self._search_results(query_embedding, response.points, limit, score_threshold, rescore)
+        except Exception as e:
+            print(f"❌ 搜索失败: {e}")
+            return []
+
+    async def delete_document(self, doc_id: str, kb_id: Optional[str] = None) -> bool:
+        """删除文档的所有文本块"""
+        store = self.for_kb(kb_id)
+        if store is not self:
+            return await store.delete_document(doc_id)
+        try:
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=self._doc_filter(doc_id)
+            )
+            print(f"✅ 已删除文档 {doc_id} 的所有文本块")
+            return True
+        except Exception as e:
+            print(f"❌ 删除文档失败: {e}")
+            return False
+
+    async def delete_points(self, point_ids: Iterable[str], batch_size: int = 1000) -> int:
+        """按 id 批量删除"""
+        ids = list(point_ids)
+        for i in range(0, len(ids), batch_size):
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=ids[i:i + batch_size]),
+                wait=True
+            )
+        return len(ids)
+
+    async def get_collection_info(self) -> Dict[str, Any]:
+        """获取集合信息"""
+        try:
+            return self._collection_info(await self.client.get_collection(self.collection_name))
+        except Exception as e:
+            print(f"❌ 获取集合信息失败: {e}")
+            return {}
+
+    async def check_connection(self) -> bool:
+        """检查 Qdrant 连接"""
+        try:
+            await self.client.get_collections()
+            return True
+        except Exception as e:
+            print(f"❌ Qdrant 连接失败: {e}")
+            return False
@@ -1,9 +1,39 @@
 import os
-from typing import Generator, Optional
+import uuid
+import fcntl
+import hashlib
+import threading
+from typing import Any, Dict, Generator, Optional, Tuple
 from fastapi.responses import StreamingResponse
 import aiofiles
 
 
+class FileTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"文件大小超过限制: {max_size} bytes")
+        self.max_size = max_size
+
+
+class UploadOffsetMismatchError(ValueError):
+    """断点续传：写入起点与已接收字节数不一致"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"上传偏移量不一致，已接收 {offset} bytes")
+        self.offset = offset
+
+
+class UploadInProgressError(RuntimeError):
+    """断点续传：同一个上传会话正在被另一个请求写入"""
+
+
+# 断点续传的增量 md5：upload_id -> (已计算的字节数, hasher)
+# 只在当前进程内有效，偏移量对不上（如请求落到了另一个进程）时从磁盘重新计算
+_part_hashers: Dict[str, Tuple[int, Any]] = {}
+_part_hashers_lock = threading.Lock()
+
+
 class LocalStorage:
     """FastAPI implementation for local storage."""
 
@@ -57,6 +87,163 @@ class LocalStorage:
         print(f"File saved: {full_path}")
         return full_path
 
+    async def save_upload_stream(self, filename: str, upload_file, max_size: Optional[int] = None,
+                                 chunk_size: int = 1024 * 1024) -> Tuple[str, int, str]:
+        """
+        流式保存上传的文件：分块写入临时文件，同时增量计算 md5
+        超过 max_size 立即中止并删除临时文件，内存占用只与 chunk_size 有关
+
+        Returns:
+            (临时文件路径, 文件大小, 文件hash)，需调用 commit_upload 或 discard 处理临时文件
+        """
+        full_path = self._get_full_path(filename)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.part"
+
+        hasher = hashlib.md5()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                while chunk := await upload_file.read(chunk_size):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLargeError(max_size)
+                    hasher.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, size, hasher.hexdigest()
+
+    def save_fileobj(self, filename: str, fileobj, max_size: Optional[int] = None,
+                     chunk_size: int = 1024 * 1024) -> Tuple[str, int, str]:
+        """save_upload_stream 的同步版本，用于压缩包成员等同步文件对象（在线程池中调用）"""
+        full_path = self._get_full_path(filename)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.part"
+
+        hasher = hashlib.md5()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                while chunk := fileobj.read(chunk_size):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLargeError(max_size)
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, size, hasher.hexdigest()
+
+    def doc_path(self, doc_id: uuid.UUID, file_hash: str, filename: str) -> str:
+        """
+        文档文件的正式路径 docs/{doc_id}/{hash}{扩展名}：
+        不同知识库的同名文件、同一文档的不同版本各自一个文件，入库任务读取时不会被后来的上传覆盖
+        """
+        return self._get_full_path(
+            os.path.join("docs", str(doc_id), f"{file_hash}{os.path.splitext(filename)[1].lower()}")
+        )
+
+    def commit_upload(self, tmp_path: str, full_path: str) -> str:
+        """将临时文件移动到正式路径（doc_path 的返回值）"""
+        if not full_path.startswith(self.folder):
+            raise ValueError("Invalid path: outside storage folder")
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(tmp_path, full_path)
+        print(f"File saved: {full_path}")
+        return full_path
+
+    async def discard(self, tmp_path: str) -> None:
+        """删除临时文件"""
+        self.remove_path(tmp_path)
+
+    def remove_path(self, path: str) -> bool:
+        """同步删除存储目录内的文件（worker 使用），文件不存在或不在存储目录内返回 False"""
+        if path.startswith(self.folder) and os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def _part_path(self, upload_id: str) -> str:
+        return self._get_full_path(os.path.join(".uploads", f"{upload_id}.part"))
+
+    def part_size(self, upload_id: str) -> int:
+        """断点续传：已写入磁盘的字节数"""
+        part_path = self._part_path(upload_id)
+        return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    def _part_hasher(self, upload_id: str, part_path: str, size: int):
+        """取出与磁盘上字节数一致的 hasher，没有则从磁盘重新计算"""
+        with _part_hashers_lock:
+            cached = _part_hashers.pop(upload_id, None)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        hasher = hashlib.md5()
+        if size:
+            with open(part_path, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    hasher.update(chunk)
+        return hasher
+
+    async def append_part(self, upload_id: str, offset: int, stream, max_size: int) -> int:
+        """
+        断点续传：把 stream 中的字节追加写入分片文件，同时增量计算 md5
+         - offset 必须等于已写入的字节数，否则抛出 UploadOffsetMismatchError
+         - 写入中途断开时已写入的字节保留，客户端查询 offset 后只需补传剩余部分
+
+        Returns:
+            写入后的字节数
+        """
+        part_path = self._part_path(upload_id)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        async with aiofiles.open(part_path, "ab") as f:
+            # 文件锁：同一会话的并发写入（可能在不同进程）直接拒绝
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadInProgressError("上传会话正在写入中")
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise UploadOffsetMismatchError(size)
+            hasher = self._part_hasher(upload_id, part_path, size)
+            try:
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    if size + len(chunk) > max_size:
+                        raise FileTooLargeError(max_size)
+                    await f.write(chunk)
+                    await f.flush()
+                    hasher.update(chunk)
+                    size += len(chunk)
+            finally:
+                with _part_hashers_lock:
+                    _part_hashers[upload_id] = (size, hasher)
+        return size
+
+    def finish_part(self, upload_id: str) -> Tuple[str, int, str]:
+        """
+        断点续传：结束写入，返回 (分片文件路径, 文件大小, 文件hash)
+        分片文件需调用 commit_upload 或 discard 处理
+        """
+        part_path = self._part_path(upload_id)
+        size = self.part_size(upload_id)
+        hasher = self._part_hasher(upload_id, part_path, size)
+        return part_path, size, hasher.hexdigest()
+
+    async def discard_part(self, upload_id: str) -> None:
+        self.remove_part(upload_id)
+
+    def remove_part(self, upload_id: str) -> bool:
+        """删除断点续传的分片文件及缓存的 md5 状态"""
+        with _part_hashers_lock:
+            _part_hashers.pop(upload_id, None)
+        return self.remove_path(self._part_path(upload_id))
+
     async def load_once(self, filename: str) -> bytes:
         """异步一次性加载整个文件内容"""
         full_path = self._get_full_path(filename)
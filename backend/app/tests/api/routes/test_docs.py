@@ -0,0 +1,189 @@
+import io
+import os
+import uuid
+import zipfile
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.main import app
+from app.models.ingestion_job import IngestionJob
+from app.models.knowledge_base_file import KnowledgeBaseFile
+from app.storage.local_storage import LocalStorage, get_local_storage
+from app.tests.utils.knowledge_base import create_random_knowledge_base
+from app.tests.utils.utils import random_lower_string
+
+
+@pytest.fixture
+def storage(tmp_path: Path) -> Generator[LocalStorage, None, None]:
+    storage = LocalStorage(str(tmp_path / "storage"))
+    app.dependency_overrides[get_local_storage] = lambda: storage
+    yield storage
+    app.dependency_overrides.pop(get_local_storage, None)
+
+
+def _content() -> bytes:
+    # 内容随机，不与其他测试上传的文件 hash 重复
+    return f"{random_lower_string()}\n".encode()
+
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _stored_files(storage: LocalStorage) -> list[str]:
+    """存储目录下的所有文件（含未清理的临时文件 *.part）"""
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(storage.folder) for name in names)
+
+
+def _bulk_upload(client: TestClient, headers: dict[str, str], kb_id, files: list[tuple[str, bytes]]):
+    return client.post(
+        f"{settings.API_V1_STR}/kb/{kb_id}/docs/bulk-upload",
+        headers=headers,
+        files=[("files", (name, data)) for name, data in files],
+    )
+
+
+def test_bulk_upload_reports_each_file(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, storage: LocalStorage
+) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    existing = _content()
+    response = _bulk_upload(client, normal_user_token_headers, knowledge_base.id, [("existing.txt", existing)])
+    assert response.status_code == 202
+    same = _content()
+
+    response = _bulk_upload(client, normal_user_token_headers, knowledge_base.id, [
+        ("a.txt", same),
+        ("b.md", _content()),
+        ("copy.txt", same),
+        ("again.txt", existing),
+        ("image.png", b"png"),
+        ("bundle.zip", _zip({"docs/c.txt": _content(), "docs/a.txt": _content(), "notes.bin": b"bin"})),
+        ("broken.zip", b"not a zip"),
+    ])
+
+    assert response.status_code == 202
+    content = response.json()
+    statuses = [(item["name"], item["status"]) for item in content["data"]]
+    assert statuses == [
+        ("a.txt", "queued"),
+        ("b.md", "queued"),
+        ("copy.txt", "duplicate"),
+        ("again.txt", "duplicate"),
+        ("image.png", "skipped"),
+        ("c.txt", "queued"),
+        ("a.txt", "error"),
+        ("notes.bin", "skipped"),
+        ("broken.zip", "error"),
+    ]
+    assert content["count"] == 9
+    assert content["queued"] == 3
+    queued = [item for item in content["data"] if item["status"] == "queued"]
+    for item in queued:
+        knowledge_base_file = db.get(KnowledgeBaseFile, uuid.UUID(item["doc_id"]))
+        assert knowledge_base_file.knowledge_base_id == knowledge_base.id
+        assert os.path.exists(knowledge_base_file.storage.removeprefix("local:"))
+        job = db.get(IngestionJob, uuid.UUID(item["job_id"]))
+        assert job.doc_id == knowledge_base_file.id
+        assert job.status == "pending"
+    # 被拒绝的文件不留下临时文件：只有第一次上传的文件和本次入库的 3 个文件
+    assert len(_stored_files(storage)) == 4
+    assert not [path for path in _stored_files(storage) if path.endswith(".part")]
+
+
+def test_bulk_upload_rolls_back_when_a_file_cannot_be_moved(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, storage: LocalStorage, monkeypatch
+) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    commit_upload = storage.commit_upload
+    moved = []
+
+    def fail_second(tmp_path: str, file_path: str) -> None:
+        if moved:
+            raise OSError("disk full")
+        commit_upload(tmp_path, file_path)
+        moved.append(file_path)
+
+    monkeypatch.setattr(storage, "commit_upload", fail_second)
+
+    response = _bulk_upload(client, normal_user_token_headers, knowledge_base.id,
+                            [("a.txt", _content()), ("b.txt", _content())])
+
+    assert response.status_code == 500
+    assert "disk full" in response.json()["detail"]
+    # 整批不入库：没有文件记录与任务，已移动的文件被删除
+    db.expire_all()
+    files = db.exec(select(KnowledgeBaseFile).where(KnowledgeBaseFile.knowledge_base_id == knowledge_base.id)).all()
+    jobs = db.exec(select(IngestionJob).where(IngestionJob.knowledge_base_id == knowledge_base.id)).all()
+    assert files == [] and jobs == []
+    assert len(moved) == 1 and not os.path.exists(moved[0])
+    assert _stored_files(storage) == []
+
+
+@pytest.mark.usefixtures("storage")
+def test_probe_file_hashes(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    response = _bulk_upload(client, normal_user_token_headers, knowledge_base.id, [("a.txt", _content())])
+    uploaded = response.json()["data"][0]
+    knowledge_base_file = db.get(KnowledgeBaseFile, uuid.UUID(uploaded["doc_id"]))
+    missing = random_lower_string()
+
+    response = client.post(
+        f"{settings.API_V1_STR}/docs/exists",
+        headers=normal_user_token_headers,
+        json={"hashes": [missing, knowledge_base_file.file_hash, missing]},
+    )
+
+    assert response.status_code == 200
+    content = response.json()
+    assert content["existing"] == [{
+        "file_hash": knowledge_base_file.file_hash,
+        "doc_id": str(knowledge_base_file.id),
+        "knowledge_base_id": str(knowledge_base.id),
+        "name": "a.txt",
+    }]
+    # 重复提交的 hash 只返回一次
+    assert content["missing"] == [missing]
+
+
+@pytest.mark.usefixtures("storage")
+def test_probe_file_hashes_ignores_deleted_files(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    response = _bulk_upload(client, normal_user_token_headers, knowledge_base.id, [("a.txt", _content())])
+    knowledge_base_file = db.get(KnowledgeBaseFile, uuid.UUID(response.json()["data"][0]["doc_id"]))
+    knowledge_base_file.status = 0
+    db.add(knowledge_base_file)
+    db.commit()
+
+    response = client.post(
+        f"{settings.API_V1_STR}/docs/exists",
+        headers=normal_user_token_headers,
+        json={"hashes": [knowledge_base_file.file_hash]},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"existing": [], "missing": [knowledge_base_file.file_hash]}
+
+
+def test_probe_file_hashes_requires_hashes(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/docs/exists",
+        headers=normal_user_token_headers,
+        json={"hashes": []},
+    )
+    assert response.status_code == 422
@@ -0,0 +1,46 @@
+import asyncio
+
+from app.core.clients import ClientRegistry
+
+
+class _Client:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_registry_creates_once_and_recreates_after_fork() -> None:
+    registry = ClientRegistry()
+    created = []
+
+    def factory(_):
+        created.append(_Client())
+        return created[-1]
+
+    assert registry._clients == {}
+    assert registry._get("qdrant_client", factory) is registry._get("qdrant_client", factory)
+    assert len(created) == 1
+
+    # 模拟 fork 出的子进程：不复用也不关闭父进程的客户端
+    registry._pid = -1
+    assert registry._get("qdrant_client", factory) is created[1]
+    assert not created[0].closed
+
+
+def test_aclose_closes_clients() -> None:
+    registry = ClientRegistry()
+    sync_client = registry._get("qdrant_client", lambda _: _Client())
+    closed = []
+
+    class _AsyncClient:
+        async def close(self) -> None:
+            closed.append(True)
+
+    registry._get("async_qdrant_client", lambda _: _AsyncClient())
+
+    asyncio.run(registry.aclose())
+
+    assert sync_client.closed and closed == [True]
+    assert registry._clients == {}
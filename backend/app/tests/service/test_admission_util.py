@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from app.service.admission_util import AdmissionGovernor, GovernorBusyError
+
+
+def test_slot_rejects_when_queue_is_full() -> None:
+    governor = AdmissionGovernor("test", max_concurrency=1, rate_per_second=100, burst=10,
+                                 max_queue=1, max_wait=5)
+    release = threading.Event()
+    entered = threading.Event()
+
+    def hold() -> None:
+        with governor.slot():
+            entered.set()
+            release.wait()
+
+    def queued() -> None:
+        with governor.slot():
+            pass
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert entered.wait(timeout=5)
+    waiter = threading.Thread(target=queued)
+    waiter.start()
+    while governor.stats()["queue_depth"] < 1:
+        time.sleep(0.01)
+    try:
+        with pytest.raises(GovernorBusyError) as exc_info:
+            with governor.slot():
+                pass
+        assert exc_info.value.retry_after >= 1
+    finally:
+        release.set()
+        holder.join()
+        waiter.join()
+
+    stats = governor.stats()
+    assert stats["admitted"] == 2
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_slot_waits_for_tokens_after_burst() -> None:
+    governor = AdmissionGovernor("test", max_concurrency=4, rate_per_second=20, burst=2,
+                                 max_queue=10, max_wait=5)
+    start = time.monotonic()
+
+    for _ in range(4):
+        with governor.slot():
+            pass
+
+    # burst 2 个立即放行，后 2 个各等约 1/20 秒
+    assert time.monotonic() - start >= 0.09
+    assert governor.stats()["wait_seconds"]["count"] == 4
+
+
+def test_slot_gives_up_after_max_wait() -> None:
+    governor = AdmissionGovernor("test", max_concurrency=1, rate_per_second=0.1, burst=1,
+                                 max_queue=10, max_wait=0.2)
+    with governor.slot():
+        pass
+
+    with pytest.raises(GovernorBusyError):
+        with governor.slot():
+            pass
+    assert governor.stats()["queue_depth"] == 0
+
+
+def test_slot_does_not_hold_concurrency_while_waiting_for_token() -> None:
+    governor = AdmissionGovernor("test", max_concurrency=1, rate_per_second=2, burst=1,
+                                 max_queue=10, max_wait=5)
+    with governor.slot():
+        pass
+
+    def queued() -> None:
+        with governor.slot():
+            pass
+
+    waiter = threading.Thread(target=queued)
+    waiter.start()
+    while governor.stats()["queue_depth"] < 1:
+        time.sleep(0.01)
+
+    # 等待令牌的调用不占用并发名额
+    assert governor._semaphore.acquire(blocking=False)
+    governor._semaphore.release()
+    waiter.join()
+
+
+def test_slot_returns_token_when_concurrency_wait_times_out() -> None:
+    governor = AdmissionGovernor("test", max_concurrency=1, rate_per_second=0.1, burst=2,
+                                 max_queue=10, max_wait=0.1)
+    with governor.slot():
+        # 令牌已取到但等不到并发名额，放回令牌
+        with pytest.raises(GovernorBusyError):
+            with governor.slot():
+                pass
+
+    with governor.slot():
+        pass
+    assert governor.stats()["admitted"] == 2
@@ -0,0 +1,101 @@
+import threading
+from pathlib import Path
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.service.embedding_util import CachedEmbeddings, EmbeddingBatcher, EmbeddingCache
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.calls: list[list[str]] = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            self.calls.append(texts)
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise RuntimeError("rate limited")
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_embed_documents_keeps_order_across_batches() -> None:
+    fake = FakeEmbeddings()
+    batcher = EmbeddingBatcher(fake, batch_size=3, max_concurrency=4)
+    texts = ["a" * i for i in range(1, 11)]
+
+    vectors = batcher.embed_documents(texts)
+
+    assert vectors == [[float(i)] for i in range(1, 11)]
+    assert sorted(len(c) for c in fake.calls) == [1, 3, 3, 3]
+
+
+def test_embed_in_batches_retries_failed_batch() -> None:
+    fake = FakeEmbeddings(fail_times=1)
+    batcher = EmbeddingBatcher(fake, batch_size=2, max_concurrency=1, max_retries=2)
+    progress: list[int] = []
+
+    vectors = batcher.embed_in_batches(["a", "bb", "ccc"], on_progress=progress.append)
+
+    assert vectors == [[1.0], [2.0], [3.0]]
+    assert progress == [2, 3]
+    assert len(fake.calls) == 3
+
+
+def test_embed_in_batches_raises_after_max_retries() -> None:
+    fake = FakeEmbeddings(fail_times=5)
+    batcher = EmbeddingBatcher(fake, batch_size=2, max_concurrency=1, max_retries=2)
+
+    with pytest.raises(RuntimeError):
+        batcher.embed_documents(["a", "b"])
+
+
+def test_cached_embeddings_only_embeds_misses(tmp_path: Path) -> None:
+    fake = FakeEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+    cached = CachedEmbeddings(EmbeddingBatcher(fake, batch_size=8), cache=cache, namespace="test:1")
+
+    assert cached.embed_documents(["a", "bb", "a"]) == [[1.0], [2.0], [1.0]]
+    assert fake.calls == [["a", "bb"]]
+
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0], [3.0]]
+    assert fake.calls[-1] == ["ccc"]
+    assert cached.embed_query("a") == [1.0]
+    assert len(fake.calls) == 2
+
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    # 每个向量 4 bytes，容量 3 条
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=12)
+    cache.put_many({"k1": [1.0], "k2": [2.0], "k3": [3.0]})
+    cache.get_many(["k1"])
+
+    cache.put_many({"k4": [4.0]})
+
+    assert set(cache.get_many(["k1", "k2", "k3", "k4"])) == {"k1", "k4"}
+    assert cache.stats()["bytes"] == 8
+
+
+def test_embedding_cache_get_many_defers_stats(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024, flush_seconds=3600)
+    cache.put_many({"k1": [1.0]})
+    conn = cache._connect()
+
+    cache.get_many(["k1", "k2"])
+
+    # 读取不写入 stats 表，查看统计时才写入
+    assert dict(conn.execute("SELECT name, value FROM stats").fetchall())["hits"] == 0
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
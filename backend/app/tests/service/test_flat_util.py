@@ -0,0 +1,127 @@
+import asyncio
+import uuid
+
+import pytest
+
+from qdrant_client import QdrantClient
+
+from app.service.flat_util import AsyncRoutedVectorStore, FlatVectorStore, RoutedVectorStore
+from app.service.qdrant_util import QdrantVectorStore
+
+CHUNKS = ["a", "b", "c"]
+VECTORS = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+
+
+def test_flat_store_matches_qdrant_search(tmp_path) -> None:
+    flat = FlatVectorStore(str(tmp_path))
+    qdrant = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    kb_id, doc_id = uuid.uuid4(), uuid.uuid4()
+    for store in (flat, qdrant):
+        store.insert_document(kb_id, doc_id, CHUNKS, VECTORS)
+
+    expected = qdrant.search_similar([1.0, 0.2], kb_id=kb_id, limit=2, score_threshold=0.5)
+    results = flat.search_similar([1.0, 0.2], kb_id=kb_id, limit=2, score_threshold=0.5)
+
+    assert [r["id"] for r in results] == [r["id"] for r in expected]
+    assert [r["score"] for r in results] == pytest.approx([r["score"] for r in expected], abs=1e-6)
+    assert [r["text"] for r in results] == ["a", "c"]
+    assert flat.search_similar([1.0, 0.0], kb_id=uuid.uuid4()) == []
+
+
+def test_flat_store_overwrites_and_deletes(tmp_path) -> None:
+    store = FlatVectorStore(str(tmp_path)).for_kb(uuid.uuid4())
+    doc_id, other_doc_id = uuid.uuid4(), uuid.uuid4()
+    store.insert_document(store.kb_id, doc_id, CHUNKS, VECTORS)
+    # 同一内容的块 id 确定，重复写入覆盖而不是追加
+    store.insert_document(store.kb_id, doc_id, CHUNKS, VECTORS)
+    store.insert_document(store.kb_id, other_doc_id, ["x"], [[1.0, 0.0]])
+    assert store.count() == 4
+    assert sorted(store.get_document_points(doc_id).values()) == [0, 1, 2]
+
+    store.delete_document(doc_id)
+
+    assert store.count() == 1
+    assert store.get_document_points(doc_id) == {}
+    assert list(store.iter_doc_ids()) == [{str(other_doc_id)}]
+
+
+def test_router_migrates_large_knowledge_base_to_qdrant(tmp_path) -> None:
+    qdrant = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    router = RoutedVectorStore(qdrant, FlatVectorStore(str(tmp_path)), max_flat_chunks=3)
+    kb_id = uuid.uuid4()
+    router.insert_document(kb_id, uuid.uuid4(), CHUNKS[:2], VECTORS[:2])
+    assert router.flat.count(kb_id) == 2
+
+    # 第二次写入时未达到上限，仍写入本地；第三次写入前迁移到 Qdrant
+    router.insert_document(kb_id, uuid.uuid4(), ["c"], [[1.0, 1.0]])
+    router.insert_document(kb_id, uuid.uuid4(), ["d"], [[0.0, 1.0]])
+
+    assert router.flat.count(kb_id) == 0
+    assert router.flat.for_kb(kb_id).is_migrated()
+    assert qdrant.client.count("test").count == 4
+    results = router.search_similar([1.0, 0.0], kb_id=kb_id, limit=1, score_threshold=0.5)
+    assert [r["text"] for r in results] == ["a"]
+
+
+def test_flat_store_appends_segments_without_rewriting(tmp_path) -> None:
+    store = FlatVectorStore(str(tmp_path)).for_kb(uuid.uuid4())
+    store.insert_document(store.kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+    segments_dir = tmp_path / uuid.UUID(store.kb_id).hex / "segments"
+    first = {p.name for p in segments_dir.iterdir()}
+
+    store.insert_document(store.kb_id, uuid.uuid4(), ["x"], [[1.0, 0.0]])
+
+    # 新文档只追加一个段，已有的段不重写
+    assert first < {p.name for p in segments_dir.iterdir()}
+    assert len(list(segments_dir.iterdir())) == 2
+    results = store.search_similar([1.0, 0.0], limit=2, score_threshold=0.9)
+    assert sorted(r["text"] for r in results) == ["a", "x"]
+
+
+def test_router_migrates_when_one_document_exceeds_the_limit(tmp_path) -> None:
+    qdrant = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    router = RoutedVectorStore(qdrant, FlatVectorStore(str(tmp_path)), max_flat_chunks=3)
+    kb_id, doc_id = uuid.uuid4(), uuid.uuid4()
+    store = router.for_kb(kb_id)
+    chunks = [f"chunk {i}" for i in range(6)]
+    vectors = [[1.0, float(i)] for i in range(6)]
+
+    # 同一个任务按窗口写入：第二个窗口写入前超过上限，迁移后继续写入 Qdrant
+    for start in range(0, 6, 2):
+        store.insert_document(kb_id, doc_id, chunks[start:start + 2], vectors[start:start + 2], start_index=start)
+
+    assert router.flat.count(kb_id) == 0
+    assert qdrant.client.count("test").count == 6
+    assert sorted(store.get_document_points(doc_id).values()) == list(range(6))
+
+
+def test_async_router_searches_flat_store(tmp_path) -> None:
+    flat = FlatVectorStore(str(tmp_path))
+    kb_id = uuid.uuid4()
+    flat.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+    router = AsyncRoutedVectorStore(qdrant=None, flat=flat)
+
+    results = asyncio.run(router.search_similar([1.0, 0.0], kb_id=kb_id, limit=1, score_threshold=0.5))
+
+    assert [r["text"] for r in results] == ["a"]
+
+
+def test_flat_store_drops_segments_replaced_by_another_process(tmp_path) -> None:
+    reader = FlatVectorStore(str(tmp_path))
+    writer = FlatVectorStore(str(tmp_path))
+    kb_id, doc_id = uuid.uuid4(), uuid.uuid4()
+    kb_dir = reader._kb_dir(kb_id)
+    writer.insert_document(kb_id, doc_id, CHUNKS, VECTORS)
+    writer.insert_document(kb_id, uuid.uuid4(), ["x"], [[1.0, 0.0]])
+    assert len(reader.search_similar([1.0, 0.0], kb_id=kb_id, limit=5, score_threshold=0.5)) == 3
+    assert len(reader._segments[kb_dir]) == 2
+
+    # 另一个实例（如 worker 进程）删除文档并替换 MANIFEST，读取方下次读取时释放被删除的段
+    writer.delete_documents([doc_id], kb_id=kb_id)
+    results = reader.search_similar([1.0, 0.0], kb_id=kb_id, limit=5, score_threshold=0.5)
+
+    assert [r["text"] for r in results] == ["x"]
+    assert len(reader._segments[kb_dir]) == 1
+    writer.delete_knowledge_base(kb_id)
+    assert reader.count(kb_id) == 0
+    assert kb_dir not in reader._segments
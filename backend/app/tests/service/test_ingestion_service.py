@@ -0,0 +1,319 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+from sqlmodel import Session, select
+
+from app.core.clients import clients
+from app.core.config import settings
+from app.models.ingestion_job import IngestionJob
+from app.models.knowledge_base_chunk import KnowledgeBaseChunk
+from app.service import ingestion_service, purge_service
+from app.service.qdrant_util import QdrantVectorStore
+from app.storage.local_storage import LocalStorage
+from app.tests.utils.knowledge_base import create_random_knowledge_base
+from app.tests.utils.utils import random_lower_string
+
+# 40 个段落，每段约 300 字符，每段切分为一块
+PARAGRAPHS = [f"paragraph {i:02d} " + "x" * 300 for i in range(40)]
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, fail_on_call: int = 0, fail_on_text: str | None = None):
+        self.fail_on_call = fail_on_call
+        self.fail_on_text = fail_on_text
+        self.calls = 0
+        self.texts: list[str] = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            self.calls += 1
+            self.texts.extend(texts)
+            if self.calls == self.fail_on_call or any(self.fail_on_text in t for t in texts if self.fail_on_text):
+                raise RuntimeError("embedding failed")
+        return [[float(t.split()[1])] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def document(tmp_path: Path, monkeypatch) -> str:
+    monkeypatch.setattr(settings, "INGESTION_WINDOW_CHUNKS", 2)
+    monkeypatch.setattr(settings, "INGESTION_QUEUE_SIZE", 1)
+    path = tmp_path / "doc.txt"
+    path.write_text("\n\n".join(PARAGRAPHS), encoding="utf-8")
+    return str(path)
+
+
+def _use_embeddings(monkeypatch, embeddings: Embeddings) -> None:
+    monkeypatch.setitem(clients._clients, "embeddings", embeddings)
+
+
+def _wait_for_threads(before: set) -> None:
+    # 流水线的阶段线程应在返回或抛出异常后退出
+    deadline = time.monotonic() + 5
+    while set(threading.enumerate()) - before:
+        assert time.monotonic() < deadline, "pipeline threads did not stop"
+        time.sleep(0.05)
+
+
+def test_run_pipeline_upserts_windows_in_order(document: str, monkeypatch) -> None:
+    _use_embeddings(monkeypatch, FakeEmbeddings())
+    upserts = []
+    progress = []
+
+    total = ingestion_service.run_pipeline(
+        document, "doc.txt",
+        upsert=lambda chunks, vectors, start: upserts.append((start, chunks, vectors)) or len(chunks),
+        on_progress=lambda done, ratio: progress.append(done),
+    )
+
+    assert total == len(PARAGRAPHS)
+    assert [start for start, _, _ in upserts] == list(range(0, len(PARAGRAPHS), 2))
+    chunks = [chunk for _, window, _ in upserts for chunk in window]
+    assert [chunk.split()[1] for chunk in chunks] == [f"{i:02d}" for i in range(len(PARAGRAPHS))]
+    # 每个窗口的向量与块一一对应
+    assert [vector for _, _, vectors in upserts for vector in vectors] == [[float(i)] for i in range(len(PARAGRAPHS))]
+    assert progress == list(range(2, len(PARAGRAPHS) + 1, 2))
+
+
+def test_run_pipeline_applies_backpressure(document: str, monkeypatch) -> None:
+    embeddings = FakeEmbeddings()
+    _use_embeddings(monkeypatch, embeddings)
+    release = threading.Event()
+    upserted = []
+
+    def upsert(chunks, _vectors, start) -> int:
+        release.wait()
+        upserted.append(start)
+        return len(chunks)
+
+    worker = threading.Thread(target=ingestion_service.run_pipeline,
+                              args=(document, "doc.txt"), kwargs={"upsert": upsert})
+    worker.start()
+    time.sleep(0.5)
+    # 写入阻塞时，上游最多向量化：正在写入的 1 个 + 队列中的 1 个 + 等待放入队列的 1 个
+    assert embeddings.calls <= 3
+    release.set()
+    worker.join(timeout=10)
+
+    assert not worker.is_alive()
+    assert embeddings.calls == len(PARAGRAPHS) // 2
+    assert len(upserted) == len(PARAGRAPHS) // 2
+
+
+def test_run_pipeline_stops_all_stages_when_embedding_fails(document: str, monkeypatch) -> None:
+    embeddings = FakeEmbeddings(fail_on_call=3)
+    _use_embeddings(monkeypatch, embeddings)
+    before = set(threading.enumerate())
+    upserts = []
+
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        ingestion_service.run_pipeline(document, "doc.txt",
+                                       upsert=lambda chunks, vectors, start: upserts.append(start) or len(chunks))
+
+    assert upserts == [0, 2]
+    _wait_for_threads(before)
+    assert embeddings.calls == 3
+
+
+def test_run_pipeline_stops_upstream_when_upsert_fails(document: str, monkeypatch) -> None:
+    embeddings = FakeEmbeddings()
+    _use_embeddings(monkeypatch, embeddings)
+
+    def slow_document(_file_path: str, _filename: str):
+        # 提取慢于下游：向量化线程在等待下一个窗口时写入失败
+        for i, paragraph in enumerate(PARAGRAPHS):
+            time.sleep(0.02)
+            yield paragraph + "\n\n", (i + 1) / len(PARAGRAPHS)
+
+    monkeypatch.setattr(ingestion_service, "iter_document", slow_document)
+    before = set(threading.enumerate())
+
+    def upsert(chunks, _vectors, start) -> int:
+        # 第一批窗口（约 12 块）的最后一个窗口写入失败，此时向量化线程在等待下一批
+        if start >= 10:
+            raise RuntimeError("qdrant unavailable")
+        return len(chunks)
+
+    with pytest.raises(RuntimeError, match="qdrant unavailable"):
+        ingestion_service.run_pipeline(document, "doc.txt", upsert=upsert)
+
+    _wait_for_threads(before)
+    # 写入失败后上游不再继续向量化剩余的窗口
+    assert embeddings.calls < len(PARAGRAPHS) // 2
+
+
+def _use_vector_store(monkeypatch) -> QdrantVectorStore:
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    monkeypatch.setitem(clients._clients, "vector_store", store)
+    return store
+
+
+def _register_version(db: Session, path: Path, paragraphs: list[str], kb_id: uuid.UUID, user_id: uuid.UUID,
+                      knowledge_base_file=None):
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    knowledge_base_file, job = ingestion_service.register_file(
+        session=db, kb_id=kb_id, knowledge_base_file=knowledge_base_file, name="doc.txt", file_path=str(path),
+        size=path.stat().st_size, file_hash=random_lower_string(), user_id=user_id,
+    )
+    db.commit()
+    return knowledge_base_file, job
+
+
+def test_run_job_reuses_unchanged_chunks(db: Session, tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "INGESTION_WINDOW_CHUNKS", 2)
+    embeddings = FakeEmbeddings()
+    _use_embeddings(monkeypatch, embeddings)
+    store = _use_vector_store(monkeypatch)
+    knowledge_base = create_random_knowledge_base(db)
+    path = tmp_path / "doc.txt"
+    knowledge_base_file, job = _register_version(db, path, PARAGRAPHS[:6], knowledge_base.id,
+                                                 knowledge_base.created_by)
+    ingestion_service.run_job(session=db, job=job)
+    assert job.status == "succeeded"
+    assert len(embeddings.texts) == 6
+
+    # 新版本：第 2 段修改，第 4 段删除，其余段落不变（第 5 段位置前移）
+    changed = "paragraph 99 " + "y" * 300
+    embeddings.texts.clear()
+    _, job = _register_version(db, path, [*PARAGRAPHS[:2], changed, PARAGRAPHS[3], PARAGRAPHS[5]],
+                               knowledge_base.id, knowledge_base.created_by, knowledge_base_file)
+    ingestion_service.run_job(session=db, job=job)
+
+    assert job.status == "succeeded"
+    assert embeddings.texts == [changed]
+    assert job.metrics["counts"]["reused"] == 4
+    points = store.get_document_points(knowledge_base_file.id)
+    assert sorted(points.values()) == [0, 1, 2, 3, 4]
+    rows = db.exec(select(KnowledgeBaseChunk).where(KnowledgeBaseChunk.doc_id == knowledge_base_file.id)
+                   .order_by(KnowledgeBaseChunk.chunk_index)).all()
+    assert [row.text.split()[1] for row in rows] == ["00", "01", "99", "03", "05"]
+    assert {str(row.point_id): row.chunk_index for row in rows} == points
+
+
+def test_run_job_purges_partial_document_after_final_failure(db: Session, tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "INGESTION_WINDOW_CHUNKS", 2)
+    # 前两个窗口写入后，第三个窗口每次都向量化失败
+    _use_embeddings(monkeypatch, FakeEmbeddings(fail_on_text="paragraph 04"))
+    store = _use_vector_store(monkeypatch)
+    knowledge_base = create_random_knowledge_base(db)
+    knowledge_base_file, job = _register_version(db, tmp_path / "doc.txt", PARAGRAPHS[:6], knowledge_base.id,
+                                                 knowledge_base.created_by)
+
+    for attempt in range(1, settings.INGESTION_JOB_MAX_ATTEMPTS + 1):
+        # claim_job 领取时增加 attempts
+        job.attempts = attempt
+        ingestion_service.run_job(session=db, job=job)
+        if attempt < settings.INGESTION_JOB_MAX_ATTEMPTS:
+            assert job.status == "pending"
+            assert len(store.get_document_points(knowledge_base_file.id)) == 4
+
+    assert job.status == "failed"
+    db.refresh(knowledge_base_file)
+    assert knowledge_base_file.status == 0
+    purge_job = db.exec(select(IngestionJob).where(IngestionJob.doc_id == knowledge_base_file.id,
+                                                   IngestionJob.kind == purge_service.PURGE_DOC)).one()
+    assert purge_job.status == "pending"
+
+    purge_service.run_purge_job(session=db, job=purge_job, storage=LocalStorage(str(tmp_path / "storage")))
+
+    assert purge_job.status == "succeeded"
+    assert store.get_document_points(knowledge_base_file.id) == {}
+    assert db.exec(select(KnowledgeBaseChunk).where(KnowledgeBaseChunk.doc_id == knowledge_base_file.id)).all() == []
+
+
+def test_claim_job_reclaims_expired_lease(db: Session) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    expired_at = datetime.utcnow() - timedelta(seconds=settings.INGESTION_JOB_LEASE_SECONDS + 60)
+    # created_at 早于其他测试留下的任务，保证最先被领取
+    created_at = datetime(2000, 1, 1)
+
+    def running_job(attempts: int, updated_at: datetime) -> IngestionJob:
+        return IngestionJob(knowledge_base_id=knowledge_base.id, doc_id=uuid.uuid4(),
+                            created_by=knowledge_base.created_by, status="running", attempts=attempts,
+                            created_at=created_at, updated_at=updated_at)
+
+    expired = running_job(1, expired_at)
+    exhausted = running_job(settings.INGESTION_JOB_MAX_ATTEMPTS, expired_at)
+    active = running_job(1, datetime.utcnow())
+    db.add_all([expired, exhausted, active])
+    db.commit()
+
+    claimed = ingestion_service.claim_job(session=db)
+
+    try:
+        assert claimed is not None and claimed.id == expired.id
+        assert claimed.status == "running"
+        assert claimed.attempts == 2
+        db.refresh(exhausted)
+        assert exhausted.status == "failed"
+        db.refresh(active)
+        assert active.attempts == 1
+    finally:
+        # 不留下会被之后的测试领取的任务
+        for job in (expired, active):
+            db.refresh(job)
+            job.status = "succeeded"
+            db.add(job)
+        db.commit()
+
+
+def _chunk_rows(db: Session, doc_id: uuid.UUID) -> list[KnowledgeBaseChunk]:
+    return db.exec(select(KnowledgeBaseChunk).where(KnowledgeBaseChunk.doc_id == doc_id)
+                   .order_by(KnowledgeBaseChunk.chunk_index)).all()
+
+
+def test_save_chunks_rewrites_document_chunks(db: Session) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    doc_id = uuid.uuid4()
+    ingestion_service.save_chunks(session=db, kb_id=knowledge_base.id, doc_id=doc_id, chunks=["a", "b"])
+    ingestion_service.save_chunks(session=db, kb_id=knowledge_base.id, doc_id=doc_id, chunks=["c"], start_index=2)
+    db.commit()
+    assert [row.text for row in _chunk_rows(db, doc_id)] == ["a", "b", "c"]
+
+    # 重新入库：删除旧块后按新的解析结果写入，不残留旧版本多出的块
+    ingestion_service.delete_chunks(session=db, doc_id=doc_id)
+    ingestion_service.save_chunks(session=db, kb_id=knowledge_base.id, doc_id=doc_id, chunks=["b", "d"])
+    db.commit()
+    db.expire_all()
+
+    rows = _chunk_rows(db, doc_id)
+    assert [(row.chunk_index, row.text) for row in rows] == [(0, "b"), (1, "d")]
+    for row in rows:
+        assert row.knowledge_base_id == knowledge_base.id
+        assert row.content_hash == QdrantVectorStore.content_hash(row.text)
+        assert str(row.point_id) == QdrantVectorStore.make_point_id(doc_id, row.text, row.content_hash)
+        assert row.char_length == len(row.text)
+    assert ingestion_service.save_chunks(session=db, kb_id=knowledge_base.id, doc_id=doc_id, chunks=[]) == 0
+
+
+def test_iter_chunk_rows_pages_across_documents(db: Session) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    other = create_random_knowledge_base(db)
+    doc_ids = sorted([uuid.uuid4(), uuid.uuid4()])
+    for doc_id in doc_ids:
+        ingestion_service.save_chunks(session=db, kb_id=knowledge_base.id, doc_id=doc_id,
+                                      chunks=[f"chunk {i}" for i in range(5)])
+    ingestion_service.save_chunks(session=db, kb_id=other.id, doc_id=uuid.uuid4(), chunks=["other"])
+    db.commit()
+
+    batches = list(ingestion_service.iter_chunk_rows(session=db, kb_id=knowledge_base.id, batch_size=3))
+
+    # 分页边界落在文档中间与文档之间，每块只读取一次，按 (doc_id, chunk_index) 排序
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    keys = [(row.doc_id, row.chunk_index) for batch in batches for row in batch]
+    assert keys == [(doc_id, i) for doc_id in doc_ids for i in range(5)]
+
+    batches = list(ingestion_service.iter_chunk_rows(session=db, kb_id=knowledge_base.id, doc_id=doc_ids[1],
+                                                     batch_size=2))
+    assert [[row.chunk_index for row in batch] for batch in batches] == [[0, 1], [2, 3], [4]]
+    since = datetime.utcnow() + timedelta(seconds=60)
+    assert list(ingestion_service.iter_chunk_rows(session=db, kb_id=knowledge_base.id, since=since)) == []
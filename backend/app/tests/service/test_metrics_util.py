@@ -0,0 +1,36 @@
+from app.service.metrics_util import StageMetrics, build_histogram, summarize_jobs
+
+
+def test_stage_metrics_timed_iter_counts_items() -> None:
+    metrics = StageMetrics()
+
+    assert list(metrics.timed_iter(iter(["a", "b", "c"]), "extract", "pages")) == ["a", "b", "c"]
+    metrics.add("chunks", 5)
+
+    data = metrics.to_dict()
+    assert data["counts"] == {"pages": 3, "chunks": 5}
+    assert data["seconds"]["extract"] >= 0
+
+
+def test_build_histogram_is_cumulative() -> None:
+    histogram = build_histogram([0.2, 0.7, 3.0], buckets=(0.5, 1, 5))
+
+    assert histogram["buckets"] == {"0.5": 1, "1": 2, "5": 3, "+Inf": 3}
+    assert histogram["count"] == 3
+    assert histogram["p50"] == 0.7
+
+
+def test_summarize_jobs_groups_by_extension() -> None:
+    jobs = [
+        {"extension": ".pdf", "seconds": {"extract": 2.0, "total": 4.0}, "counts": {"pages": 10, "chunks": 40}},
+        {"extension": ".pdf", "seconds": {"extract": 1.0, "total": 1.0}, "counts": {"pages": 5, "chunks": 10}},
+        {"extension": ".md", "seconds": {"embed": 0.5, "total": 0.5}, "counts": {"chunks": 4}},
+    ]
+
+    summary = summarize_jobs(jobs)
+
+    assert summary[".pdf"]["jobs"] == 2
+    assert summary[".pdf"]["seconds"]["extract"]["sum"] == 3.0
+    assert summary[".pdf"]["counts"] == {"pages": 15, "chunks": 50}
+    assert summary[".pdf"]["throughput"]["pages_per_second"] == 3.0
+    assert summary[".md"]["seconds"]["embed"]["count"] == 1
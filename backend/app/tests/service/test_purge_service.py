@@ -0,0 +1,185 @@
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient
+from sqlmodel import Session, select
+
+from app.core.clients import clients
+from app.core.config import settings
+from app.models.knowledge_base import KnowledgeBase
+from app.models.knowledge_base_chunk import KnowledgeBaseChunk
+from app.models.knowledge_base_file import KnowledgeBaseFile
+from app.models.upload_session import UploadSession
+from app.service import ingestion_service, purge_service
+from app.service.qdrant_util import QdrantVectorStore
+from app.storage.local_storage import LocalStorage
+from app.tests.utils.knowledge_base import create_random_knowledge_base
+from app.tests.utils.utils import random_lower_string
+
+
+@pytest.fixture
+def store(monkeypatch) -> QdrantVectorStore:
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    monkeypatch.setitem(clients._clients, "vector_store", store)
+    return store
+
+
+@pytest.fixture
+def storage(tmp_path: Path) -> LocalStorage:
+    return LocalStorage(str(tmp_path / "storage"))
+
+
+def _add_document(db: Session, store: QdrantVectorStore, storage: LocalStorage, knowledge_base: KnowledgeBase,
+                  *, status: int = 1, file_path: str | None = None) -> KnowledgeBaseFile:
+    """写入文件、块记录与向量；file_path 为空时新建文件"""
+    if file_path is None:
+        file_path = str(Path(storage.folder) / f"{uuid.uuid4()}.txt")
+        Path(file_path).write_text("content", encoding="utf-8")
+    knowledge_base_file = KnowledgeBaseFile(name="doc.txt", extension="txt", size=7, storage="local:" + file_path,
+                                            knowledge_base_id=knowledge_base.id, status=status,
+                                            file_hash=random_lower_string(), created_by=knowledge_base.created_by,
+                                            updated_by=knowledge_base.created_by)
+    texts = ["chunk 0", "chunk 1"]
+    db.add(knowledge_base_file)
+    db.add_all([
+        KnowledgeBaseChunk(doc_id=knowledge_base_file.id, chunk_index=i, knowledge_base_id=knowledge_base.id,
+                           point_id=uuid.uuid4(), text=text, content_hash=random_lower_string(),
+                           char_length=len(text))
+        for i, text in enumerate(texts)
+    ])
+    db.commit()
+    store.insert_document(str(knowledge_base.id), str(knowledge_base_file.id), texts, [[1.0, 0.0], [0.0, 1.0]])
+    return knowledge_base_file
+
+
+def _file_path(knowledge_base_file: KnowledgeBaseFile) -> Path:
+    return Path(knowledge_base_file.storage.removeprefix("local:"))
+
+
+def _chunk_count(db: Session, doc_id: uuid.UUID) -> int:
+    return len(db.exec(select(KnowledgeBaseChunk).where(KnowledgeBaseChunk.doc_id == doc_id)).all())
+
+
+def test_purge_doc_removes_points_chunks_and_file(db: Session, store: QdrantVectorStore,
+                                                   storage: LocalStorage) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    deleted = _add_document(db, store, storage, knowledge_base, status=0)
+    kept = _add_document(db, store, storage, knowledge_base)
+    job = purge_service.create_purge_job(session=db, kind=purge_service.PURGE_DOC, kb_id=knowledge_base.id,
+                                         user_id=knowledge_base.created_by, doc_id=deleted.id)
+    db.commit()
+
+    purge_service.run_purge_job(session=db, job=job, storage=storage)
+
+    assert job.status == "succeeded"
+    assert store.get_document_points(deleted.id) == {}
+    assert _chunk_count(db, deleted.id) == 0
+    assert not _file_path(deleted).exists()
+    assert len(store.get_document_points(kept.id)) == 2
+    assert _chunk_count(db, kept.id) == 2
+    assert _file_path(kept).exists()
+
+
+def test_purge_doc_refuses_live_document(db: Session, store: QdrantVectorStore, storage: LocalStorage) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    live = _add_document(db, store, storage, knowledge_base)
+    job = purge_service.create_purge_job(session=db, kind=purge_service.PURGE_DOC, kb_id=knowledge_base.id,
+                                         user_id=knowledge_base.created_by, doc_id=live.id)
+    db.commit()
+
+    purge_service.run_purge_job(session=db, job=job, storage=storage)
+
+    # 未删除的文档不清理，任务放回队列（attempts 为 0，未达上限）
+    assert job.status == "pending"
+    assert len(store.get_document_points(live.id)) == 2
+    assert _file_path(live).exists()
+    # 不留下会被之后的测试领取的任务
+    ingestion_service.update_job(db, job, status="failed")
+
+
+def test_purge_kb_commits_progress_per_batch(db: Session, store: QdrantVectorStore, storage: LocalStorage,
+                                             monkeypatch) -> None:
+    monkeypatch.setattr(settings, "PURGE_BATCH_SIZE", 2)
+    knowledge_base = create_random_knowledge_base(db)
+    other = create_random_knowledge_base(db)
+    files = [_add_document(db, store, storage, knowledge_base) for _ in range(5)]
+    other_file = _add_document(db, store, storage, other)
+    job = purge_service.create_purge_job(session=db, kind=purge_service.PURGE_KB, kb_id=knowledge_base.id,
+                                         user_id=knowledge_base.created_by)
+    db.commit()
+    progress = []
+    update_job = ingestion_service.update_job
+
+    def record_progress(session, job, **fields):
+        update_job(session, job, **fields)
+        progress.append((job.processed_chunks, job.total_chunks))
+
+    monkeypatch.setattr(ingestion_service, "update_job", record_progress)
+
+    purge_service.run_purge_job(session=db, job=job, storage=storage)
+
+    assert job.status == "succeeded"
+    # 开始、每批（2 + 2 + 1 个文档）、完成各提交一次
+    assert progress == [(0, 5), (2, 5), (4, 5), (5, 5), (5, 5)]
+    for knowledge_base_file in files:
+        db.refresh(knowledge_base_file)
+        assert knowledge_base_file.status == 0
+        assert store.get_document_points(knowledge_base_file.id) == {}
+        assert _chunk_count(db, knowledge_base_file.id) == 0
+        assert not _file_path(knowledge_base_file).exists()
+    # 其他知识库不受影响
+    assert len(store.get_document_points(other_file.id)) == 2
+    assert _chunk_count(db, other_file.id) == 2
+
+
+def test_remove_unreferenced_files_keeps_live_paths(db: Session, store: QdrantVectorStore,
+                                                    storage: LocalStorage) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    # 重新上传相同内容时新旧版本的路径相同（docs/{doc_id}/{hash}{扩展名}）
+    live = _add_document(db, store, storage, knowledge_base)
+    old_version = _add_document(db, store, storage, knowledge_base, status=0, file_path=str(_file_path(live)))
+    unreferenced = _add_document(db, store, storage, knowledge_base, status=0)
+
+    purge_service.remove_unreferenced_files(db, storage, [old_version.storage, unreferenced.storage, None])
+
+    assert _file_path(live).exists()
+    assert not _file_path(unreferenced).exists()
+
+
+def test_sweep_orphans(db: Session, store: QdrantVectorStore, storage: LocalStorage) -> None:
+    knowledge_base = create_random_knowledge_base(db)
+    live = _add_document(db, store, storage, knowledge_base)
+    deleted = _add_document(db, store, storage, knowledge_base, status=0)
+    # 没有文件记录的向量（例如删除后仍写入的入库任务）
+    unknown_doc_id = uuid.uuid4()
+    store.insert_document(str(knowledge_base.id), str(unknown_doc_id), ["orphan"], [[1.0, 1.0]])
+    expired_at = datetime.utcnow() - timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS + 60)
+    stale = UploadSession(name="stale.txt", size=10, knowledge_base_id=knowledge_base.id,
+                          created_by=knowledge_base.created_by, updated_at=expired_at)
+    active = UploadSession(name="active.txt", size=10, knowledge_base_id=knowledge_base.id,
+                           created_by=knowledge_base.created_by)
+    db.add_all([stale, active])
+    db.commit()
+    for upload_session in (stale, active):
+        part_path = Path(storage._part_path(str(upload_session.id)))
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.write_bytes(b"part")
+
+    result = purge_service.sweep_orphans(session=db, storage=storage)
+
+    assert result["points_docs"] == 2
+    assert result["chunks"] >= 2
+    assert result["upload_sessions"] >= 1
+    assert store.get_document_points(deleted.id) == {}
+    assert store.get_document_points(unknown_doc_id) == {}
+    assert _chunk_count(db, deleted.id) == 0
+    assert len(store.get_document_points(live.id)) == 2
+    assert _chunk_count(db, live.id) == 2
+    db.refresh(stale)
+    db.refresh(active)
+    assert stale.status == "aborted"
+    assert active.status == "open"
+    assert not Path(storage._part_path(str(stale.id))).exists()
+    assert Path(storage._part_path(str(active.id))).exists()
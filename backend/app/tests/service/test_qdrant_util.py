@@ -0,0 +1,188 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from app.service import qdrant_util
+from app.service.qdrant_util import PAYLOAD_INDEXES, AsyncQdrantVectorStore, QdrantVectorStore
+
+CHUNKS = ["a", "b", "c"]
+VECTORS = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+
+
+def test_search_similar_filters_by_kb_and_reranks() -> None:
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    kb_id, other_kb_id = uuid.uuid4(), uuid.uuid4()
+    store.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+    store.insert_document(other_kb_id, uuid.uuid4(), ["x"], [[1.0, 0.0]])
+
+    results = store.search_similar([1.0, 0.0], kb_id=kb_id, limit=2, score_threshold=0.5)
+
+    assert [r["text"] for r in results] == ["a", "c"]
+    assert results[0]["score"] == 1.0
+    assert {r["kb_id"] for r in results} == {str(kb_id)}
+
+
+def test_server_scores_match_local_rescore() -> None:
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    kb_id = uuid.uuid4()
+    store.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+
+    rescored = store.search_similar([1.0, 0.2], kb_id=kb_id, limit=2, rescore=True)
+    server = store.search_similar([1.0, 0.2], kb_id=kb_id, limit=2)
+
+    assert [r["id"] for r in server] == [r["id"] for r in rescored]
+    assert [r["score"] for r in server] == pytest.approx([r["score"] for r in rescored])
+    # 服务端模式按阈值过滤，不回退到 top-N
+    assert [r["text"] for r in store.search_similar([1.0, 0.0], kb_id=kb_id, limit=3, score_threshold=0.9)] == ["a"]
+
+
+@pytest.mark.parametrize("score_threshold", [-0.5, 0.5, 0.9, 1.1])
+def test_rescore_applies_score_threshold_like_server(score_threshold: float) -> None:
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    kb_id = uuid.uuid4()
+    store.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+
+    def texts(rescore: bool) -> list[str]:
+        results = store.search_similar([1.0, 0.0], kb_id=kb_id, limit=3, score_threshold=score_threshold,
+                                       rescore=rescore)
+        return [r["text"] for r in results]
+
+    # 两种检索方式对同一查询返回相同的结果
+    assert texts(rescore=True) == texts(rescore=False)
+    expected = {-0.5: ["a", "c", "b"], 0.5: ["a", "c"], 0.9: ["a"], 1.1: []}[score_threshold]
+    assert texts(rescore=True) == expected
+
+
+def test_async_store_matches_sync_store() -> None:
+    kb_id, doc_id = uuid.uuid4(), uuid.uuid4()
+    sync_store = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    sync_store.insert_document(kb_id, doc_id, CHUNKS, VECTORS)
+    expected = sync_store.search_similar([0.0, 1.0], kb_id=kb_id, limit=3)
+
+    async def run() -> None:
+        store = AsyncQdrantVectorStore(AsyncQdrantClient(":memory:"), "test")
+        assert await store.insert_document(kb_id, doc_id, CHUNKS, VECTORS) == 3
+        assert await store.search_similar([0.0, 1.0], kb_id=kb_id, limit=3) == expected
+        assert (await store.get_collection_info())["points_count"] == 3
+        assert await store.delete_document(doc_id)
+        assert (await store.get_collection_info())["points_count"] == 0
+
+    asyncio.run(run())
+
+
+def test_only_missing_payload_indexes_are_created() -> None:
+    store = QdrantVectorStore(None, "test")
+    info = SimpleNamespace(payload_schema={"kb_id": object()})
+    assert list(store._missing_payload_indexes(info)) == ["doc_id", "chunk_index"]
+    assert store._missing_payload_indexes(SimpleNamespace(payload_schema=None)) == PAYLOAD_INDEXES
+
+
+def test_collection_per_kb_routes_by_kb_id() -> None:
+    client = QdrantClient(":memory:")
+    store = QdrantVectorStore(client, "test", partitioning="collection_per_kb")
+    kb_id, other_kb_id, doc_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    store.insert_document(kb_id, doc_id, CHUNKS, VECTORS)
+    store.insert_document(other_kb_id, uuid.uuid4(), ["x"], [[1.0, 0.0]])
+
+    assert client.count(store.kb_collection_name(kb_id)).count == 3
+    assert client.count(store.kb_collection_name(other_kb_id)).count == 1
+    assert [r["text"] for r in store.search_similar([1.0, 0.0], kb_id=kb_id, limit=1)] == ["a"]
+    assert store.delete_document(doc_id, kb_id=kb_id)
+    assert store.search_similar([1.0, 0.0], kb_id=kb_id, limit=1) == []
+
+
+def test_storage_profile_configures_collection_and_search() -> None:
+    client = QdrantClient(":memory:")
+    store = QdrantVectorStore(client, "test", storage_profile="int8", hnsw_ef=64)
+    kb_id = uuid.uuid4()
+    store.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+
+    assert client.get_collection("test").config.params.vectors.on_disk
+    # 本地模式不保存量化配置，只检查建 collection 的参数
+    assert store._collection_config(2)["quantization_config"].scalar.type == "int8"
+    params = store._search_params(None, None)
+    assert params.hnsw_ef == 64 and params.quantization.oversampling == 2.0
+    assert store._search_params(128, None).hnsw_ef == 128
+    assert [r["text"] for r in store.search_similar([1.0, 0.0], kb_id=kb_id, limit=1, hnsw_ef=128)] == ["a"]
+
+
+class _FlakyClient:
+    """每个批次第一次写入失败，记录成功的写入"""
+
+    def __init__(self, shard_number: int = 1) -> None:
+        self.failed: set = set()
+        self.upserts: list = []
+        self.shard_number = shard_number
+
+    def get_collection(self, collection_name):
+        params = SimpleNamespace(shard_number=self.shard_number, replication_factor=1)
+        return SimpleNamespace(config=SimpleNamespace(params=params))
+
+    def upsert(self, collection_name, points, wait):
+        first_id = points[0].id
+        if first_id not in self.failed:
+            self.failed.add(first_id)
+            raise ConnectionError("temporary failure")
+        self.upserts.append((len(points), wait))
+
+
+@pytest.mark.parametrize("shard_number", [1, 2])
+def test_insert_document_upserts_in_batches_with_final_barrier(shard_number: int) -> None:
+    client = _FlakyClient(shard_number)
+    store = QdrantVectorStore(client, "test", upsert_batch_size=2, upsert_parallel=2, upsert_retries=2)
+    store.vector_size = 2
+    chunks = [f"chunk {i}" for i in range(5)]
+
+    assert store.insert_document(uuid.uuid4(), uuid.uuid4(), chunks, [[1.0, float(i)] for i in range(5)]) == 5
+    # 多 shard 时不能依赖最后一批作为屏障，每一批都等待生效
+    wait = shard_number > 1
+    assert sorted(client.upserts[:2]) == [(2, wait), (2, wait)]
+    # 最后一批在其余批次之后以 wait=True 写入
+    assert client.upserts[2] == (1, True)
+
+
+def test_store_text_false_keeps_only_filter_fields() -> None:
+    client = QdrantClient(":memory:")
+    store = QdrantVectorStore(client, "test", store_text=False)
+    kb_id = uuid.uuid4()
+    store.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+
+    records, _ = client.scroll("test", limit=10, with_payload=True)
+    assert {frozenset(r.payload) for r in records} == {frozenset(PAYLOAD_INDEXES)}
+    results = store.search_similar([1.0, 0.0], kb_id=kb_id, limit=1)
+    assert results[0]["text"] == "" and results[0]["chunk_index"] == 0
+
+    # with_payload 只返回指定字段
+    full = QdrantVectorStore(QdrantClient(":memory:"), "test")
+    full.insert_document(kb_id, uuid.uuid4(), CHUNKS, VECTORS)
+    result = full.search_similar([1.0, 0.0], kb_id=kb_id, limit=1, with_payload=["doc_id"])[0]
+    assert result["text"] == "" and result["doc_id"]
+
+
+def test_collection_per_kb_store_cache_is_bounded(monkeypatch) -> None:
+    monkeypatch.setattr(qdrant_util, "KB_STORE_CACHE_SIZE", 2)
+    store = QdrantVectorStore(QdrantClient(":memory:"), "test", partitioning="collection_per_kb")
+    first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    first_store = store.for_kb(first)
+    store.for_kb(second)
+    store.for_kb(first)
+    store.for_kb(third)
+
+    # 最近未使用的 second 被淘汰，再次使用时重新创建
+    assert len(store._kb_stores) == 2
+    assert store.for_kb(first) is first_store
+    assert store.kb_collection_name(second) not in store._kb_stores
+
+
+def test_tenant_partitioning_requires_qdrant_1_11() -> None:
+    def client(version: str) -> SimpleNamespace:
+        return SimpleNamespace(info=lambda: SimpleNamespace(version=version))
+
+    with pytest.raises(ValueError, match="tenant"):
+        qdrant_util.check_partitioning_support(client("1.10.0"), "tenant")
+    qdrant_util.check_partitioning_support(client("1.12.6"), "tenant")
+    qdrant_util.check_partitioning_support(client("1.10.0"), "shared")
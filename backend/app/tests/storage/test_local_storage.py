@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from app.storage.local_storage import (
+    FileTooLargeError,
+    LocalStorage,
+    UploadOffsetMismatchError,
+    _part_hashers,
+)
+
+
+async def _stream(data: bytes, chunk_size: int = 1000):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def test_append_part_resumes_from_offset(tmp_path: Path) -> None:
+    storage = LocalStorage(str(tmp_path))
+    data = bytes(range(256)) * 40
+
+    offset = asyncio.run(storage.append_part("u1", 0, _stream(data[:4000]), max_size=len(data)))
+    assert offset == storage.part_size("u1") == 4000
+
+    with pytest.raises(UploadOffsetMismatchError) as exc_info:
+        asyncio.run(storage.append_part("u1", 0, _stream(data[:10]), max_size=len(data)))
+    assert exc_info.value.offset == 4000
+
+    # 模拟请求落到另一个进程：没有缓存的 hasher，从磁盘重新计算
+    _part_hashers.clear()
+    offset = asyncio.run(storage.append_part("u1", offset, _stream(data[4000:]), max_size=len(data)))
+
+    part_path, size, file_hash = storage.finish_part("u1")
+    assert size == offset == len(data)
+    assert file_hash == hashlib.md5(data).hexdigest()
+    assert Path(part_path).read_bytes() == data
+
+
+def test_append_part_rejects_bytes_beyond_max_size(tmp_path: Path) -> None:
+    storage = LocalStorage(str(tmp_path))
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(storage.append_part("u2", 0, _stream(b"x" * 3000), max_size=2500))
+    # 超出部分之前的完整分块已落盘
+    assert storage.part_size("u2") == 2000
@@ -0,0 +1,15 @@
+from sqlmodel import Session
+
+from app.models.knowledge_base import KnowledgeBase
+from app.models.user import User
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_knowledge_base(db: Session, user: User | None = None) -> KnowledgeBase:
+    user = user or create_random_user(db)
+    knowledge_base = KnowledgeBase(name=random_lower_string(), status=1, created_by=user.id, updated_by=user.id)
+    db.add(knowledge_base)
+    db.commit()
+    db.refresh(knowledge_base)
+    return knowledge_base
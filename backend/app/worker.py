@@ -0,0 +1,100 @@
+import logging
+import signal
+import threading
+import time
+
+from sqlmodel import Session
+
+from app.core.clients import clients
+from app.core.config import settings
+from app.core.db import engine
+from app.service import ingestion_service, purge_service
+from app.service.extract_util import shutdown_extract_pool
+from app.service.qdrant_util import check_partitioning_support
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_stopping = False
+
+
+def _handle_stop(signum, frame) -> None:  # noqa: ARG001
+    global _stopping
+    logger.info("Received signal %s, stopping after current job", signum)
+    _stopping = True
+
+
+def run_once() -> bool:
+    """领取并执行一个任务，没有任务时返回 False；重建索引切换 alias 期间暂停领取"""
+    with ingestion_service.job_barrier(engine), Session(engine) as session:
+        job = ingestion_service.claim_job(session=session)
+        if job is None:
+            return False
+        logger.info(f"Processing {job.kind} job {job.id} (kb {job.knowledge_base_id}, doc {job.doc_id}, "
+                    f"attempt {job.attempts})")
+        if job.kind == "ingest":
+            ingestion_service.run_job(session=session, job=job)
+        else:
+            purge_service.run_purge_job(session=session, job=job)
+        return True
+
+
+def _loop() -> None:
+    while not _stopping:
+        try:
+            processed = run_once()
+        except Exception as e:
+            logger.error(e)
+            processed = False
+        if not processed:
+            time.sleep(settings.INGESTION_WORKER_POLL_SECONDS)
+
+
+def _sweep_loop() -> None:
+    """定期清理孤立向量、块与过期上传会话"""
+    next_sweep = time.monotonic()
+    while not _stopping:
+        if time.monotonic() >= next_sweep:
+            try:
+                with Session(engine) as session:
+                    logger.info(f"Sweep finished: {purge_service.sweep_orphans(session=session)}")
+            except Exception:
+                logger.exception("Sweep failed")
+            next_sweep = time.monotonic() + settings.PURGE_SWEEP_INTERVAL_SECONDS
+        time.sleep(1)
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+    logger.info(f"Ingestion worker started, concurrency={settings.INGESTION_WORKER_CONCURRENCY}")
+    # 分区方式不被服务端支持时直接退出，不在写入时才失败
+    check_partitioning_support(clients.qdrant_client, settings.QDRANT_PARTITIONING)
+    # 为已有 collection 补建 payload 索引（旧版本创建的 collection 没有索引）
+    try:
+        created = clients.vector_store.ensure_payload_indexes()
+        if created:
+            logger.info(f"Created payload indexes: {created}")
+    except Exception:
+        logger.exception("Failed to ensure payload indexes")
+    # 每个线程独立领取任务，批量上传的多个文件可并行处理
+    threads = [
+        threading.Thread(target=_loop, name=f"ingestion-{i}", daemon=True)
+        for i in range(settings.INGESTION_WORKER_CONCURRENCY)
+    ]
+    if settings.PURGE_SWEEP_INTERVAL_SECONDS > 0:
+        threads.append(threading.Thread(target=_sweep_loop, name="purge-sweep", daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    finally:
+        shutdown_extract_pool()
+        clients.close()
+    logger.info("Ingestion worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+按 kb_id 过滤检索的基准：没有 payload 索引 vs 有 payload 索引
+
+需要运行中的 Qdrant 服务（本地模式不支持 payload 索引），会创建并在结束时删除一个临时 collection。
+用法（在 backend 目录下）:
+    python scripts/benchmark_payload_index.py [--url http://localhost:6333] [--points 1000000] [--kbs 1000]
+                                             [--dims 1024] [--queries 200]
+
+写入 --points 个随机向量，平均分到 --kbs 个知识库，分别在建索引前后执行 --queries 次按 kb_id 过滤的检索，
+输出 p50/p95/p99 延迟以及一次按 doc_id 过滤删除的耗时。
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from app.core.config import settings
+from app.service.qdrant_util import QdrantVectorStore
+
+
+def _load(client: QdrantClient, collection: str, args, kb_ids, rng) -> None:
+    start = time.perf_counter()
+    batch = 1000
+    for offset in range(0, args.points, batch):
+        n = min(batch, args.points - offset)
+        vectors = rng.standard_normal((n, args.dims), dtype=np.float32)
+        client.upsert(
+            collection_name=collection,
+            points=[
+                PointStruct(
+                    id=offset + i,
+                    vector=vectors[i].tolist(),
+                    payload={
+                        "kb_id": kb_ids[(offset + i) % len(kb_ids)],
+                        # 每个文档 100 块
+                        "doc_id": f"doc-{(offset + i) // 100}",
+                        "chunk_index": (offset + i) % 100,
+                    },
+                )
+                for i in range(n)
+            ],
+            # 最后一批等待前面所有写入完成
+            wait=offset + n >= args.points,
+        )
+    print(f"loaded {args.points} points in {time.perf_counter() - start:.1f}s")
+
+
+def _measure(store: QdrantVectorStore, args, kb_ids, rng) -> str:
+    latencies = []
+    for i in range(args.queries):
+        query = rng.standard_normal(args.dims, dtype=np.float32).tolist()
+        start = time.perf_counter()
+        store.search_similar(query, kb_id=kb_ids[i % len(kb_ids)], limit=5, score_threshold=0.0)
+        latencies.append(time.perf_counter() - start)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    return f"p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+
+
+def _wait_green(client: QdrantClient, collection: str) -> None:
+    # 建索引在后台进行，等 collection 恢复 green
+    while client.get_collection(collection).status != "green":
+        time.sleep(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=settings.QDRANT_URL)
+    parser.add_argument("--api-key", default=settings.QDRANT_API_KEY)
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--kbs", type=int, default=1000)
+    parser.add_argument("--dims", type=int, default=settings.EMBEDDING_DIMENSIONS)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=args.api_key, timeout=600)
+    collection = f"benchmark_payload_index_{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(0)
+    kb_ids = [str(uuid.uuid4()) for _ in range(args.kbs)]
+    # 直接建 collection，不经过 _ensure_collection（否则会自动创建索引）
+    client.create_collection(collection, vectors_config=VectorParams(size=args.dims, distance=Distance.COSINE))
+    try:
+        _load(client, collection, args, kb_ids, rng)
+        _wait_green(client, collection)
+        store = QdrantVectorStore(client, collection)
+        print(f"without payload indexes: {_measure(store, args, kb_ids, rng)}")
+
+        start = time.perf_counter()
+        print(f"created payload indexes: {store.ensure_payload_indexes()}")
+        _wait_green(client, collection)
+        print(f"index build took {time.perf_counter() - start:.1f}s")
+        print(f"with payload indexes:    {_measure(store, args, kb_ids, rng)}")
+
+        start = time.perf_counter()
+        store.delete_document("doc-0")
+        print(f"delete by doc_id filter: {(time.perf_counter() - start) * 1e3:.2f}ms")
+    finally:
+        client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
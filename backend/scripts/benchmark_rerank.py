@@ -0,0 +1,77 @@
+"""
+search_similar 本地重排基准：逐条 float64 cosine 循环 vs float32 矩阵-向量乘法 + argpartition
+
+用法（在 backend 目录下）:
+    python scripts/benchmark_rerank.py [--dims 1024] [--candidates 20,50,100,200,500] [--limit 5]
+
+输出每种候选数下两种实现的单次耗时与耗时比（端到端，以及只看打分部分），并校验两者返回的 top-k 一致。
+
+结论：只看打分部分矩阵乘法明显更快，但端到端只有约 1.1-1.3 倍，不算有意义的提速。
+端到端耗时主要花在把 JSON 解析出的 Python list 转换为数组上，这部分与拉回的向量数据量成正比，
+两种实现都省不掉；要减少重排耗时应避免拉回向量（rescore=False，直接使用服务端得分）。
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.service.qdrant_util import QdrantVectorStore
+
+# 不按阈值过滤，与逐条实现一样取 top-N
+NO_THRESHOLD = float("-inf")
+
+
+def _loop_rerank(query_embedding, search_results, limit):
+    """重构前的实现：每个候选构造 float64 数组并单独计算 cosine（每次都重新计算 query 范数）"""
+    candidates = []
+    q_vec = np.array(query_embedding, dtype=float)
+    for r in search_results:
+        vec = np.array(r.vector, dtype=float)
+        candidates.append({"id": str(r.id), "score": QdrantVectorStore._cosine_sim(q_vec, vec)})
+    candidates = sorted(candidates, key=lambda x: x["score"], reverse=True)
+    return candidates[:limit]
+
+
+def _timeit(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--candidates", default="20,50,100,200,500")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = QdrantVectorStore(client=None, collection_name="benchmark")
+    query = rng.standard_normal(args.dims).tolist()
+    print(f"dims={args.dims} limit={args.limit}")
+    for n in [int(c) for c in args.candidates.split(",")]:
+        # 与 qdrant-client 返回结果一致：vector 为 Python list
+        results = [SimpleNamespace(id=i, vector=rng.standard_normal(args.dims).tolist(), payload={})
+                   for i in range(n)]
+        loop_top = [c["id"] for c in _loop_rerank(query, results, args.limit)]
+        vector_top = [c["id"] for c in store._rerank(query, results, args.limit, NO_THRESHOLD)]
+        assert loop_top == vector_top, (loop_top, vector_top)
+        loop_seconds = _timeit(lambda results=results: _loop_rerank(query, results, args.limit), args.repeat)
+        vector_seconds = _timeit(lambda results=results: store._rerank(query, results, args.limit, NO_THRESHOLD), args.repeat)
+        # 只看打分部分（候选向量已转换为数组）：逐条 cosine vs 一次矩阵-向量乘法
+        q_vec = np.array(query, dtype=float)
+        rows = [np.array(r.vector, dtype=float) for r in results]
+        matrix = np.asarray(rows, dtype=np.float32)
+        loop_kernel = _timeit(lambda q_vec=q_vec, rows=rows: [QdrantVectorStore._cosine_sim(q_vec, row) for row in rows],
+                              args.repeat)
+        vector_kernel = _timeit(lambda matrix=matrix: store._cosine_scores(query, matrix), args.repeat)
+        print(f"candidates={n:<5} end-to-end loop={loop_seconds * 1e3:7.3f}ms vectorized={vector_seconds * 1e3:7.3f}ms "
+              f"({loop_seconds / vector_seconds:4.1f}x) | scoring loop={loop_kernel * 1e3:6.3f}ms "
+              f"vectorized={vector_kernel * 1e3:6.3f}ms ({loop_kernel / vector_kernel:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()